@@ -25,6 +25,12 @@ document.addEventListener('DOMContentLoaded', () => {
     // 動態路線名稱列表 - 將從資料夾結構讀取
     let routeNames = [];
 
+    // 路線 API 服務器位址
+    const API_BASE = 'http://localhost:5000';
+
+    // 目前路線的資料包（A/B 路線、通訊點與切分段資訊），切換 A/B 時不需重新下載
+    let routeBundle = null;
+
     // 全域變數：當前路線資料
     let currentRouteData = {
         routeA: { points: [], metadata: {} },
@@ -307,6 +313,11 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // 新增：檢查路線檔案是否存在
     async function checkRouteFileExists(routeName) {
+        // 路線資料包可用時直接取得資料，之後載入不需再發送請求
+        if (await fetchRouteBundle(routeName)) {
+            return true;
+        }
+
         // 使用 encodeURIComponent 確保中文路徑正確編碼
         const encodedRouteName = encodeURIComponent(routeName);
         // 使用絕對路徑，從伺服器根目錄開始
@@ -388,6 +399,52 @@ document.addEventListener('DOMContentLoaded', () => {
         await loadRouteData();
     });
 
+    // 讀取路線資料包：一次取得 A/B 路線與切分段資訊（gzip + ETag 快取），API 不可用時回傳 null
+    async function fetchRouteBundle(routeName) {
+        if (routeBundle && routeBundle.route_name === routeName) {
+            return routeBundle;
+        }
+        try {
+            const response = await fetch(`${API_BASE}/api/route-bundle/${encodeURIComponent(routeName)}`);
+            if (response.ok) {
+                routeBundle = await response.json();
+                return routeBundle;
+            }
+        } catch (error) {
+            console.log('路線資料包 API 不可用，改讀個別檔案:', error);
+        }
+        return null;
+    }
+
+    // 讀取路線 GeoJSON 物件：優先使用路線資料包，其次為單一路線 API 與靜態檔案
+    async function loadRouteGeojson(routePath, routeName) {
+        const bundle = await fetchRouteBundle(routeName);
+        if (bundle && bundle[routePath]) {
+            // 編輯會直接修改點位物件，複製一份以保留資料包內容
+            return structuredClone(bundle[routePath]);
+        }
+        const response = await fetchRouteGeojson(routePath, routeName);
+        if (!response.ok) {
+            const encodedRouteName = encodeURIComponent(routeName);
+            throw new Error(`找不到路線檔案: /data_work/${routePath}/${encodedRouteName}/route.geojson`);
+        }
+        return response.json();
+    }
+
+    // 讀取路線 GeoJSON：優先使用 API（gzip + ETag 快取），失敗時改讀靜態檔案
+    async function fetchRouteGeojson(routePath, routeName) {
+        const encodedRouteName = encodeURIComponent(routeName);
+        try {
+            const apiResponse = await fetch(`${API_BASE}/api/route-data/${encodedRouteName}/${routePath}`);
+            if (apiResponse.ok) {
+                return apiResponse;
+            }
+        } catch (error) {
+            console.log('路線資料 API 不可用，改讀靜態檔案:', error);
+        }
+        return fetch(`/data_work/${routePath}/${encodedRouteName}/route.geojson`);
+    }
+
     async function loadRouteData() {
         if (!currentRouteName) return;
 
@@ -397,18 +454,7 @@ document.addEventListener('DOMContentLoaded', () => {
         pointFeatures = [];
         selectedPoints.clear();
 
-        // 使用 encodeURIComponent 確保中文路徑正確編碼
-        const encodedRouteName = encodeURIComponent(currentRouteName);
-        // 使用絕對路徑，從伺服器根目錄開始
-        const geojsonPath = `/data_work/${currentRoutePath}/${encodedRouteName}/route.geojson`;
-
-        fetch(geojsonPath)
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error(`找不到路線檔案: ${geojsonPath}`);
-                }
-                return response.json();
-            })
+        loadRouteGeojson(currentRoutePath, currentRouteName)
             .then(async data => {
                 geojsonData = data;
 
@@ -466,7 +512,14 @@ document.addEventListener('DOMContentLoaded', () => {
         console.log(`背景路線完整路徑: ${backgroundGeojsonPath}`);
 
         try {
-            const response = await fetch(backgroundGeojsonPath);
+            const bundle = await fetchRouteBundle(currentRouteName);
+            if (bundle && bundle[backgroundRoutePath]) {
+                backgroundGeojsonData = bundle[backgroundRoutePath];
+                console.log('背景路線由路線資料包載入:', backgroundRoutePath, currentRouteName);
+                return;
+            }
+
+            const response = await fetchRouteGeojson(backgroundRoutePath, currentRouteName);
             console.log(`背景路線 HTTP 回應: ${response.status} ${response.statusText}`);
 
             if (response.ok) {
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量建置紀錄
+為每個階段、每條路線的產出記錄輸入檔案的雜湊與程式版本，
+重新建置時只重跑輸入、程式或輸出有變動的部分（見 pipeline.py --incremental）。
+
+相依關係（以單一路線 r 為例）：
+  qa(r)        data_raw/gpx/r.gpx → qa_report.csv 中 r 的列
+  process(r)   data_raw/gpx/r.gpx、data_raw/txt/r.txt → data_work/route_a|route_b/r
+  split(r)     已改好的txt_geojson/r、data_raw/txt/r.txt → 最終json_txt/*/r
+               （dem、simplify 只在記憶體中交給 split，其設定併入 split 的程式版本）
+  features(r)  最終json_txt/1.切分過的路線/r → feature_report.csv 中 r 的列
+  poi          feature_report.csv、FINAL_POI.csv → feature_report_final.csv
+  gpx(r)       已改好的txt_geojson/r/route.geojson → 修改好的gpx/r.gpx
+
+data_work → 已改好的txt_geojson 是人工編輯，不會自動重建。
+紀錄存於 <base_dir>/.pipeline_build/manifest.json。
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from geojson_layout import existing_geojson, list_geojson
+from route_store import atomic_write_text
+
+SCRIPTS_DIR = Path(__file__).parent
+
+# 影響各階段產出的程式檔案
+STAGE_CODE = {
+    "qa": ["route_qa.py", "geodesy.py", "geojson_layout.py"],
+    "process": ["pt_process.py", "geodesy.py", "geojson_layout.py", "points_table.py", "map_match.py"],
+    "split": ["route_splitter.py", "geodesy.py", "geojson_layout.py", "points_table.py", "simplify.py", "dem.py", "map_match.py", "pace.py"],
+    "features": ["feature.py", "geodesy.py", "geojson_layout.py"],
+    "poi": ["../simple_update_all.py"],
+    "gpx": ["geojson_to_gpx.py", "geodesy.py", "geojson_layout.py", "pace.py"],
+}
+
+# 影響產出的環境變數
+CONFIG_ENV = ("GPX_TOOL_GEOJSON_LAYOUT", "GPX_TOOL_OUTPUT_PROFILE")
+
+# 不分路線的階段，以此鍵記錄
+GLOBAL_KEY = "*"
+
+
+def code_version(stage: str, options=None) -> str:
+    """階段程式與輸出設定的雜湊；options 為影響產出的命令列設定（沒有時不計入）"""
+    digest = hashlib.sha256()
+    for name in STAGE_CODE[stage]:
+        digest.update(name.encode("utf-8"))
+        digest.update((SCRIPTS_DIR / name).read_bytes())
+    for name in CONFIG_ENV:
+        digest.update(f"{name}={os.environ.get(name, '')}".encode("utf-8"))
+    if options:
+        digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class BuildGraph:
+    """
+    產出與輸入的對應紀錄。
+
+    base_dir: 專案資料根目錄
+    options: {階段: 影響該階段產出的命令列設定}
+    """
+
+    def __init__(self, base_dir, options=None):
+        self.base_dir = Path(base_dir)
+        self.options = options or {}
+        self.manifest_path = self.base_dir / ".pipeline_build" / "manifest.json"
+        self._file_cache = {}
+        self._records = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self._file_cache = manifest.get("files", {})
+            self._records = manifest.get("stages", {})
+        self._code = {}
+
+    def save(self) -> None:
+        manifest = {"files": self._file_cache, "stages": self._records}
+        atomic_write_text(self.manifest_path, json.dumps(manifest, ensure_ascii=False, indent=1))
+
+    def _relative(self, path: Path) -> str:
+        return Path(path).relative_to(self.base_dir).as_posix()
+
+    def file_hash(self, path: Path):
+        """檔案內容雜湊；mtime 與大小不變時沿用上次的結果。檔案不存在時回傳 None"""
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        key = self._relative(path)
+        cached = self._file_cache.get(key)
+        if cached and cached["mtime_ns"] == stat.st_mtime_ns and cached["size"] == stat.st_size:
+            return cached["sha256"]
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        self._file_cache[key] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}
+        return digest
+
+    def code(self, stage: str) -> str:
+        if stage not in self._code:
+            self._code[stage] = code_version(stage, self.options.get(stage))
+        return self._code[stage]
+
+    # ---------- 各階段的路線、輸入與輸出 ----------
+
+    def routes(self, stage: str) -> list:
+        """階段要處理的路線（依來源資料夾）"""
+        if stage in ("qa", "process"):
+            folder = self.base_dir / "data_raw" / "gpx"
+            return sorted(path.stem for path in folder.glob("*.gpx")) if folder.is_dir() else []
+        if stage == "features":
+            folder = self.base_dir / "最終json_txt" / "1.切分過的路線"
+        elif stage in ("split", "gpx"):
+            folder = self.base_dir / "已改好的txt_geojson"
+        else:
+            return [GLOBAL_KEY]
+        return sorted(path.name for path in folder.iterdir() if path.is_dir()) if folder.is_dir() else []
+
+    def inputs(self, stage: str, route: str) -> list:
+        base = self.base_dir
+        source_geojson = base / "已改好的txt_geojson" / route / "route.geojson"
+        if stage == "qa":
+            return [base / "data_raw" / "gpx" / f"{route}.gpx"]
+        if stage == "process":
+            return [base / "data_raw" / "gpx" / f"{route}.gpx", base / "data_raw" / "txt" / f"{route}.txt"]
+        if stage == "split":
+            return [
+                base / "已改好的txt_geojson" / route / "points.txt",
+                existing_geojson(source_geojson) or source_geojson,
+                base / "data_raw" / "txt" / f"{route}.txt",
+            ]
+        if stage == "features":
+            return list_geojson(base / "最終json_txt" / "1.切分過的路線" / route)
+        if stage == "poi":
+            return [base / "feature_report.csv", base / "FINAL_POI.csv"]
+        if stage == "gpx":
+            return [existing_geojson(source_geojson) or source_geojson]
+        raise ValueError(f"未知的階段: {stage}")
+
+    def outputs(self, stage: str, route: str) -> list:
+        """階段實際產生的檔案（建置後記錄，用於判斷輸出是否遺失）"""
+        base = self.base_dir
+        if stage == "qa":
+            return [base / "qa_report.csv"]
+        if stage == "process":
+            folders = [base / "data_work" / side / route for side in ("route_a", "route_b")]
+        elif stage == "split":
+            folders = [
+                base / "最終json_txt" / name / route
+                for name in ("1.切分過的路線", "2.往前重複的geojson", "3.往前重複的txt")
+            ]
+        elif stage == "features":
+            return [base / "feature_report.csv"]
+        elif stage == "poi":
+            return [base / "feature_report_final.csv"]
+        else:
+            return [base / "修改好的gpx" / f"{route}.gpx"]
+        return sorted(path for folder in folders if folder.is_dir() for path in folder.iterdir() if path.is_file())
+
+    def _input_hashes(self, stage: str, route: str) -> dict:
+        return {self._relative(path): self.file_hash(path) for path in self.inputs(stage, route)}
+
+    # ---------- 判斷與記錄 ----------
+
+    def stale_reason(self, stage: str, route: str):
+        """需要重建時回傳原因，已是最新時回傳 None"""
+        record = self._records.get(stage, {}).get(route)
+        if record is None:
+            return "尚未建置"
+        if record["code"] != self.code(stage):
+            return "程式或輸出設定變更"
+        if record["inputs"] != self._input_hashes(stage, route):
+            return "輸入變更"
+        if not record["outputs"] or not all((self.base_dir / path).exists() for path in record["outputs"]):
+            return "輸出遺失"
+        return None
+
+    def record(self, stage: str, route: str) -> None:
+        """記錄剛建置完成的產出"""
+        self._records.setdefault(stage, {})[route] = {
+            "code": self.code(stage),
+            "inputs": self._input_hashes(stage, route),
+            "outputs": [self._relative(path) for path in self.outputs(stage, route)],
+            "built_at": time.time(),
+        }
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+離線 DEM 高程取樣
+讀取本機的數值地形模型，以雙線性內插一次取得所有軌跡點的地面高程，
+用來修正 GPS 海拔（見 pipeline.py --dem）。不需要 GDAL，只用 NumPy：
+
+  GeoTIFF        分塊（tiled）或分條（striped）；未壓縮或 Deflate 壓縮，predictor 1/2/3；
+                 整數或浮點、單一波段；支援 BigTIFF
+  ESRI 原始格網  .flt / .bil / .bin，搭配同名 .hdr（ncols、nrows、cellsize、xllcorner…）
+
+座標系統：WGS84 經緯度（EPSG:4326）、TWD97 TM2（EPSG:3826、3825）、UTM（EPSG:326xx、327xx）。
+GeoTIFF 由 GeoKey 判斷；原始格網沒有座標資訊，預設為經緯度，可用 crs 參數指定。
+
+檔案以 memory-map 開啟，只讀取用到的區塊；壓縮的區塊解壓後保留在 LRU 快取中。
+nodata 與範圍外的點回傳 NaN。
+
+    python dem.py ../dem/taiwan_20m.tif mt_jade_main   # 比較路線的 GPS 海拔與 DEM
+    python dem.py ../dem/taiwan_20m.tif --bench 5000000
+"""
+
+import argparse
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from geodesy import GRS80, WGS84, transverse_mercator
+
+# 預設快取的解壓區塊數（256×256 float32 區塊約 256 KB）
+DEFAULT_CACHE_TILES = 256
+
+# TIFF 標籤
+TAG_WIDTH = 256
+TAG_HEIGHT = 257
+TAG_BITS_PER_SAMPLE = 258
+TAG_COMPRESSION = 259
+TAG_STRIP_OFFSETS = 273
+TAG_SAMPLES_PER_PIXEL = 277
+TAG_ROWS_PER_STRIP = 278
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_PREDICTOR = 317
+TAG_TILE_WIDTH = 322
+TAG_TILE_LENGTH = 323
+TAG_TILE_OFFSETS = 324
+TAG_TILE_BYTE_COUNTS = 325
+TAG_SAMPLE_FORMAT = 339
+TAG_PIXEL_SCALE = 33550
+TAG_TIEPOINT = 33922
+TAG_GEOKEYS = 34735
+TAG_GDAL_NODATA = 42113
+
+# TIFF 欄位型別 → (struct 格式, 位元組數)
+TIFF_TYPES = {
+    1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1), 7: ("B", 1),
+    8: ("h", 2), 9: ("i", 4), 10: ("ii", 8), 11: ("f", 4), 12: ("d", 8), 16: ("Q", 8), 17: ("q", 8),
+}
+
+COMPRESSION_NONE = 1
+COMPRESSION_DEFLATE = (8, 32946)
+
+# SampleFormat → NumPy 型別字元
+SAMPLE_KINDS = {1: "u", 2: "i", 3: "f"}
+
+
+def projection(epsg: int):
+    """EPSG 代碼 → 經緯度轉柵格座標的函式 (lons, lats) → (x, y)"""
+    if epsg == 4326:
+        return lambda lons, lats: (np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+    if epsg in (3826, 3825):
+        # TWD97 TM2：臺灣本島 121°E、澎湖金馬 119°E
+        lon0 = 121 if epsg == 3826 else 119
+        return lambda lons, lats: transverse_mercator(lons, lats, lon0, 0.9999, 250000.0, 0.0, GRS80)
+    if 32601 <= epsg <= 32660 or 32701 <= epsg <= 32760:
+        zone = epsg % 100
+        false_northing = 10000000.0 if epsg > 32700 else 0.0
+        return lambda lons, lats: transverse_mercator(
+            lons, lats, -183 + 6 * zone, 0.9996, 500000.0, false_northing, WGS84
+        )
+    raise ValueError(f"不支援的座標系統 EPSG:{epsg}")
+
+
+class TileCache:
+    """以 OrderedDict 實作的 LRU 快取"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        if key in self._items:
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+        self.misses += 1
+        value = load(key)
+        self._items[key] = value
+        if len(self._items) > self.capacity:
+            self._items.popitem(last=False)
+        return value
+
+
+def _read_ifd(mapped: np.memmap) -> dict:
+    """讀取 TIFF（或 BigTIFF）第一個 IFD，回傳 {標籤: 值的 tuple（ASCII 為 str）}"""
+    order = bytes(mapped[:2])
+    if order not in (b"II", b"MM"):
+        raise ValueError("不是 TIFF 檔案")
+    endian = "<" if order == b"II" else ">"
+    (version,) = struct.unpack(endian + "H", bytes(mapped[2:4]))
+    if version == 42:
+        offset_format, count_format, entry_size = "I", "H", 12
+        (ifd_offset,) = struct.unpack(endian + "I", bytes(mapped[4:8]))
+    elif version == 43:
+        offset_format, count_format, entry_size = "Q", "Q", 20
+        (ifd_offset,) = struct.unpack(endian + "Q", bytes(mapped[8:16]))
+    else:
+        raise ValueError(f"不支援的 TIFF 版本: {version}")
+    # 每筆項目：標籤、型別（各 2 bytes）、數量與值（或值的位移），數量與值的寬度同 offset_format
+    inline_size = entry_size - 4 - struct.calcsize(offset_format)
+
+    count_size = struct.calcsize(count_format)
+    (entries,) = struct.unpack(endian + count_format, bytes(mapped[ifd_offset:ifd_offset + count_size]))
+    tags = {}
+    position = ifd_offset + count_size
+    for _ in range(entries):
+        entry = bytes(mapped[position:position + entry_size])
+        position += entry_size
+        tag, kind = struct.unpack(endian + "HH", entry[:4])
+        (count,) = struct.unpack(endian + offset_format, entry[4:4 + struct.calcsize(offset_format)])
+        if kind not in TIFF_TYPES:
+            continue
+        value_format, size = TIFF_TYPES[kind]
+        total = size * count
+        if total <= inline_size:
+            data = entry[entry_size - inline_size:entry_size - inline_size + total]
+        else:
+            (data_offset,) = struct.unpack(endian + offset_format, entry[entry_size - inline_size:])
+            data = bytes(mapped[data_offset:data_offset + total])
+        if kind == 2:
+            tags[tag] = data.rstrip(b"\0").decode("ascii", "replace")
+        else:
+            tags[tag] = struct.unpack(endian + value_format[0] * (count * len(value_format)), data)
+    return tags
+
+
+def _geokeys(values) -> dict:
+    """GeoKeyDirectory → {key: value}（只取直接存放的 SHORT 值）"""
+    keys = {}
+    if not values:
+        return keys
+    for i in range(values[3]):
+        key, location, _, value = values[4 + 4 * i:8 + 4 * i]
+        if location == 0:
+            keys[key] = value
+    return keys
+
+
+class DemRaster:
+    """
+    本機 DEM 柵格（見模組說明的支援格式）。
+
+    path: DEM 檔案
+    crs: 柵格的 EPSG 代碼；None 時由 GeoTIFF 的 GeoKey 判斷，原始格網預設 4326
+    cache_tiles: 壓縮區塊的 LRU 快取數量
+    """
+
+    def __init__(self, path, crs=None, cache_tiles=DEFAULT_CACHE_TILES):
+        self.path = Path(path)
+        self.cache = TileCache(cache_tiles)
+        self._mapped = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self._grid = None  # 原始格網的整張映射
+        self.compression = COMPRESSION_NONE
+        self.predictor = 1
+        if bytes(self._mapped[:2]) in (b"II", b"MM"):
+            epsg = self._open_tiff()
+        else:
+            epsg = self._open_raw_grid()
+        self.crs = crs or epsg or 4326
+        self._project = projection(self.crs)
+
+    # ---------- 開啟 ----------
+
+    def _open_tiff(self):
+        tags = _read_ifd(self._mapped)
+        endian = "<" if bytes(self._mapped[:2]) == b"II" else ">"
+        if tags.get(TAG_SAMPLES_PER_PIXEL, (1,))[0] != 1:
+            raise ValueError("只支援單一波段的 GeoTIFF")
+        self.width = tags[TAG_WIDTH][0]
+        self.height = tags[TAG_HEIGHT][0]
+        bits = tags.get(TAG_BITS_PER_SAMPLE, (8,))[0]
+        kind = SAMPLE_KINDS.get(tags.get(TAG_SAMPLE_FORMAT, (1,))[0])
+        if kind is None or bits not in (8, 16, 32, 64):
+            raise ValueError(f"不支援的像素格式: {bits} 位元")
+        self.dtype = np.dtype(f"{endian}{kind}{bits // 8}")
+
+        self.compression = tags.get(TAG_COMPRESSION, (COMPRESSION_NONE,))[0]
+        if self.compression != COMPRESSION_NONE and self.compression not in COMPRESSION_DEFLATE:
+            raise ValueError(
+                f"不支援的壓縮方式 {self.compression}，請先轉為 Deflate 或未壓縮"
+                "（例如 gdal_translate -co COMPRESS=DEFLATE -co TILED=YES）"
+            )
+        self.predictor = tags.get(TAG_PREDICTOR, (1,))[0]
+        if self.predictor not in (1, 2, 3):
+            raise ValueError(f"不支援的 predictor: {self.predictor}")
+
+        if TAG_TILE_OFFSETS in tags:
+            self.tile_shape = (tags[TAG_TILE_LENGTH][0], tags[TAG_TILE_WIDTH][0])
+            self._offsets = tags[TAG_TILE_OFFSETS]
+            self._byte_counts = tags[TAG_TILE_BYTE_COUNTS]
+        else:
+            # 分條儲存視為寬度等於影像寬度的區塊
+            rows_per_strip = min(tags.get(TAG_ROWS_PER_STRIP, (self.height,))[0], self.height)
+            self.tile_shape = (rows_per_strip, self.width)
+            self._offsets = tags[TAG_STRIP_OFFSETS]
+            self._byte_counts = tags[TAG_STRIP_BYTE_COUNTS]
+        self.tiles_across = -(-self.width // self.tile_shape[1])
+
+        nodata = tags.get(TAG_GDAL_NODATA)
+        self.nodata = float(nodata) if nodata not in (None, "") and nodata.lower() != "nan" else None
+
+        if TAG_PIXEL_SCALE not in tags or TAG_TIEPOINT not in tags:
+            raise ValueError("GeoTIFF 缺少 ModelPixelScale 或 ModelTiepoint，無法定位")
+        scale_x, scale_y = tags[TAG_PIXEL_SCALE][:2]
+        i, j, _, x, y, _ = tags[TAG_TIEPOINT][:6]
+        keys = _geokeys(tags.get(TAG_GEOKEYS))
+        # PixelIsArea（預設）時 tiepoint 是像素左上角，換算為像素中心
+        center = 0.5 if keys.get(1025, 1) == 1 else 0.0
+        self.origin = (x + (center - i) * scale_x, y - (center - j) * scale_y)
+        self.cell = (scale_x, scale_y)
+        return keys.get(3072) or (4326 if keys.get(1024) == 2 else None)
+
+    def _open_raw_grid(self):
+        header_path = self.path.with_suffix(".hdr")
+        if not header_path.exists():
+            raise ValueError(f"無法辨識的 DEM 格式（找不到 {header_path.name}）: {self.path}")
+        header = {}
+        with open(header_path, "r", encoding="ascii", errors="replace") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2:
+                    header[parts[0].lower()] = parts[1]
+
+        self.width = int(header["ncols"])
+        self.height = int(header["nrows"])
+        cell_x = float(header.get("xdim", header.get("cellsize", 0)))
+        cell_y = float(header.get("ydim", header.get("cellsize", 0)))
+        if cell_x <= 0 or cell_y <= 0:
+            raise ValueError(f"{header_path.name} 缺少 cellsize")
+
+        # 左上像素中心的座標
+        if "ulxmap" in header:
+            origin_x, origin_y = float(header["ulxmap"]), float(header["ulymap"])
+        else:
+            corner = "xllcorner" in header
+            x = float(header["xllcorner" if corner else "xllcenter"])
+            y = float(header["yllcorner" if corner else "yllcenter"])
+            offset = 0.5 if corner else 0.0
+            origin_x = x + offset * cell_x
+            origin_y = y + offset * cell_y + (self.height - 1) * cell_y
+
+        byte_order = header.get("byteorder", "lsbfirst").lower()
+        endian = ">" if byte_order in ("msbfirst", "m") else "<"
+        is_float = self.path.suffix.lower() == ".flt" or header.get("pixeltype", "").lower() == "float"
+        bits = int(header.get("nbits", 32 if is_float else 16))
+        kind = "f" if is_float else ("u" if header.get("pixeltype", "").lower() == "unsignedint" else "i")
+        self.dtype = np.dtype(f"{endian}{kind}{bits // 8}")
+        if self._mapped.size < self.width * self.height * self.dtype.itemsize:
+            raise ValueError(f"{self.path.name} 的大小與 {header_path.name} 不符")
+
+        nodata = header.get("nodata_value", header.get("nodata"))
+        self.nodata = float(nodata) if nodata is not None else None
+        self.origin = (origin_x, origin_y)
+        self.cell = (cell_x, cell_y)
+        # 整個格網是一個不需解壓的區塊
+        self.tile_shape = (self.height, self.width)
+        self.tiles_across = 1
+        self._grid = self._mapped[: self.width * self.height * self.dtype.itemsize].view(self.dtype)
+        self._grid = self._grid.reshape(self.height, self.width)
+        return None
+
+    # ---------- 區塊 ----------
+
+    def _decode_tile(self, index: int) -> np.ndarray:
+        tile_width = self.tile_shape[1]
+        offset, count = self._offsets[index], self._byte_counts[index]
+        data = self._mapped[offset:offset + count]
+        if self.compression != COMPRESSION_NONE:
+            data = np.frombuffer(zlib.decompress(bytes(data)), dtype=np.uint8)
+
+        if self.predictor == 3:
+            # 浮點 predictor：每列先做位元組差分，再把依位元組重要性分組的資料還原
+            size = self.dtype.itemsize
+            rows = data[: data.size // (tile_width * size) * tile_width * size].reshape(-1, tile_width * size)
+            rows = np.cumsum(rows, axis=1, dtype=np.uint8)
+            tile = rows.reshape(-1, size, tile_width).transpose(0, 2, 1).copy()
+            tile = tile.view(self.dtype.newbyteorder(">")).reshape(-1, tile_width)
+        else:
+            usable = data.size // (tile_width * self.dtype.itemsize) * tile_width * self.dtype.itemsize
+            tile = data[:usable].view(self.dtype).reshape(-1, tile_width)
+            if self.predictor == 2:
+                tile = np.cumsum(tile, axis=1, dtype=self.dtype)
+        return tile
+
+    def tile(self, index: int) -> np.ndarray:
+        """第 index 個區塊的像素（未壓縮時直接映射，不經快取）"""
+        if self._grid is not None:
+            return self._grid
+        if self.compression == COMPRESSION_NONE and self.predictor == 1:
+            return self._decode_tile(index)
+        return self.cache.get(index, self._decode_tile)
+
+    def read_pixels(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """像素值（float64，nodata 為 NaN）；rows、cols 必須在範圍內"""
+        if self._grid is not None:
+            values = self._grid[rows, cols].astype(float)
+        else:
+            values = np.empty(len(rows), dtype=float)
+            tile_height, tile_width = self.tile_shape
+            tile_ids = (rows // tile_height) * self.tiles_across + cols // tile_width
+            tile_count = self.tiles_across * -(-self.height // tile_height)
+            if tile_count <= np.iinfo(np.uint16).max:
+                # 16 位元整數的穩定排序使用 radix sort，比 int64 快數倍
+                tile_ids = tile_ids.astype(np.uint16)
+            order = np.argsort(tile_ids, kind="stable")
+            ends = np.cumsum(np.bincount(tile_ids, minlength=tile_count))
+            start = 0
+            for tile_id in np.flatnonzero(np.diff(ends, prepend=0)).tolist():
+                selected = order[start:ends[tile_id]]
+                start = ends[tile_id]
+                tile = self.tile(tile_id)
+                values[selected] = tile[rows[selected] % tile_height, cols[selected] % tile_width]
+
+        if self.nodata is not None:
+            values[values == self.nodata] = np.nan
+        return values
+
+    # ---------- 取樣 ----------
+
+    def sample(self, lons, lats) -> np.ndarray:
+        """經緯度（度）的地面高程，雙線性內插；範圍外與 nodata 為 NaN"""
+        return self.sample_xy(*self._project(lons, lats))
+
+    def sample_xy(self, x, y) -> np.ndarray:
+        """柵格座標系統中的座標的地面高程（見 sample）"""
+        col = (np.asarray(x, dtype=float) - self.origin[0]) / self.cell[0]
+        row = (self.origin[1] - np.asarray(y, dtype=float)) / self.cell[1]
+        result = np.full(col.shape, np.nan)
+
+        # 像素外緣（距最外側像素中心半格）內都算在範圍內
+        inside = (col >= -0.5) & (col <= self.width - 0.5) & (row >= -0.5) & (row <= self.height - 0.5)
+        if not inside.any():
+            return result
+        col = col[inside]
+        row = row[inside]
+        col0 = np.clip(np.floor(col).astype(np.int64), 0, max(self.width - 2, 0))
+        row0 = np.clip(np.floor(row).astype(np.int64), 0, max(self.height - 2, 0))
+        col1 = np.minimum(col0 + 1, self.width - 1)
+        row1 = np.minimum(row0 + 1, self.height - 1)
+        fx = np.clip(col - col0, 0.0, 1.0)
+        fy = np.clip(row - row0, 0.0, 1.0)
+
+        n = len(col)
+        corners = self.read_pixels(
+            np.concatenate([row0, row0, row1, row1]), np.concatenate([col0, col1, col0, col1])
+        ).reshape(4, n)
+        weights = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy])
+
+        # nodata 的角不參與內插，其餘權重重新正規化
+        valid = ~np.isnan(corners)
+        total = np.where(valid, weights, 0.0).sum(axis=0)
+        values = np.where(valid, corners * weights, 0.0).sum(axis=0)
+        result[inside] = np.where(total > 0, values / np.where(total > 0, total, 1.0), np.nan)
+        return result
+
+    def close(self) -> None:
+        self._grid = None
+        self._mapped = None
+
+
+def correct_elevations(elevations, dem_elevations, mode="replace", weight=1.0) -> np.ndarray:
+    """
+    以 DEM 高程修正 GPS 海拔。
+    mode: replace 直接取代；blend 以 weight（DEM 的權重 0–1）加權平均。
+    DEM 沒有值（NaN）的點保留原本的海拔。
+    """
+    elevations = np.asarray(elevations, dtype=float)
+    dem_elevations = np.asarray(dem_elevations, dtype=float)
+    if mode == "replace":
+        corrected = dem_elevations
+    elif mode == "blend":
+        corrected = np.where(
+            np.isnan(elevations), dem_elevations, weight * dem_elevations + (1 - weight) * elevations
+        )
+    else:
+        raise ValueError(f"未知的修正方式: {mode}")
+    return np.where(np.isnan(dem_elevations), elevations, corrected)
+
+
+def correct_points(df, dem: DemRaster, mode="replace", weight=1.0) -> tuple:
+    """
+    修正 points DataFrame 的 海拔（約）（回傳新的 DataFrame）與統計：
+    points、sampled（DEM 有值的點數）、mean_diff（GPS − DEM 平均）、p95_abs_diff
+    """
+    import pandas as pd
+
+    lats = pd.to_numeric(df["緯度"], errors="coerce").to_numpy(dtype=float)
+    lons = pd.to_numeric(df["經度"], errors="coerce").to_numpy(dtype=float)
+    elevations = pd.to_numeric(df["海拔（約）"], errors="coerce").to_numpy(dtype=float)
+    dem_elevations = dem.sample(lons, lats)
+
+    differences = (elevations - dem_elevations)[~np.isnan(elevations) & ~np.isnan(dem_elevations)]
+    stats = {
+        "points": len(df),
+        "sampled": int((~np.isnan(dem_elevations)).sum()),
+        "mean_diff": float(differences.mean()) if len(differences) else float("nan"),
+        "p95_abs_diff": float(np.percentile(np.abs(differences), 95)) if len(differences) else float("nan"),
+    }
+    corrected = df.copy()
+    corrected["海拔（約）"] = correct_elevations(elevations, dem_elevations, mode, weight)
+    return corrected, stats
+
+
+def benchmark(dem: DemRaster, count: int) -> None:
+    """在 DEM 範圍內隨機取樣 count 點，回報每分鐘可處理的點數"""
+    rng = np.random.default_rng(0)
+    cols = rng.uniform(0, dem.width - 1, count)
+    rows = rng.uniform(0, dem.height - 1, count)
+    x = dem.origin[0] + cols * dem.cell[0]
+    y = dem.origin[1] - rows * dem.cell[1]
+    start = time.perf_counter()
+    values = dem.sample_xy(x, y)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{count} 點耗時 {elapsed:.2f} 秒（每分鐘約 {count / elapsed * 60 / 1e6:.0f} 百萬點），"
+        f"{int(np.isnan(values).sum())} 點無值；快取命中 {dem.cache.hits}、載入 {dem.cache.misses}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以本機 DEM 比較或修正路線海拔")
+    parser.add_argument("dem", help="DEM 檔案（GeoTIFF 或 .flt/.bil + .hdr）")
+    parser.add_argument("routes", nargs="*", help="要比較的路線名稱（預設為全部）")
+    parser.add_argument("--base-dir", default=os.environ.get("GPX_TOOL_BASE_DIR", "."),
+                        help="專案資料根目錄（預設為目前目錄）")
+    parser.add_argument("--crs", type=int, help="DEM 的 EPSG 代碼（原始格網預設 4326）")
+    parser.add_argument("--bench", type=int, metavar="N", help="只測試隨機取樣 N 點的速度")
+    args = parser.parse_args()
+
+    dem = DemRaster(args.dem, crs=args.crs)
+    print(f"{dem.path.name}: {dem.width}×{dem.height}，EPSG:{dem.crs}，區塊 {dem.tile_shape[1]}×{dem.tile_shape[0]}")
+    if args.bench:
+        benchmark(dem, args.bench)
+        return
+
+    from route_splitter import read_points_file
+
+    source_dir = Path(args.base_dir) / "已改好的txt_geojson"
+    routes = args.routes or sorted(path.name for path in source_dir.iterdir() if path.is_dir())
+    print(f"{'路線':<20}{'點數':>6}{'DEM 有值':>10}{'GPS−DEM 平均':>14}{'|差| 95%':>10}")
+    for route_name in routes:
+        points_file = source_dir / route_name / "points.txt"
+        if not points_file.exists():
+            print(f"  找不到 {points_file}")
+            continue
+        _, stats = correct_points(read_points_file(points_file), dem)
+        print(
+            f"{route_name:<20}{stats['points']:>6}{stats['sampled']:>10}"
+            f"{stats['mean_diff']:>+14.1f}{stats['p95_abs_diff']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
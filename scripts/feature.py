@@ -1,31 +1,57 @@
+import argparse
 import os
-import json
-import pandas as pd
 import numpy as np
 import re
-from math import radians, sin, cos, sqrt, atan2, degrees, atan
+from datetime import datetime
+from math import degrees, atan
 
+from geodesy import chainage, consecutive_distances
+from geojson_layout import list_geojson, load_geojson, plain_path
 
-def haversine(lat1, lon1, lat2, lon2):
+# 重新取樣的預設水平間距（公尺）
+DEFAULT_RESAMPLE_STEP = 10.0
+
+
+def resample_track(lons, lats, elevations, step=DEFAULT_RESAMPLE_STEP):
     """
-    計算兩個GPS座標點之間的直線距離（公尺）。
+    依累積水平里程，以固定間距 step（公尺）線性內插經緯度與海拔。
+    起點與終點一定包含在內，最後一段可能短於 step。
+
+    回傳 {"lon", "lat", "elevation", "chainage"} 陣列
     """
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    r_earth = 6371000  # 地球半徑（公尺）
-    return c * r_earth
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    distances = chainage(lats, lons)
+    total = float(distances[-1]) if len(distances) else 0.0
+    positions = np.arange(0.0, total, step)
+    if len(distances) and (len(positions) == 0 or positions[-1] < total):
+        positions = np.append(positions, total)
+
+    resampled = {
+        "lon": np.interp(positions, distances, lons),
+        "lat": np.interp(positions, distances, lats),
+        "elevation": np.interp(positions, distances, np.asarray(elevations, dtype=float)),
+        "chainage": positions,
+    }
+    return resampled
 
 
-def calculate_features(filepath):
+def calculate_features(filepath, resample_step=None, time_features=False):
     """
     對單一GeoJSON檔案計算所有指定的特徵。
     優化計算方式以提升精確度和效率。
     """
-    with open(filepath, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    return calculate_geojson_features(load_geojson(filepath), resample_step, time_features)
+
+
+def calculate_geojson_features(data, resample_step=None, time_features=False):
+    """
+    對已讀入的 GeoJSON（舊格式）計算所有特徵。
+    resample_step 為公尺數時，坡度與海拔特徵改用固定間距重新取樣的點計算，
+    不受記錄裝置取樣頻率影響；總距離仍依原始路線計算。
+    time_features 為 True 時（pipeline --pace）加上 TIME_COLUMNS 的時間特徵。
+    """
+    import pandas as pd
 
     features = data.get("features", [])
 
@@ -58,30 +84,32 @@ def calculate_features(filepath):
         return {"錯誤": "有效的資料點少於2個，無法計算坡度等資訊"}
 
     # 2. 計算路線基本屬性 - 水平總長度
-    total_distance = 0
+    coords = np.array([p["geometry"]["coordinates"][:2] for p in points], dtype=float)
+    point_distances = consecutive_distances(coords[:, 1], coords[:, 0])
     if line_string and len(line_string) > 1:
         # 使用 LineString 計算更精確的總距離
-        for i in range(len(line_string) - 1):
-            lon1, lat1 = line_string[i]
-            lon2, lat2 = line_string[i + 1]
-            total_distance += haversine(lat1, lon1, lat2, lon2)
+        line = np.array([c[:2] for c in line_string], dtype=float)
+        total_distance = float(np.sum(consecutive_distances(line[:, 1], line[:, 0])))
     else:
         # 備用方案：使用點位計算距離
-        coords = [p["geometry"]["coordinates"] for p in points]
-        for i in range(len(coords) - 1):
-            lon1, lat1 = coords[i]
-            lon2, lat2 = coords[i + 1]
-            total_distance += haversine(lat1, lon1, lat2, lon2)
+        total_distance = float(np.sum(point_distances))
 
     # 3. 海拔相關特徵計算
     elevations = [float(p["properties"]["elevation"]) for p in points]
-    coords = [p["geometry"]["coordinates"] for p in points]
+    times = [p["properties"].get("time") for p in points]
 
     min_elevation = min(elevations)
     max_elevation = max(elevations)
     elevation_range = max_elevation - min_elevation
     high_elevation = max_elevation > 2438  # 高山症風險評估指標
 
+    if resample_step:
+        # 極值取自原始點位（內插點可能落在山頂兩側），其餘特徵改用重新取樣的點
+        resampled = resample_track(coords[:, 0], coords[:, 1], elevations, resample_step)
+        coords = np.column_stack([resampled["lon"], resampled["lat"]])
+        point_distances = np.diff(resampled["chainage"])
+        elevations = resampled["elevation"].tolist()
+
     # 4. 海拔變化與坡度計算優化
     segment_distances = []
     elevation_changes = []
@@ -97,11 +125,10 @@ def calculate_features(filepath):
         "segment_idx": 0,
     }
 
-    for i in range(len(points) - 1):
+    for i in range(len(elevations) - 1):
         # 計算段落距離
-        lon1, lat1 = coords[i]
-        lon2, lat2 = coords[i + 1]
-        segment_dist = haversine(lat1, lon1, lat2, lon2)
+        lon2, lat2 = coords[i + 1].tolist()
+        segment_dist = float(point_distances[i])
         segment_distances.append(segment_dist)
 
         # 計算海拔變化
@@ -183,7 +210,7 @@ def calculate_features(filepath):
         else "N/A"
     )
 
-    return {
+    result = {
         "distance": round(total_distance, 2),
         "elevation_range": round(elevation_range, 1),
         "elevation_change": round(elevation_change, 2),
@@ -198,11 +225,135 @@ def calculate_features(filepath):
         "slope_freq_dist": freq_dist_dict,
     }
 
+    # 9. 時間特徵（只在 --pace 時計算，且所有點都有時間；預設不改變報告欄位）
+    if time_features and all(times):
+        start, end = (datetime.fromisoformat(t.replace("Z", "+00:00")) for t in (times[0], times[-1]))
+        duration = (end - start).total_seconds()
+        result["duration_minutes"] = round(duration / 60, 1)
+        result["average_speed_kmh"] = round(total_distance / duration * 3.6, 2) if duration > 0 else None
+
+    return result
+
+
+REPORT_COLUMNS = [
+    "route_folder",
+    "part_number",
+    "filename",
+    "distance",
+    "elevation_range",
+    "elevation_change",
+    "elevation_gain",
+    "elevation_loss",
+    "high_elevation",
+    "max_slope_percent",
+    "max_slope_degrees",
+    "max_slope_point",
+    "slope_std_dev",
+    "slope_variance",
+    "slope_freq_dist",
+]
+
+# 以 --pace 合成時間時才出現的欄位
+TIME_COLUMNS = ["duration_minutes", "average_speed_kmh"]
+
+
+def extract_part_number(filename):
+    """從檔名提取 part 編號"""
+    part_match = re.search(r"part(\d+)", filename)
+    return int(part_match.group(1)) if part_match else 0
+
+
+def collect_geojson_files(target_path, route_folders=None):
+    """
+    收集切分路線資料夾中的所有 geojson 檔案，先按路線資料夾，再按 part 編號排序。
+    route_folders 為清單時只收集這些路線。
+    """
+    all_files = []
+    for route_folder in route_folders or os.listdir(target_path):
+        route_folder_path = os.path.join(target_path, route_folder)
+        if os.path.isdir(route_folder_path):
+            # .geojson.gz 也一併收集，報告中的檔名一律記為 .geojson
+            for path in list_geojson(route_folder_path):
+                file_info = {
+                    "filename": plain_path(path).name,
+                    "filepath": str(path),
+                    "route_folder": route_folder,
+                }
+                all_files.append(file_info)
+
+    return sorted(
+        all_files,
+        key=lambda f: (f["route_folder"], extract_part_number(f["filename"])),
+    )
 
-def main():
+
+def calculate_file_features(file_info, resample_step=None, time_features=False):
+    """計算單一切分檔案的特徵，並加上檔名、路線資料夾與 part 編號"""
+    features = calculate_features(file_info["filepath"], resample_step, time_features)
+    features["filename"] = file_info["filename"]
+    features["route_folder"] = file_info["route_folder"]
+    features["part_number"] = extract_part_number(file_info["filename"])
+    return features
+
+
+def build_report(results):
+    """建立並美化 DataFrame 報告"""
+    import pandas as pd
+
+    df = pd.DataFrame(results)
+
+    # 重新排列欄位順序
+    if "錯誤" not in df.columns:
+        df = df[REPORT_COLUMNS + [column for column in TIME_COLUMNS if column in df.columns]]
+
+        # 格式化浮點數顯示
+        pd.options.display.float_format = "{:.2f}".format
+        df["max_slope_point"] = df["max_slope_point"].astype(str)
+        df["slope_freq_dist"] = df["slope_freq_dist"].astype(str)
+
+    return df
+
+
+def merge_report_rows(report, new_rows, route_folders):
     """
-    主程式：尋找、處理所有GeoJSON檔案並產生報告。
+    以 new_rows 取代 report 中 route_folders 這些路線的列，依路線與 part 編號排序。
+    report 為 None 時只回傳 new_rows。
     """
+    import pandas as pd
+
+    if report is not None:
+        report = report[~report["route_folder"].isin(route_folders)]
+        report = pd.concat([report, new_rows], ignore_index=True)
+    else:
+        report = new_rows
+
+    return report.sort_values(
+        ["route_folder", "part_number"], kind="mergesort"
+    ).reset_index(drop=True)
+
+
+def update_feature_report(csv_filename, route_folder, results):
+    """
+    只更新報告中單一路線的列：移除該路線舊的列，加入新結果後依路線與 part 編號排序。
+    results 為空（路線已沒有切分段）時只移除舊的列。報告不存在時建立新檔。
+    """
+    import pandas as pd
+
+    report = None
+    if os.path.exists(csv_filename):
+        report = pd.read_csv(csv_filename, encoding="utf-8-sig")
+    if not results:
+        if report is None:
+            return None
+        report = report[report["route_folder"] != route_folder].reset_index(drop=True)
+    else:
+        report = merge_report_rows(report, build_report(results), [route_folder])
+    report.to_csv(csv_filename, index=False, encoding="utf-8-sig")
+    return report
+
+
+def find_target_path():
+    """尋找切分過的路線資料夾"""
     # 設定目標路徑
     target_path = os.path.join("..", "最終json_txt", "1.切分過的路線")
 
@@ -220,24 +371,29 @@ def main():
             if os.path.exists(abs_path):
                 target_path = abs_path
 
+    return target_path
+
+
+def main():
+    """
+    主程式：尋找、處理所有GeoJSON檔案並產生報告。
+    """
+    parser = argparse.ArgumentParser(description="計算切分路線的特徵並產生 feature_report.csv")
+    parser.add_argument("--resample", type=float, nargs="?", const=DEFAULT_RESAMPLE_STEP,
+                        help=f"以固定間距重新取樣後再計算坡度與海拔特徵（公尺，預設 {DEFAULT_RESAMPLE_STEP:g}）")
+    parser.add_argument("--time-features", action="store_true",
+                        help="加上 duration_minutes、average_speed_kmh（切分段的時間由 pipeline --pace 合成時使用）")
+    args = parser.parse_args()
+
+    target_path = find_target_path()
+
     print(f"使用路徑: {os.path.abspath(target_path)}")
 
     try:
         # 收集所有子資料夾中的 geojson 檔案
-        all_files = []
-        for route_folder in os.listdir(target_path):
-            route_folder_path = os.path.join(target_path, route_folder)
-            if os.path.isdir(route_folder_path):
-                for file in os.listdir(route_folder_path):
-                    if file.endswith(".geojson"):
-                        file_info = {
-                            "filename": file,
-                            "filepath": os.path.join(route_folder_path, file),
-                            "route_folder": route_folder,
-                        }
-                        all_files.append(file_info)
-
-        if not all_files:
+        sorted_files = collect_geojson_files(target_path)
+
+        if not sorted_files:
             raise FileNotFoundError
     except FileNotFoundError:
         print(f"錯誤：在路徑 '{target_path}' 下找不到任何 '.geojson' 檔案。")
@@ -246,62 +402,16 @@ def main():
         print(f"讀取檔案時發生錯誤：{str(e)}")
         return
 
-    def extract_sort_key(file_info):
-        """提取排序鍵值：先按路線資料夾，再按part編號"""
-        route_folder = file_info["route_folder"]
-        filename = file_info["filename"]
-
-        # 提取 part 編號
-        part_match = re.search(r"part(\d+)", filename)
-        part_number = int(part_match.group(1)) if part_match else 0
-
-        return (route_folder, part_number)
-
-    sorted_files = sorted(all_files, key=extract_sort_key)
-
     print(f"找到並依序處理以下檔案: {[f['filename'] for f in sorted_files]}")
 
-    results = []
-    for file_info in sorted_files:
-        features = calculate_features(file_info["filepath"])
-        features["filename"] = file_info["filename"]
-        features["route_folder"] = file_info["route_folder"]
-
-        # 提取 part 編號
-        part_match = re.search(r"part(\d+)", file_info["filename"])
-        features["part_number"] = int(part_match.group(1)) if part_match else 0
-
-        results.append(features)
+    if args.resample:
+        print(f"坡度與海拔特徵以 {args.resample:g} 公尺間距重新取樣後計算")
+    results = [
+        calculate_file_features(file_info, args.resample, args.time_features) for file_info in sorted_files
+    ]
 
     # 建立並美化 DataFrame 報告
-    df = pd.DataFrame(results)
-
-    # 重新排列欄位順序
-    if "錯誤" not in df.columns:
-        df = df[
-            [
-                "route_folder",
-                "part_number",
-                "filename",
-                "distance",
-                "elevation_range",
-                "elevation_change",
-                "elevation_gain",
-                "elevation_loss",
-                "high_elevation",
-                "max_slope_percent",
-                "max_slope_degrees",
-                "max_slope_point",
-                "slope_std_dev",
-                "slope_variance",
-                "slope_freq_dist",
-            ]
-        ]
-
-        # 格式化浮點數顯示
-        pd.options.display.float_format = "{:.2f}".format
-        df["max_slope_point"] = df["max_slope_point"].astype(str)
-        df["slope_freq_dist"] = df["slope_freq_dist"].astype(str)
+    df = build_report(results)
 
     print("\n--- 路線特徵報告 ---")
     print(df.to_string())
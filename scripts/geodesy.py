@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+地理距離計算
+以 NumPy 向量化的 Haversine 距離、累積里程、方位角，
+短距離（1 公里內）使用的等距圓柱投影，以及讀取 DEM 用的橫麥卡托投影（TWD97 TM2、UTM）。
+參數可為純量或陣列；純量輸入時回傳 float。
+"""
+
+import numpy as np
+
+EARTH_RADIUS = 6371000  # 地球半徑（公尺）
+
+# 橢球 (長半徑, 扁率)
+GRS80 = (6378137.0, 1 / 298.257222101)
+WGS84 = (6378137.0, 1 / 298.257223563)
+
+
+def _scalar_or_array(values):
+    return float(values) if np.ndim(values) == 0 else values
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """兩點（或兩組對應點）間的大圓距離（公尺）"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return _scalar_or_array(2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0))))
+
+
+def pairwise_distances(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """第一組每個點到第二組每個點的距離矩陣，形狀 (len(lats1), len(lats2))"""
+    lats1 = np.asarray(lats1, dtype=float)[:, None]
+    lons1 = np.asarray(lons1, dtype=float)[:, None]
+    return haversine(lats1, lons1, np.asarray(lats2, dtype=float)[None, :], np.asarray(lons2, dtype=float)[None, :])
+
+
+def consecutive_distances(lats, lons) -> np.ndarray:
+    """相鄰點之間的距離，長度為 n - 1"""
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    if len(lats) < 2:
+        return np.zeros(0)
+    return haversine(lats[:-1], lons[:-1], lats[1:], lons[1:])
+
+
+def chainage(lats, lons) -> np.ndarray:
+    """由起點起算的累積距離，長度為 n（第一個值為 0）"""
+    return np.concatenate([[0.0], np.cumsum(consecutive_distances(lats, lons))])
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """由第一點指向第二點的初始方位角（度，正北為 0，順時針 0–360）"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return _scalar_or_array(np.degrees(np.arctan2(x, y)) % 360.0)
+
+
+def local_xy(lons, lats, lat0=None) -> np.ndarray:
+    """
+    等距圓柱投影，回傳 (n, 2) 的公尺座標。
+    lat0 為投影基準緯度（預設為平均緯度），適用於 1 公里內的距離與幾何計算。
+    """
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    if lat0 is None:
+        lat0 = float(np.mean(lats)) if len(lats) else 0.0
+    x = np.radians(lons) * np.cos(np.radians(lat0)) * EARTH_RADIUS
+    y = np.radians(lats) * EARTH_RADIUS
+    return np.column_stack([x, y])
+
+
+def transverse_mercator(lons, lats, lon0, k0=0.9999, false_easting=250000.0, false_northing=0.0, ellipsoid=GRS80):
+    """
+    經緯度（度）→ 橫麥卡托投影座標 (x, y)（公尺），使用 Krüger 級數（距中央經線數度內誤差小於 1 mm）。
+    預設參數為 TWD97 TM2（EPSG:3826 需再指定 lon0=121）。
+    """
+    a, f = ellipsoid
+    n = f / (2 - f)
+    big_a = a / (1 + n) * (1 + n**2 / 4 + n**4 / 64)
+    alpha = (n / 2 - 2 * n**2 / 3 + 5 * n**3 / 16, 13 * n**2 / 48 - 3 * n**3 / 5, 61 * n**3 / 240)
+
+    phi = np.radians(np.asarray(lats, dtype=float))
+    dlam = np.radians(np.asarray(lons, dtype=float) - lon0)
+    e = 2 * np.sqrt(n) / (1 + n)
+    t = np.sinh(np.arctanh(np.sin(phi)) - e * np.arctanh(e * np.sin(phi)))
+    xi = np.arctan2(t, np.cos(dlam))
+    eta = np.arctanh(np.sin(dlam) / np.sqrt(1 + t**2))
+
+    x = eta.copy()
+    y = xi.copy()
+    for j, coefficient in enumerate(alpha, start=1):
+        x += coefficient * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        y += coefficient * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+    return _scalar_or_array(false_easting + k0 * big_a * x), _scalar_or_array(false_northing + k0 * big_a * y)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線 GeoJSON 的兩種結構
+
+points（舊格式，預設）：一個 LineString 加上每個點位各一個 Point Feature，
+    每個頂點在檔案中出現兩次。
+columnar：只有一個 LineString，點位屬性放在與座標對齊的陣列中，
+    通訊點（及其他有名稱的點位）另外列在 comm_points：
+
+    {
+      "type": "FeatureCollection",
+      "layout": "columnar",
+      "comm_points": [{"index": 0, "name": "登山口"}, ...],
+      "features": [{
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": [[經度, 緯度], ...]},
+        "properties": {
+          ...路線屬性...,
+          "columns": {"order": [...], "type": [...], "elevation": [...], "time": [...]}
+        }
+      }]
+    }
+
+寫入端以 layout 參數（或環境變數 GPX_TOOL_GEOJSON_LAYOUT）選擇格式；
+讀取端以 to_point_features() 轉成舊格式，兩種檔案都能讀。
+
+輸出設定（profile 參數或環境變數 GPX_TOOL_OUTPUT_PROFILE）：
+
+pretty（預設）：縮排輸出，數值保留完整精度
+compact：經緯度取到小數 6 位、海拔取到 0.1 m，不縮排
+compact-gz：同 compact，另以 gzip 壓縮寫成 .geojson.gz
+
+讀取端以 existing_geojson() / list_geojson() 找檔案，.geojson 與 .geojson.gz 都能讀。
+"""
+
+import gzip
+import json
+import math
+import os
+from pathlib import Path
+
+LAYOUT_POINTS = "points"
+LAYOUT_COLUMNAR = "columnar"
+LAYOUTS = (LAYOUT_POINTS, LAYOUT_COLUMNAR)
+
+PROFILE_PRETTY = "pretty"
+PROFILE_COMPACT = "compact"
+PROFILE_COMPACT_GZ = "compact-gz"
+PROFILES = (PROFILE_PRETTY, PROFILE_COMPACT, PROFILE_COMPACT_GZ)
+
+GZIP_SUFFIX = ".gz"
+COORD_DECIMALS = 6  # 約 0.1 m
+ELEVATION_DECIMALS = 1
+
+
+def default_layout() -> str:
+    """寫入時預設的格式（環境變數 GPX_TOOL_GEOJSON_LAYOUT）"""
+    layout = os.environ.get("GPX_TOOL_GEOJSON_LAYOUT", LAYOUT_POINTS)
+    if layout not in LAYOUTS:
+        raise ValueError(f"未知的 GeoJSON 格式: {layout}（可用: {', '.join(LAYOUTS)}）")
+    return layout
+
+
+def default_profile() -> str:
+    """寫入時預設的輸出設定（環境變數 GPX_TOOL_OUTPUT_PROFILE）"""
+    profile = os.environ.get("GPX_TOOL_OUTPUT_PROFILE", PROFILE_PRETTY)
+    if profile not in PROFILES:
+        raise ValueError(f"未知的輸出設定: {profile}（可用: {', '.join(PROFILES)}）")
+    return profile
+
+
+def is_columnar(geojson: dict) -> bool:
+    return geojson.get("layout") == LAYOUT_COLUMNAR
+
+
+def _has_name(name) -> bool:
+    """名稱是否有值（排除 None、空字串與 NaN）"""
+    if name is None or (isinstance(name, float) and math.isnan(name)):
+        return False
+    return str(name).strip() not in ("", "N/A")
+
+
+def to_columnar(geojson: dict) -> dict:
+    """舊格式 → columnar；已是 columnar 時原樣回傳。頂點座標以 Point Feature 為準"""
+    if is_columnar(geojson):
+        return geojson
+
+    features = geojson.get("features", [])
+    line = next((f for f in features if f["geometry"]["type"] == "LineString"), None)
+    points = [f for f in features if f["geometry"]["type"] == "Point"]
+
+    columns = {"order": [], "type": [], "elevation": []}
+    times = []
+    comm_points = []
+    coordinates = []
+    for index, feature in enumerate(points):
+        props = feature.get("properties") or {}
+        coordinates.append(list(feature["geometry"]["coordinates"][:2]))
+        columns["order"].append(props.get("order"))
+        columns["type"].append(props.get("type"))
+        columns["elevation"].append(props.get("elevation"))
+        times.append(props.get("time"))
+        if props.get("type") == "comm" or _has_name(props.get("name")):
+            comm_points.append({"index": index, "name": props.get("name") if _has_name(props.get("name")) else None})
+    if any(time is not None for time in times):
+        columns["time"] = times
+
+    properties = dict(line.get("properties") or {}) if line else {}
+    properties["columns"] = columns
+
+    columnar = {key: value for key, value in geojson.items() if key != "features"}
+    columnar["layout"] = LAYOUT_COLUMNAR
+    columnar["comm_points"] = comm_points
+    columnar["features"] = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+            "properties": properties,
+        }
+    ]
+    return columnar
+
+
+def to_point_features(geojson: dict) -> dict:
+    """columnar → 舊格式（LineString + Point Features）；舊格式原樣回傳"""
+    if not is_columnar(geojson):
+        return geojson
+
+    line = geojson["features"][0]
+    properties = dict(line.get("properties") or {})
+    columns = properties.pop("columns", {})
+    coordinates = line["geometry"]["coordinates"]
+    count = len(coordinates)
+
+    orders = columns.get("order") or list(range(1, count + 1))
+    types = columns.get("type") or ["gpx"] * count
+    elevations = columns.get("elevation") or [None] * count
+    times = columns.get("time")
+    names = [None] * count
+    for comm in geojson.get("comm_points", []):
+        names[comm["index"]] = comm.get("name")
+
+    features = []
+    if count > 1:
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+                "properties": properties,
+            }
+        )
+    for index in range(count):
+        point_properties = {
+            "order": orders[index],
+            "type": types[index],
+            "name": names[index],
+            "elevation": elevations[index],
+        }
+        if times is not None and times[index] is not None:
+            point_properties["time"] = times[index]
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": coordinates[index]},
+                "properties": point_properties,
+            }
+        )
+
+    legacy = {
+        key: value for key, value in geojson.items() if key not in ("features", "layout", "comm_points")
+    }
+    legacy["features"] = features
+    return legacy
+
+
+def gzip_path(path) -> Path:
+    """route.geojson → route.geojson.gz"""
+    path = Path(path)
+    return path if path.name.endswith(GZIP_SUFFIX) else path.with_name(path.name + GZIP_SUFFIX)
+
+
+def plain_path(path) -> Path:
+    """route.geojson.gz → route.geojson"""
+    path = Path(path)
+    return path.with_name(path.name[: -len(GZIP_SUFFIX)]) if path.name.endswith(GZIP_SUFFIX) else path
+
+
+def existing_geojson(path):
+    """回傳實際存在的檔案（.geojson 或 .geojson.gz，兩者都有時取較新的），都不存在時回傳 None"""
+    candidates = []
+    for candidate in (plain_path(path), gzip_path(path)):
+        try:
+            candidates.append((candidate.stat().st_mtime_ns, candidate))
+        except OSError:
+            continue
+    return max(candidates)[1] if candidates else None
+
+
+def list_geojson(folder) -> list:
+    """列出資料夾中的 GeoJSON（含 .geojson.gz），同名檔案只保留較新的一個，依檔名排序"""
+    folder = Path(folder)
+    if not folder.is_dir():
+        return []
+    names = {
+        plain_path(path).name
+        for path in folder.iterdir()
+        if path.name.endswith(".geojson") or path.name.endswith(".geojson" + GZIP_SUFFIX)
+    }
+    return [existing_geojson(folder / name) for name in sorted(names)]
+
+
+def read_text(path) -> str:
+    """讀取文字檔，.gz 檔自動解壓縮"""
+    path = Path(path)
+    if path.name.endswith(GZIP_SUFFIX):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def load_geojson(path) -> dict:
+    """讀取任一種格式的 GeoJSON（可為 .geojson.gz），回傳舊格式"""
+    source = existing_geojson(path)
+    if source is None:
+        raise FileNotFoundError(2, "找不到 GeoJSON 檔案", str(path))
+    return to_point_features(json.loads(read_text(source)))
+
+
+def _round_coordinates(coordinates):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, COORD_DECIMALS) for value in coordinates]
+    return [_round_coordinates(child) for child in coordinates]
+
+
+def _round_elevation(value):
+    if isinstance(value, float) and not math.isnan(value):
+        return round(value, ELEVATION_DECIMALS)
+    return value
+
+
+def round_geojson(geojson: dict) -> dict:
+    """經緯度取到小數 6 位、海拔取到 0.1 m（回傳新的物件）"""
+    rounded = dict(geojson)
+    rounded["features"] = []
+    for feature in geojson.get("features", []):
+        geometry = dict(feature["geometry"])
+        if "coordinates" in geometry:
+            geometry["coordinates"] = _round_coordinates(geometry["coordinates"])
+        properties = dict(feature.get("properties") or {})
+        if "elevation" in properties:
+            properties["elevation"] = _round_elevation(properties["elevation"])
+        if "columns" in properties:
+            columns = dict(properties["columns"])
+            if "elevation" in columns:
+                columns["elevation"] = [_round_elevation(value) for value in columns["elevation"]]
+            properties["columns"] = columns
+        rounded["features"].append(dict(feature, geometry=geometry, properties=properties))
+    return rounded
+
+
+def _prepare_geojson(geojson: dict, layout: str, profile: str) -> dict:
+    geojson = to_columnar(geojson) if layout == LAYOUT_COLUMNAR else to_point_features(geojson)
+    if profile != PROFILE_PRETTY:
+        geojson = round_geojson(geojson)
+    return geojson
+
+
+def as_written(geojson: dict, layout: str = None, profile: str = None) -> dict:
+    """
+    回傳以 write_geojson() 寫出、再以 load_geojson() 讀回時的內容（不經過序列化），
+    讓記憶體中的流程與分開執行各腳本時得到相同結果。
+    """
+    layout = layout or default_layout()
+    profile = profile or default_profile()
+    return to_point_features(_prepare_geojson(geojson, layout, profile))
+
+
+def dumps_geojson(geojson: dict, layout: str = None, profile: str = None) -> str:
+    """
+    依格式與輸出設定序列化路線 GeoJSON。
+    columnar 一律不縮排（陣列縮排會讓每個數值各佔一行）。
+    """
+    layout = layout or default_layout()
+    profile = profile or default_profile()
+    geojson = _prepare_geojson(geojson, layout, profile)
+    if profile == PROFILE_PRETTY and layout == LAYOUT_POINTS:
+        return json.dumps(geojson, ensure_ascii=False, indent=2)
+    return json.dumps(geojson, ensure_ascii=False, separators=(",", ":"))
+
+
+def write_geojson(path, geojson: dict, layout: str = None, profile: str = None) -> Path:
+    """
+    以指定格式與輸出設定寫入路線 GeoJSON，回傳實際寫入的路徑。
+    compact-gz 會寫成 .geojson.gz；同名的另一種檔案會被移除，避免讀到舊資料。
+    """
+    profile = profile or default_profile()
+    text = dumps_geojson(geojson, layout, profile)
+    if profile == PROFILE_COMPACT_GZ:
+        target, stale = gzip_path(path), plain_path(path)
+        with open(target, "wb") as f:
+            # mtime=0 讓相同內容產生相同位元組
+            with gzip.GzipFile(filename="", mode="wb", fileobj=f, mtime=0) as gz:
+                gz.write(text.encode("utf-8"))
+    else:
+        target, stale = plain_path(path), gzip_path(path)
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(text)
+    if stale.exists():
+        stale.unlink()
+    return target
@@ -5,36 +5,28 @@ GeoJSON 轉 GPX 工具
 將 data_work 資料夾中的 route.geojson 檔案轉換為 GPX 格式
 """
 
-import json
+import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
-import math
 
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """計算兩點間的地理距離（公尺），使用 Haversine 公式"""
-    # 轉換為弧度
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-
-    # Haversine 公式
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = (
-        math.sin(dlat / 2) ** 2
-        + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
-    )
-    c = 2 * math.asin(math.sqrt(a))
-
-    # 地球半徑（公尺）
-    earth_radius = 6371000
-    return earth_radius * c
+from geojson_layout import existing_geojson, load_geojson
 
 
 def interpolate_missing_data(points):
     """對缺少時間和高度的點位進行插值"""
     from datetime import datetime, timedelta
 
+    # 時間與高度都齊全時不需插值，也就不必載入 NumPy
+    if all(p.get("time") and p.get("elevation") for p in points):
+        return points
+
+    from geodesy import chainage
+
+    # 座標不會被插值改動，累積里程只需計算一次
+    distances = chainage([p["lat"] for p in points], [p["lon"] for p in points]).tolist()
+
     # 處理時間插值
     for i in range(len(points)):
         if not points[i].get("time"):
@@ -53,20 +45,9 @@ def interpolate_missing_data(points):
                 prev_point = points[prev_idx]
                 next_point = points[next_idx]
 
-                # 計算累積距離
-                total_distance = 0
-                current_distance = 0
-
-                for j in range(prev_idx, next_idx):
-                    dist = calculate_distance(
-                        points[j]["lat"],
-                        points[j]["lon"],
-                        points[j + 1]["lat"],
-                        points[j + 1]["lon"],
-                    )
-                    total_distance += dist
-                    if j < i:
-                        current_distance += dist
+                # 由累積里程取得區間距離
+                total_distance = distances[next_idx] - distances[prev_idx]
+                current_distance = distances[i] - distances[prev_idx]
 
                 # 時間插值
                 if total_distance > 0:
@@ -101,20 +82,9 @@ def interpolate_missing_data(points):
                 prev_point = points[prev_idx]
                 next_point = points[next_idx]
 
-                # 計算累積距離
-                total_distance = 0
-                current_distance = 0
-
-                for j in range(prev_idx, next_idx):
-                    dist = calculate_distance(
-                        points[j]["lat"],
-                        points[j]["lon"],
-                        points[j + 1]["lat"],
-                        points[j + 1]["lon"],
-                    )
-                    total_distance += dist
-                    if j < i:
-                        current_distance += dist
+                # 由累積里程取得區間距離
+                total_distance = distances[next_idx] - distances[prev_idx]
+                current_distance = distances[i] - distances[prev_idx]
 
                 # 高度插值
                 if total_distance > 0:
@@ -127,17 +97,25 @@ def interpolate_missing_data(points):
     return points
 
 
-def scan_txt_geojson():
-    """掃描 已改好的txt_geojson 資料夾，取得所有 route.geojson 檔案"""
+def scan_txt_geojson(routes=None):
+    """掃描 已改好的txt_geojson 資料夾，取得所有 route.geojson 檔案
+
+    routes 為路線名稱清單時，只回傳清單中的路線。
+    """
     data_path = Path("已改好的txt_geojson")
     print(f"  -> 掃描路徑: {data_path.absolute()}")
     geojson_files = []
 
+    if routes:
+        route_dirs = [data_path / route_name for route_name in routes]
+    else:
+        route_dirs = sorted(data_path.iterdir())
+
     # 掃描每個路線資料夾
-    for route_dir in data_path.iterdir():
+    for route_dir in route_dirs:
         if route_dir.is_dir():
-            geojson_file = route_dir / "route.geojson"
-            if geojson_file.exists():
+            geojson_file = existing_geojson(route_dir / "route.geojson")
+            if geojson_file is not None:
                 route_name = route_dir.name
                 geojson_files.append(
                     {
@@ -147,11 +125,21 @@ def scan_txt_geojson():
                     }
                 )
 
+    if routes:
+        # 指定的路線沒有資料夾或 route.geojson 時提醒，避免被靜默略過
+        found = {file_info["route_name"] for file_info in geojson_files}
+        missing = [route_name for route_name in routes if route_name not in found]
+        if missing:
+            print(f"  -> 找不到指定路線的 route.geojson: {', '.join(missing)}")
+
     return geojson_files
 
 
-def geojson_to_gpx(geojson_data, output_filename):
-    """將 GeoJSON 資料轉換為 GPX 格式"""
+def geojson_to_gpx(geojson_data, output_filename, pace=None):
+    """將 GeoJSON 資料轉換為 GPX 格式
+
+    pace: 以步行速度模型補上缺少的時間（pace.fill_point_times 的參數，如 {"model", "factor"}）
+    """
 
     # GPX 檔案開頭
     gpx_content = """<?xml version="1.0" encoding="UTF-8"?>
@@ -202,6 +190,11 @@ def geojson_to_gpx(geojson_data, output_filename):
 
     points.sort(key=sort_key)
 
+    if pace:
+        from pace import fill_point_times
+
+        fill_point_times(points, **pace)
+
     # 對缺少時間和高度的點位進行插值
     points = interpolate_missing_data(points)
 
@@ -250,8 +243,38 @@ def geojson_to_gpx(geojson_data, output_filename):
     return gpx_content
 
 
-def main():
-    """主要執行流程"""
+def is_gpx_stale(file_info, output_dir):
+    """判斷 GPX 是否需要重新產生（不存在或比來源 GeoJSON 舊）"""
+    output_path = Path(output_dir) / file_info["output_name"]
+    if not output_path.exists():
+        return True
+    return file_info["file_path"].stat().st_mtime > output_path.stat().st_mtime
+
+
+def convert_route(file_info, output_dir, pace=None):
+    """轉換單一路線的 GeoJSON 為 GPX 檔案，回傳輸出路徑"""
+    # 讀取 GeoJSON（points 或 columnar 格式）
+    geojson_data = load_geojson(file_info["file_path"])
+
+    # 轉換為 GPX
+    gpx_content = geojson_to_gpx(geojson_data, file_info["output_name"], pace)
+
+    # 寫入 GPX 檔案
+    output_path = Path(output_dir) / file_info["output_name"]
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(gpx_content)
+
+    return output_path
+
+
+def main(routes=None, only_stale=False, workers=1, pace=None):
+    """主要執行流程
+
+    routes: 只轉換指定的路線名稱（預設為全部）
+    only_stale: 只轉換 GPX 不存在或比來源 GeoJSON 舊的路線
+    workers: 平行轉換的行程數，1 表示依序處理
+    pace: 以步行速度模型補上缺少的時間（見 geojson_to_gpx）
+    """
     print("開始 GeoJSON 轉 GPX 處理...")
 
     # 建立輸出資料夾
@@ -259,29 +282,70 @@ def main():
     output_dir.mkdir(exist_ok=True)
 
     # 掃描所有 GeoJSON 檔案
-    geojson_files = scan_txt_geojson()
+    geojson_files = scan_txt_geojson(routes)
     print(f"  -> 找到 {len(geojson_files)} 個路線檔案")
 
-    # 處理每個檔案
-    for file_info in geojson_files:
-        print(f"  -> 處理 {file_info['route_name']}...")
-
-        # 讀取 GeoJSON
-        with open(file_info["file_path"], "r", encoding="utf-8") as f:
-            geojson_data = json.load(f)
+    if only_stale:
+        geojson_files = [
+            file_info
+            for file_info in geojson_files
+            if is_gpx_stale(file_info, output_dir)
+        ]
+        print(f"  -> 需要更新 {len(geojson_files)} 個路線")
+
+    if workers > 1 and len(geojson_files) > 1:
+        # 以行程池平行轉換
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (file_info, executor.submit(convert_route, file_info, output_dir, pace))
+                for file_info in geojson_files
+            ]
+            for file_info, future in futures:
+                try:
+                    output_path = future.result()
+                    print(f"  -> {file_info['route_name']} 轉換完成：{output_path}")
+                except Exception as e:
+                    print(f"  -> {file_info['route_name']} 轉換失敗: {e}")
+    else:
+        # 處理每個檔案
+        for file_info in geojson_files:
+            print(f"  -> 處理 {file_info['route_name']}...")
+            try:
+                output_path = convert_route(file_info, output_dir, pace)
+                print(f"     轉換完成：{output_path}")
+            except Exception as e:
+                print(f"     轉換失敗: {e}")
 
-        # 轉換為 GPX
-        gpx_content = geojson_to_gpx(geojson_data, file_info["output_name"])
+    print("所有檔案轉換完成！")
 
-        # 寫入 GPX 檔案
-        output_path = output_dir / file_info["output_name"]
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(gpx_content)
 
-        print(f"     轉換完成：{output_path}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="將 已改好的txt_geojson 的路線轉換為 GPX")
+    parser.add_argument("routes", nargs="*", help="只轉換指定的路線名稱（預設為全部）")
+    parser.add_argument(
+        "--only-stale",
+        action="store_true",
+        help="只轉換 GPX 不存在或比來源 GeoJSON 舊的路線",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="平行轉換的行程數"
+    )
+    parser.add_argument(
+        "--pace",
+        nargs="?",
+        const="tobler",
+        choices=["tobler", "naismith"],
+        help="以步行速度模型補上沒有時間的點（預設 tobler，使用 pace_calibration.json 的校正係數）",
+    )
+    parser.add_argument("--pace-start", help="完全沒有時間的路線的出發時間（ISO 8601）")
+    args = parser.parse_args()
 
-    print("所有檔案轉換完成！")
+    pace = None
+    if args.pace:
+        from pace import load_calibration, parse_start
 
+        pace = {"model": args.pace, "factor": load_calibration(Path(".")).get(args.pace, 1.0)}
+        if args.pace_start:
+            pace["start"] = parse_start(args.pace_start)
 
-if __name__ == "__main__":
-    main()
+    main(routes=args.routes, only_stale=args.only_stale, workers=args.workers, pace=pace)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線更新 API 壓力測試
+複製路線到暫存資料目錄並啟動 serve_api，模擬編輯器流量
+（路線列表、路線讀取、LOD、修補儲存），回報各端點的 p50/p95/p99 延遲與吞吐量。
+
+    python load_test.py --clients 16 --duration 20 --workers 4 --threads 8
+"""
+
+import argparse
+import http.client
+import json
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import quote
+
+BASE_DIR = Path(__file__).parent.parent
+
+# 各種請求的權重（模擬編輯器的使用比例）
+TRAFFIC_MIX = {
+    "catalog": 30,
+    "route-data": 30,
+    "route-lod": 15,
+    "edited-route": 10,
+    "save-patch": 15,
+}
+
+
+def prepare_data_dir(routes_limit=None) -> Path:
+    """建立暫存資料目錄並複製 data_work 的路線"""
+    data_dir = Path(tempfile.mkdtemp(prefix="gpx_load_test_"))
+    route_names = sorted(
+        p.name
+        for p in (BASE_DIR / "data_work" / "route_a").iterdir()
+        if (BASE_DIR / "data_work" / "route_b" / p.name).is_dir()
+    )
+    if routes_limit:
+        route_names = route_names[:routes_limit]
+    for side in ("route_a", "route_b"):
+        for route_name in route_names:
+            shutil.copytree(
+                BASE_DIR / "data_work" / side / route_name,
+                data_dir / "data_work" / side / route_name,
+            )
+    return data_dir
+
+
+def wait_for_server(host, port, timeout=30.0) -> bool:
+    """等待 /api/health 可以連線"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Client(threading.Thread):
+    """單一模擬編輯器：持續連線並依 TRAFFIC_MIX 隨機發送請求"""
+
+    def __init__(self, host, port, routes, deadline, results, seed):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port
+        self.routes = routes
+        self.deadline = deadline
+        self.results = results
+        self.random = random.Random(seed)
+        self.etags = {}
+        self.conn = None
+
+    def request(self, endpoint, method, path, body=None, conditional=True):
+        """送出請求並記錄 (端點, 延遲, 狀態碼, 回應大小)"""
+        headers = {"Accept-Encoding": "gzip"}
+        if conditional and path in self.etags:
+            headers["If-None-Match"] = self.etags[path]
+        if body is not None:
+            body = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.conn = None
+            self.results.append((endpoint, time.perf_counter() - start, 0, 0))
+            return 0, None
+        elapsed = time.perf_counter() - start
+
+        etag = response.getheader("ETag")
+        if etag:
+            self.etags[path] = etag
+        self.results.append((endpoint, elapsed, status, len(data)))
+        return status, data
+
+    def save_patch(self, route_name, route_type):
+        """讀取目前版本後移動一個點位；版本衝突時只記錄不重試"""
+        path = f"/api/edited-route/{quote(route_name)}/{route_type}"
+        status, data = self.request("edited-route", "GET", path, conditional=False)
+        if status != 200:
+            return
+        state = json.loads(data)
+        if not state["points"]:
+            return
+        seq = self.random.randint(1, len(state["points"]))
+        point = state["points"][seq - 1]
+        patch = {
+            "route_name": route_name,
+            "route_type": route_type,
+            "base_version": state["version"],
+            "moved": [
+                {
+                    "seq": seq,
+                    "lat": point["lat"] + self.random.uniform(-1e-5, 1e-5),
+                    "lon": point["lon"] + self.random.uniform(-1e-5, 1e-5),
+                }
+            ],
+        }
+        self.request("save-patch", "POST", "/api/save-edited-patch", body=patch)
+
+    def run(self):
+        try:
+            self.replay()
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+
+    def replay(self):
+        endpoints = list(TRAFFIC_MIX)
+        weights = [TRAFFIC_MIX[name] for name in endpoints]
+        while time.monotonic() < self.deadline:
+            endpoint = self.random.choices(endpoints, weights)[0]
+            route_name = self.random.choice(self.routes)
+            route_type = self.random.choice(["a", "b"])
+            encoded = quote(route_name)
+
+            if endpoint == "catalog":
+                self.request(endpoint, "GET", "/api/routes")
+            elif endpoint == "route-data":
+                self.request(endpoint, "GET", f"/api/route-data/{encoded}/{route_type}")
+            elif endpoint == "route-lod":
+                zoom = self.random.randint(8, 17)
+                self.request(endpoint, "GET", f"/api/route-lod/{encoded}/{route_type}?zoom={zoom}")
+            elif endpoint == "edited-route":
+                self.request(
+                    endpoint, "GET", f"/api/edited-route/{encoded}/{route_type}", conditional=False
+                )
+            else:
+                self.save_patch(route_name, route_type)
+
+
+def percentile(sorted_values, fraction):
+    """最近排名法百分位數"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def report(results, duration):
+    """輸出各端點的延遲分布與吞吐量"""
+    grouped = defaultdict(list)
+    for endpoint, elapsed, status, size in results:
+        grouped[endpoint].append((elapsed, status, size))
+
+    header = f"{'端點':<14}{'請求數':>8}{'錯誤':>6}{'409':>6}{'304':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'req/s':>9}{'KB/req':>9}"
+    print(header)
+    print("-" * len(header))
+    for endpoint in TRAFFIC_MIX:
+        rows = grouped.get(endpoint)
+        if not rows:
+            continue
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in rows)
+        errors = sum(1 for _, status, _ in rows if status == 0 or status >= 500)
+        conflicts = sum(1 for _, status, _ in rows if status == 409)
+        not_modified = sum(1 for _, status, _ in rows if status == 304)
+        avg_kb = sum(size for _, _, size in rows) / len(rows) / 1024
+        print(
+            f"{endpoint:<14}{len(rows):>8}{errors:>6}{conflicts:>6}{not_modified:>6}"
+            f"{percentile(latencies, 0.50):>10.2f}{percentile(latencies, 0.95):>10.2f}"
+            f"{percentile(latencies, 0.99):>10.2f}{latencies[-1]:>10.2f}"
+            f"{len(rows) / duration:>9.1f}{avg_kb:>9.1f}"
+        )
+    print("-" * len(header))
+    print(f"總計 {len(results)} 個請求，吞吐量 {len(results) / duration:.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="路線更新 API 壓力測試")
+    parser.add_argument("--clients", type=int, default=16, help="同時模擬的編輯器數量")
+    parser.add_argument("--duration", type=float, default=20.0, help="測試秒數")
+    parser.add_argument("--routes", type=int, help="只複製前 N 條路線")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--workers", type=int, default=4, help="API worker 行程數")
+    parser.add_argument("--threads", type=int, default=8, help="每個 worker 的執行緒數")
+    parser.add_argument("--server", default="auto", choices=["auto", "gunicorn", "waitress"])
+    parser.add_argument("--keep", action="store_true", help="測試後保留暫存資料目錄")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    args = parser.parse_args()
+
+    data_dir = prepare_data_dir(args.routes)
+    routes = sorted(p.name for p in (data_dir / "data_work" / "route_a").iterdir())
+    print(f"暫存資料目錄: {data_dir}（{len(routes)} 條路線）")
+
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            str(Path(__file__).parent / "serve_api.py"),
+            "--host", args.host,
+            "--port", str(args.port),
+            "--workers", str(args.workers),
+            "--threads", str(args.threads),
+            "--server", args.server,
+            "--data-dir", str(data_dir),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_for_server(args.host, args.port):
+            print("API 服務器無法啟動")
+            return
+
+        print(f"開始測試：{args.clients} 個用戶端，{args.duration:.0f} 秒...")
+        results = []
+        deadline = time.monotonic() + args.duration
+        started = time.monotonic()
+        clients = [
+            Client(args.host, args.port, routes, deadline, results, args.seed + i)
+            for i in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+
+        report(results, time.monotonic() - started)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if args.keep:
+            print(f"保留暫存資料目錄: {data_dir}")
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
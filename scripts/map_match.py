@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+軌跡對應（map-matching）
+以隱馬可夫模型（HMM）與 Viterbi 演算法，把依序排列的觀測點（通訊點或使用者的 GPS 軌跡）
+對應到參考路線上的位置。只找最近的頂點時，之字形路段或路線從自己旁邊經過的地方
+容易對到錯誤的一段；HMM 同時考慮觀測點的順序與沿路線的距離，可以避開這類錯誤。
+
+  候選位置  參考路線的網格索引中、半徑 radius 內的線段投影點；
+            同一段連續線段只保留最近的一個（每次經過附近各一個候選）
+  發射機率  到候選位置距離的常態分布（sigma）
+  轉移機率  沿路線距離與兩觀測點直線距離之差的指數分布（beta），
+            monotonic 時不允許沿路線倒退（超過 backtrack 公尺）
+
+半徑內沒有候選位置的觀測點不參與對應（結果為 None），由呼叫端改用最近點。
+
+    python map_match.py mt_jade_main ../data_raw/gpx/mt_jade_main.gpx --output matched.csv
+"""
+
+import argparse
+import csv
+import os
+from pathlib import Path
+
+import numpy as np
+
+from geodesy import chainage, haversine, local_xy
+
+DEFAULT_RADIUS = 200.0  # 候選搜尋半徑（公尺）
+DEFAULT_SIGMA = 20.0  # 觀測點位置誤差（公尺）
+DEFAULT_BETA = 200.0  # 沿路線距離與直線距離之差的尺度（公尺）
+DEFAULT_BACKTRACK = 5.0  # monotonic 時容許的倒退距離（公尺）
+MAX_CANDIDATES = 8
+
+
+class SegmentIndex:
+    """
+    參考路線線段的網格索引。
+    每個線段登記在其外框（外擴 radius）涵蓋的網格中，查詢只需檢查觀測點所在的網格，
+    成本與附近的線段數有關，與路線長度無關。
+    """
+
+    def __init__(self, lats, lons, radius=DEFAULT_RADIUS):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.radius = radius
+        self.lat0 = float(np.mean(self.lats)) if len(self.lats) else 0.0
+        self.xy = local_xy(self.lons, self.lats, self.lat0)
+        self.chainage = chainage(self.lats, self.lons)
+        self.cell = max(radius, 1.0)
+
+        start, end = self.xy[:-1], self.xy[1:]
+        low = np.floor((np.minimum(start, end) - radius) / self.cell).astype(np.int64)
+        high = np.floor((np.maximum(start, end) + radius) / self.cell).astype(np.int64)
+        spans = high - low + 1
+        counts = spans[:, 0] * spans[:, 1]
+
+        # 展開每個線段涵蓋的網格，依網格鍵排序
+        segments = np.repeat(np.arange(len(counts)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = low[segments, 0] + offsets % spans[segments, 0]
+        cell_y = low[segments, 1] + offsets // spans[segments, 0]
+        keys = self._key(cell_x, cell_y)
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._segments = segments[order]
+
+    @staticmethod
+    def _key(cell_x, cell_y):
+        return cell_x * 4294967296 + cell_y
+
+    def candidates(self, lats, lons, max_candidates=MAX_CANDIDATES) -> list:
+        """
+        每個觀測點在半徑內的候選位置，一次處理所有觀測點。
+        回傳與觀測點同長度的清單，每項為
+        {"segment", "fraction"（線段內位置 0–1）, "chainage", "distance"} 陣列，依距離排序
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        finite = np.isfinite(lats) & np.isfinite(lons)
+        points = local_xy(np.where(finite, lons, 0.0), np.where(finite, lats, 0.0), self.lat0)
+
+        # 每個觀測點所在網格登記的線段（同一網格內依線段編號排序）
+        cells = np.floor(points / self.cell).astype(np.int64)
+        keys = self._key(cells[:, 0], cells[:, 1])
+        left = np.searchsorted(self._keys, keys, side="left")
+        counts = np.where(finite, np.searchsorted(self._keys, keys, side="right") - left, 0)
+        observation = np.repeat(np.arange(len(lats)), counts)
+        segments = self._segments[
+            np.repeat(left, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        ]
+
+        a = self.xy[segments]
+        ab = self.xy[segments + 1] - a
+        offset = points[observation] - a
+        length_sq = np.einsum("ij,ij->i", ab, ab)
+        fraction = np.clip(np.einsum("ij,ij->i", offset, ab) / np.where(length_sq > 0, length_sq, 1.0), 0.0, 1.0)
+        distance = np.linalg.norm(fraction[:, None] * ab - offset, axis=1)
+        within = distance <= self.radius
+        observation, segments, fraction, distance = (
+            observation[within], segments[within], fraction[within], distance[within]
+        )
+        if len(lats) == 0 or not within.any():
+            # 沒有觀測點，或所有觀測點的半徑內都沒有線段
+            empty = {
+                "segment": np.empty(0, dtype=np.int64),
+                "fraction": np.empty(0),
+                "chainage": np.empty(0),
+                "distance": np.empty(0),
+            }
+            return [dict(empty) for _ in range(len(lats))]
+
+        # 連續的線段屬於同一次經過，只保留其中最近的
+        runs = np.cumsum(np.concatenate([[True], (np.diff(observation) != 0) | (np.diff(segments) > 1)]))
+        order = np.lexsort((distance, runs))
+        first = order[np.concatenate([[True], np.diff(runs[order]) > 0])]
+
+        # 每個觀測點依距離排序，最多 max_candidates 個
+        first = first[np.lexsort((distance[first], observation[first]))]
+        per_observation = np.bincount(observation[first], minlength=len(lats))
+        rank = np.arange(len(first)) - np.repeat(np.cumsum(per_observation) - per_observation, per_observation)
+        first = first[rank < max_candidates]
+        per_observation = np.minimum(per_observation, max_candidates)
+
+        segments, fraction, distance = segments[first], fraction[first], distance[first]
+        lengths = self.chainage[segments + 1] - self.chainage[segments]
+        columns = {
+            "segment": segments,
+            "fraction": fraction,
+            "chainage": self.chainage[segments] + fraction * lengths,
+            "distance": distance,
+        }
+        bounds = np.cumsum(per_observation)[:-1]
+        split = {key: np.split(values, bounds) for key, values in columns.items()}
+        return [{key: split[key][i] for key in columns} for i in range(len(lats))]
+
+
+def viterbi(candidates, gaps, sigma=DEFAULT_SIGMA, beta=DEFAULT_BETA, monotonic=True, backtrack=DEFAULT_BACKTRACK):
+    """
+    candidates: 每個觀測點的候選（皆不可為空）
+    gaps: 相鄰觀測點之間的直線距離（長度為 len(candidates) - 1）
+
+    回傳 (每個觀測點選中的候選編號, 總對數機率, 中斷次數)。
+    沒有任何可行的轉移時（例如觀測點順序與路線不符），前一段取分數最高的結尾，
+    從該點以發射機率重新開始，並計為一次中斷。
+    """
+    score = -0.5 * (candidates[0]["distance"] / sigma) ** 2
+    back = []
+    breaks = 0
+    for step in range(1, len(candidates)):
+        current = candidates[step]
+        emission = -0.5 * (current["distance"] / sigma) ** 2
+        along = current["chainage"][None, :] - candidates[step - 1]["chainage"][:, None]
+        if monotonic:
+            transition = np.where(
+                along >= -backtrack, -np.abs(np.maximum(along, 0.0) - gaps[step - 1]) / beta, -np.inf
+            )
+        else:
+            transition = -np.abs(np.abs(along) - gaps[step - 1]) / beta
+        total = score[:, None] + transition
+        best = np.argmax(total, axis=0)
+        best_score = total[best, np.arange(len(best))]
+        if not np.isfinite(best_score).any():
+            breaks += 1
+            best = np.full(len(emission), int(np.argmax(score)))
+            best_score = np.full(len(emission), float(score.max()))
+        back.append(best)
+        score = best_score + emission
+
+    path = [int(np.argmax(score))]
+    for best in reversed(back):
+        path.append(int(best[path[-1]]))
+    path.reverse()
+    return path, float(score.max()), breaks
+
+
+def match_points(
+    index: SegmentIndex,
+    lats,
+    lons,
+    sigma=DEFAULT_SIGMA,
+    beta=DEFAULT_BETA,
+    monotonic=True,
+    backtrack=DEFAULT_BACKTRACK,
+) -> dict:
+    """
+    依序對應觀測點到參考路線。
+
+    回傳 {"matches": [None 或 {"segment", "fraction", "chainage", "distance"}...],
+          "score": 總對數機率, "breaks": 中斷次數}
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    all_candidates = index.candidates(lats, lons)
+    usable = [i for i, candidates in enumerate(all_candidates) if len(candidates["segment"])]
+    matches = [None] * len(lats)
+    if not usable:
+        return {"matches": matches, "score": float("-inf"), "breaks": 0}
+
+    gaps = haversine(lats[usable[:-1]], lons[usable[:-1]], lats[usable[1:]], lons[usable[1:]])
+    path, score, breaks = viterbi(
+        [all_candidates[i] for i in usable], np.atleast_1d(gaps), sigma, beta, monotonic, backtrack
+    )
+    for i, choice in zip(usable, path):
+        candidates = all_candidates[i]
+        matches[i] = {key: candidates[key][choice].item() for key in candidates}
+    return {"matches": matches, "score": score, "breaks": breaks}
+
+
+def match_ordered_points(route_lats, route_lons, lats, lons, radius=DEFAULT_RADIUS, **kwargs) -> list:
+    """
+    對應依序排列的點（例如通訊點）到參考路線，並自動判斷方向：
+    路線可能是依相反順序經過這些點（例如回程），兩個方向都試，取中斷較少、機率較高者。
+    回傳與輸入順序相同的對應結果清單（見 match_points）。
+    """
+    if len(route_lats) < 2:
+        return [None] * len(lats)
+    index = SegmentIndex(route_lats, route_lons, radius)
+    forward = match_points(index, lats, lons, **kwargs)
+    backward = match_points(index, lats[::-1], lons[::-1], **kwargs)
+    if (backward["breaks"], -backward["score"]) < (forward["breaks"], -forward["score"]):
+        return backward["matches"][::-1]
+    return forward["matches"]
+
+
+def nearest_vertex(match: dict) -> int:
+    """對應位置最近的路線頂點編號"""
+    return match["segment"] + (1 if match["fraction"] >= 0.5 else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把 GPS 軌跡對應到參考路線，輸出每個點的里程")
+    parser.add_argument("route", help="參考路線名稱（已改好的txt_geojson/<路線>/points.txt）")
+    parser.add_argument("track", help="要對應的 GPX 軌跡")
+    parser.add_argument("--base-dir", default=os.environ.get("GPX_TOOL_BASE_DIR", "."),
+                        help="專案資料根目錄（預設為目前目錄）")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS, help="候選搜尋半徑（公尺）")
+    parser.add_argument("--sigma", type=float, default=10.0, help="GPS 位置誤差（公尺）")
+    parser.add_argument("--beta", type=float, default=50.0, help="轉移距離差的尺度（公尺）")
+    parser.add_argument("--allow-backward", action="store_true", help="允許沿參考路線倒退（例如往返行程）")
+    parser.add_argument("--output", help="輸出 CSV（預設只印出摘要）")
+    args = parser.parse_args()
+
+    from route_qa import read_gpx_track
+    from route_splitter import read_points_file
+
+    reference = read_points_file(Path(args.base_dir) / "已改好的txt_geojson" / args.route / "points.txt")
+    track = read_gpx_track(Path(args.track))
+    index = SegmentIndex(reference["緯度"].to_numpy(dtype=float), reference["經度"].to_numpy(dtype=float), args.radius)
+    result = match_points(
+        index, track["lat"], track["lon"], args.sigma, args.beta, monotonic=not args.allow_backward
+    )
+
+    matched = [match for match in result["matches"] if match is not None]
+    print(f"{len(matched)}/{len(result['matches'])} 點對應到 {args.route}（中斷 {result['breaks']} 次）")
+    if matched:
+        distances = np.array([match["distance"] for match in matched])
+        chainages = np.array([match["chainage"] for match in matched])
+        print(
+            f"  涵蓋里程 {chainages.min():.0f}–{chainages.max():.0f} m"
+            f"（路線全長 {index.chainage[-1]:.0f} m），偏離中位數 {np.median(distances):.1f} m"
+        )
+        if not args.allow_backward and result["breaks"] > len(matched) // 10:
+            print("  中斷次數多：軌跡可能是往返或與參考路線方向相反，可加上 --allow-backward")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["index", "lat", "lon", "chainage", "distance", "segment"])
+            for i, (lat, lon, match) in enumerate(zip(track["lat"].tolist(), track["lon"].tolist(), result["matches"])):
+                if match is None:
+                    writer.writerow([i, lat, lon, "", "", ""])
+                else:
+                    writer.writerow([i, lat, lon, round(match["chainage"], 1), round(match["distance"], 1), match["segment"]])
+        print(f"已寫出 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
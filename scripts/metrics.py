@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API 請求統計
+每個執行緒寫入自己的計數分片，請求路徑上不需要取得任何鎖；
+輸出時才合併所有分片，產生 Prometheus 文字格式。
+"""
+
+import threading
+from bisect import bisect_left
+
+# 請求延遲（秒）與儲存內容大小（位元組）的直方圖區間
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20)
+
+
+def format_labels(labels) -> str:
+    """(("endpoint", "/api/routes"), ...) → {endpoint="/api/routes",...}"""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _new_shard() -> dict:
+    return {"counters": {}, "histograms": {}}
+
+
+def _add_shard(total: dict, shard: dict) -> None:
+    """把分片的計數與直方圖加進 total（讀取複本，分片可能正被其他執行緒修改）"""
+    counters = total["counters"]
+    histograms = total["histograms"]
+    for key, value in shard["counters"].copy().items():
+        counters[key] = counters.get(key, 0) + value
+    for key, histogram in shard["histograms"].copy().items():
+        merged = histograms.get(key)
+        if merged is None:
+            merged = histograms[key] = {
+                "buckets": histogram["buckets"],
+                "counts": [0] * len(histogram["counts"]),
+                "sum": 0.0,
+            }
+        for index, count in enumerate(list(histogram["counts"])):
+            merged["counts"][index] += count
+        merged["sum"] += histogram["sum"]
+
+
+class Metrics:
+    """
+    以執行緒分片的計數器與直方圖。
+
+    inc / observe 只修改目前執行緒的分片；render 讀取各分片的複本，
+    合併結果可能與正在進行中的請求差一筆，但不會影響請求延遲。
+    已結束的執行緒（例如每個請求一個執行緒的開發伺服器）的分片會併入 _retired 後移除，
+    分片數只與同時存在的執行緒數有關。
+    多個 worker 行程各自統計，輸出中的數值只代表回應的那個行程。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []  # [(執行緒, 分片)]
+        self._retired = _new_shard()  # 已結束執行緒的累計
+        self._shards_lock = threading.Lock()
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name: str, metric_type: str, help_text: str) -> None:
+        """登記指標的類型與說明（輸出 # HELP / # TYPE）"""
+        self._help[name] = (metric_type, help_text)
+
+    def add_collector(self, collect) -> None:
+        """
+        登記輸出時才呼叫的收集函式，用來讀取快取等物件自己維護的數值。
+        collect() 回傳 [(名稱, labels, 數值), ...]
+        """
+        self._collectors.append(collect)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            # 每個執行緒只在第一次記錄時登記分片
+            shard = _new_shard()
+            with self._shards_lock:
+                self._retire_dead()
+                self._shards.append((threading.current_thread(), shard))
+            self._local.shard = shard
+        return shard
+
+    def _retire_dead(self) -> None:
+        """把已結束執行緒的分片併入 _retired（呼叫時需持有 _shards_lock）"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                # 執行緒已結束，分片不會再被修改
+                _add_shard(self._retired, shard)
+        self._shards = alive
+
+    def inc(self, name: str, labels=(), value=1) -> None:
+        """計數器加上 value"""
+        counters = self._shard()["counters"]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, labels, value, buckets=LATENCY_BUCKETS) -> None:
+        """在直方圖中記錄一個觀測值"""
+        histograms = self._shard()["histograms"]
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = {
+                "buckets": buckets,
+                "counts": [0] * (len(buckets) + 1),
+                "sum": 0.0,
+            }
+        histogram["counts"][bisect_left(buckets, value)] += 1
+        histogram["sum"] += value
+
+    def _merged(self):
+        """合併所有執行緒分片"""
+        total = _new_shard()
+        with self._shards_lock:
+            self._retire_dead()
+            _add_shard(total, self._retired)
+            shards = [shard for _, shard in self._shards]
+
+        for shard in shards:
+            _add_shard(total, shard)
+        return total["counters"], total["histograms"]
+
+    def render(self) -> str:
+        """輸出 Prometheus 文字格式"""
+        counters, histograms = self._merged()
+
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append((name, labels, value))
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                samples.setdefault(name, []).append((name, labels, value))
+
+        for (name, labels), histogram in histograms.items():
+            rows = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                cumulative += count
+                rows.append((f"{name}_bucket", labels + (("le", format_value(float(bound))),), cumulative))
+            cumulative += histogram["counts"][-1]
+            rows.append((f"{name}_bucket", labels + (("le", "+Inf"),), cumulative))
+            rows.append((f"{name}_sum", labels, histogram["sum"]))
+            rows.append((f"{name}_count", labels, cumulative))
+
+        lines = []
+        for name in sorted(samples):
+            if name in self._help:
+                metric_type, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples[name]:
+                lines.append(f"{sample_name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
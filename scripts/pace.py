@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+步行速度模型：為沒有時間的路線合成時間
+已改好的txt_geojson 的路線沒有時間，切分段、特徵與 GPX 也就沒有時間可用。
+這裡依累積水平距離與海拔變化，以步行速度模型一次算出整條路線每個點的時間。
+
+  tobler    Tobler 登山函數：水平速度 6·exp(-3.5·|坡度 + 0.05|) km/h
+  naismith  Naismith 法則：水平每 5 km 1 小時、每上升 600 m 加 1 小時；
+            下坡依 Langmuir 修正（5°–12° 每下降 300 m 減 10 分鐘，超過 12° 加 10 分鐘）
+
+模型時間再乘上校正係數：data_raw/gpx 中有時間的路線，實際經過時間 / 模型時間（各路線的中位數）。
+相鄰兩點相隔超過 MAX_GAP 的區間（過夜、暫停記錄）不列入校正，較短的休息則包含在係數中。
+`python pace.py --calibrate` 把係數寫入 pace_calibration.json，pipeline 與 geojson_to_gpx 會讀取。
+
+路線中已有時間的點保留原值並作為錨點：錨點之間依模型時間的比例分配，
+錨點之前、之後依模型時間（乘上係數）往前、往後推算；完全沒有時間時由 start 起算。
+
+    python pace.py --calibrate
+    python pace.py mt_jade_main --model naismith
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from geodesy import chainage, consecutive_distances
+
+MODELS = ("tobler", "naismith")
+DEFAULT_MODEL = "tobler"
+
+CALIBRATION_NAME = "pace_calibration.json"
+
+# 完全沒有時間的路線預設的出發時間（台灣時間早上 6 點）
+DEFAULT_START = "2000-01-01T06:00:00+08:00"
+
+# 校正時略過的區間（秒）：超過此間隔多半是過夜或暫停記錄
+MAX_GAP = 1800.0
+
+# Tobler 坡度上限（45°）：相鄰點水平距離很短時，海拔誤差會造成不合理的坡度
+MAX_GRADE = 1.0
+
+
+def segment_seconds(distances, rises, model=DEFAULT_MODEL) -> np.ndarray:
+    """
+    各區間的模型步行時間（秒，未校正）。
+    distances: 水平距離（公尺）；rises: 海拔變化（公尺，上升為正）
+    """
+    distances = np.asarray(distances, dtype=float)
+    rises = np.asarray(rises, dtype=float)
+    if model == "tobler":
+        grade = np.divide(rises, distances, out=np.zeros_like(distances), where=distances > 0)
+        grade = np.clip(grade, -MAX_GRADE, MAX_GRADE)
+        speed = 6.0 / 3.6 * np.exp(-3.5 * np.abs(grade + 0.05))
+        return distances / speed
+    if model == "naismith":
+        seconds = distances / (5000.0 / 3600.0) + np.maximum(rises, 0.0) / 600.0 * 3600.0
+        descent = np.maximum(-rises, 0.0)
+        angle = np.degrees(np.arctan2(descent, distances))
+        langmuir = np.where(angle > 12.0, 1.0, np.where(angle >= 5.0, -1.0, 0.0))
+        return np.maximum(seconds + langmuir * descent / 300.0 * 600.0, 0.0)
+    raise ValueError(f"不支援的速度模型: {model}")
+
+
+def model_seconds(lats, lons, elevations, model=DEFAULT_MODEL) -> np.ndarray:
+    """
+    由起點起算的累積模型時間（秒，未校正），長度與點數相同。
+    缺少海拔的點依累積里程內插；整條路線都沒有海拔時視為平地。
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    elevations = np.asarray(elevations, dtype=float)
+    if len(lats) < 2:
+        return np.zeros(len(lats))
+    distances = consecutive_distances(lats, lons)
+    valid = np.isfinite(elevations)
+    if not valid.any():
+        elevations = np.zeros(len(lats))
+    elif not valid.all():
+        positions = chainage(lats, lons)
+        elevations = np.interp(positions, positions[valid], elevations[valid])
+    distances = np.nan_to_num(distances)
+    return np.concatenate([[0.0], np.cumsum(segment_seconds(distances, np.diff(elevations), model))])
+
+
+def fill_times(times, cumulative, factor=1.0, start=None) -> np.ndarray:
+    """
+    補上缺少的時間（epoch 秒，NaN 為缺值），回傳新的陣列。
+    cumulative: 累積模型時間（model_seconds）
+    start: 完全沒有時間時的出發時間（epoch 秒，預設 DEFAULT_START）
+    """
+    times = np.asarray(times, dtype=float)
+    cumulative = np.asarray(cumulative, dtype=float)
+    known = np.flatnonzero(np.isfinite(times))
+    if len(known) == 0:
+        return (parse_start(DEFAULT_START) if start is None else start) + cumulative * factor
+
+    filled = times.copy()
+    missing = ~np.isfinite(times)
+    first, last = known[0], known[-1]
+    # 錨點之間依模型時間的比例分配
+    inside = missing & (np.arange(len(times)) > first) & (np.arange(len(times)) < last)
+    filled[inside] = np.interp(cumulative[inside], cumulative[known], times[known])
+    # 第一個錨點之前、最後一個錨點之後依模型時間推算
+    filled[:first] = times[first] - (cumulative[first] - cumulative[:first]) * factor
+    filled[last + 1:] = times[last] + (cumulative[last + 1:] - cumulative[last]) * factor
+    return filled
+
+
+def parse_start(text: str) -> float:
+    """ISO 8601 出發時間 → epoch 秒（未註明時區時視為 UTC）"""
+    from datetime import datetime, timezone
+
+    start = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return start.timestamp()
+
+
+def format_seconds(seconds) -> list:
+    """epoch 秒 → 與 pandas.Timestamp(tz="UTC").isoformat() 相同格式的字串（取至整秒）"""
+    from points_table import format_times
+
+    return format_times(np.round(np.asarray(seconds, dtype=float)).astype(np.int64) * 1_000_000_000)
+
+
+def _epoch_seconds(values) -> np.ndarray:
+    """ISO 8601 字串（缺值為 NaN/None/空字串/N/A）→ epoch 秒，無法解析者為 NaN"""
+    import pandas as pd
+
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors="coerce", format="ISO8601")
+    seconds = (parsed - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+    return seconds.to_numpy(dtype=float)
+
+
+def pace_points(df, model=DEFAULT_MODEL, factor=1.0, start=None):
+    """
+    為路線點位（points.txt 的 DataFrame）補上時間。
+    回傳 (新的 DataFrame, {"points", "synthesized", "duration"（秒）})
+    """
+    import pandas as pd
+
+    lats = pd.to_numeric(df["緯度"], errors="coerce").to_numpy(dtype=float)
+    lons = pd.to_numeric(df["經度"], errors="coerce").to_numpy(dtype=float)
+    elevations = pd.to_numeric(df["海拔（約）"], errors="coerce").to_numpy(dtype=float)
+    if "時間" in df.columns:
+        times = _epoch_seconds(df["時間"].tolist())
+    else:
+        times = np.full(len(df), np.nan)
+
+    filled = fill_times(times, model_seconds(lats, lons, elevations, model), factor, start)
+    synthesized = ~np.isfinite(times)
+    result = df.copy()
+    if "時間" not in result.columns:
+        result["時間"] = np.nan
+    result["時間"] = result["時間"].astype(object)
+    result.loc[synthesized, "時間"] = np.array(format_seconds(filled[synthesized]), dtype=object)
+    stats = {
+        "points": len(df),
+        "synthesized": int(synthesized.sum()),
+        "duration": float(filled[-1] - filled[0]) if len(filled) else 0.0,
+    }
+    return result, stats
+
+
+def fill_point_times(points, model=DEFAULT_MODEL, factor=1.0, start=None):
+    """為 {"lat", "lon", "elevation", "time"} 點位清單（依路線順序）補上缺少的時間，直接修改並回傳清單"""
+    import pandas as pd
+
+    if not points or all(point.get("time") for point in points):
+        return points
+    lats = [point["lat"] for point in points]
+    lons = [point["lon"] for point in points]
+    elevations = pd.to_numeric(pd.Series([point.get("elevation") for point in points], dtype=object), errors="coerce")
+    times = _epoch_seconds([point.get("time") or None for point in points])
+    filled = fill_times(times, model_seconds(lats, lons, elevations.to_numpy(dtype=float), model), factor, start)
+    missing = np.flatnonzero(~np.isfinite(times))
+    for i, text in zip(missing.tolist(), format_seconds(filled[missing])):
+        points[i]["time"] = text
+    return points
+
+
+def track_ratio(track: dict, model=DEFAULT_MODEL):
+    """有時間的軌跡：(實際經過時間, 模型時間)（秒），略過超過 MAX_GAP 的區間；時間不足時回傳 None"""
+    times = track["time"]
+    valid = np.isfinite(times) & np.isfinite(track["lat"]) & np.isfinite(track["lon"])
+    if valid.sum() < 2:
+        return None
+    lats, lons, times = track["lat"][valid], track["lon"][valid], times[valid]
+    elevations = track["elevation"][valid]
+    steps = np.diff(model_seconds(lats, lons, elevations, model))
+    elapsed = np.diff(times)
+    moving = (elapsed >= 0) & (elapsed <= MAX_GAP)
+    if not moving.any() or steps[moving].sum() <= 0:
+        return None
+    return float(elapsed[moving].sum()), float(steps[moving].sum())
+
+
+def calibrate(base_dir: Path, routes=None) -> dict:
+    """
+    以 data_raw/gpx 中有時間的路線校正各模型。
+    回傳 {"models": {模型: 係數}, "routes": {路線: {模型: 比值}}}
+    """
+    from route_qa import read_gpx_track
+
+    gpx_dir = Path(base_dir) / "data_raw" / "gpx"
+    files = [gpx_dir / f"{name}.gpx" for name in routes] if routes else sorted(gpx_dir.glob("*.gpx"))
+    ratios = {}
+    for path in files:
+        if not path.exists():
+            print(f"  找不到 {path}")
+            continue
+        track = read_gpx_track(path)
+        for model in MODELS:
+            result = track_ratio(track, model)
+            if result is not None:
+                ratios.setdefault(path.stem, {})[model] = result[0] / result[1]
+
+    models = {}
+    for model in MODELS:
+        values = [route[model] for route in ratios.values() if model in route]
+        if values:
+            models[model] = float(np.median(values))
+    return {"models": models, "routes": ratios}
+
+
+def load_calibration(base_dir: Path) -> dict:
+    """讀取 pace_calibration.json 的 {模型: 係數}；沒有校正檔時回傳空字典"""
+    path = Path(base_dir) / CALIBRATION_NAME
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("models", {})
+
+
+def format_duration(seconds: float) -> str:
+    minutes = int(round(seconds / 60))
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以步行速度模型估算路線時間，或以有時間的 GPX 校正模型")
+    parser.add_argument("routes", nargs="*", help="路線名稱（預設為全部）")
+    parser.add_argument("--base-dir", default=os.environ.get("GPX_TOOL_BASE_DIR", "."),
+                        help="專案資料根目錄（預設為目前目錄）")
+    parser.add_argument("--model", choices=MODELS, default=DEFAULT_MODEL, help="速度模型")
+    parser.add_argument("--calibrate", action="store_true",
+                        help=f"以 data_raw/gpx 中有時間的路線校正，寫入 {CALIBRATION_NAME}")
+    args = parser.parse_args()
+    base_dir = Path(args.base_dir)
+
+    if args.calibrate:
+        result = calibrate(base_dir, args.routes or None)
+        if not result["models"]:
+            print("沒有可用於校正的有時間路線")
+            return
+        print(f"  {'路線':<20}" + "".join(f"{model:>10}" for model in MODELS))
+        for route_name, ratios in sorted(result["routes"].items()):
+            print(f"  {route_name:<22}" + "".join(f"{ratios.get(model, float('nan')):>10.2f}" for model in MODELS))
+        print(f"  {'中位數':<19}" + "".join(f"{result['models'].get(model, float('nan')):>10.2f}" for model in MODELS))
+        with open(base_dir / CALIBRATION_NAME, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"已寫入 {base_dir / CALIBRATION_NAME}")
+        return
+
+    from points_table import load_points
+
+    factor = load_calibration(base_dir).get(args.model)
+    if factor is None:
+        print(f"沒有 {CALIBRATION_NAME}，使用未校正的模型（可先執行 --calibrate）")
+        factor = 1.0
+    source_dir = base_dir / "已改好的txt_geojson"
+    routes = args.routes or sorted(path.name for path in source_dir.iterdir() if path.is_dir())
+    print(f"{args.model}（校正係數 {factor:.2f}）")
+    print(f"  {'路線':<18}{'點數':>6}{'距離 km':>10}{'估計時間':>10}{'計算 ms':>10}")
+    for route_name in routes:
+        if not (source_dir / route_name / "points.txt").exists():
+            print(f"  找不到 {route_name} 的 points.txt")
+            continue
+        df = load_points(source_dir / route_name)
+        started = time.perf_counter()
+        _, stats = pace_points(df, args.model, factor)
+        elapsed = (time.perf_counter() - started) * 1000
+        distance = chainage(df["緯度"].to_numpy(dtype=float), df["經度"].to_numpy(dtype=float))[-1]
+        print(
+            f"  {route_name:<20}{stats['points']:>6}{distance / 1000:>10.2f}"
+            f"{format_duration(stats['duration']):>10}{elapsed:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
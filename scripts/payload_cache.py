@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壓縮回應快取
+將路線 JSON 精簡化並預先 gzip 壓縮，依內容雜湊產生強 ETag，
+來源檔案的 mtime 或大小改變時才重新產生。
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def build_payload(body: bytes) -> dict:
+    """由未壓縮內容建立快取項目（原始內容、gzip 內容與 ETag）"""
+    digest = hashlib.sha256(body).hexdigest()
+    return {
+        "identity": body,
+        "gzip": gzip.compress(body, compresslevel=6, mtime=0),
+        "etag": digest,
+    }
+
+
+def minify_json_file(file_path, load=None) -> bytes:
+    """讀取 JSON 檔案並以精簡格式重新序列化；load 可指定讀取函式（例如轉換 GeoJSON 格式）"""
+    if load is not None:
+        data = load(file_path)
+    else:
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class PayloadCache:
+    """
+    以 (key, 來源檔案狀態) 為鍵的 LRU 快取。
+
+    max_entries: 最多保留的項目數量
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 命中統計（在既有的鎖內更新）
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, source_paths, build):
+        """
+        取得快取項目；來源檔案變動時呼叫 build() 取得未壓縮內容並重建。
+
+        source_paths: 決定快取是否失效的來源檔案清單
+        build: 回傳 bytes 的函式
+        """
+        stats = [os.stat(path) for path in source_paths]
+        version = tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["version"] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = build_payload(build())
+        entry["version"] = version
+
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
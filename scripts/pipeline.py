@@ -0,0 +1,569 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+整合的路線處理流程
+以一個指令依序執行 route_qa → pt_process →（dem → simplify → pace）→ route_splitter → feature → simple_update_all → geojson_to_gpx，
+階段之間以記憶體中的路線資料傳遞，只寫出指定的產出。
+
+階段：
+  qa        檢查 data_raw/gpx 的時間、速度與海拔錯誤 → qa_report.csv（只回報，修復請用 route_qa.py --repair）
+  process   data_raw → data_work（路線 A/B，供人工編輯，不是後續階段的輸入）
+  dem       （加上 --dem 才執行）以本機 DEM 修正 已改好的txt_geojson 點位的海拔，交給後續階段使用；
+            不修改來源檔案
+  simplify  （加上 --simplify 才執行）以 3D Douglas-Peucker 簡化 已改好的txt_geojson 的點位，
+            交給 split 使用，並把點數與特徵變化寫入 simplify_report.csv；不修改來源檔案
+  pace      （加上 --pace 才執行）以步行速度模型為沒有時間的點位合成時間，交給 split 使用，
+            切分段因此有時間，features 會多出 duration_minutes、average_speed_kmh；
+            gpx 階段也會補上時間。校正係數取自 pace_calibration.json（見 pace.py --calibrate）
+  split     已改好的txt_geojson → 切分段與往返路線（最終json_txt）
+  features  切分段 → feature_report.csv（--resample 時坡度與海拔特徵以固定間距重新取樣後計算）
+  poi       feature_report + FINAL_POI.csv → feature_report_final.csv
+  gpx       已改好的txt_geojson → 修改好的gpx
+
+未在本次執行的前一階段，其結果改由磁碟讀取（例如 --from features 會讀取 最終json_txt）。
+
+用法：
+  python scripts/pipeline.py
+  python scripts/pipeline.py --from split --to poi
+  python scripts/pipeline.py --routes mt_jade_main --write feature_report_final
+  python scripts/pipeline.py --incremental      # 只重建輸入或程式有變動的路線
+  python scripts/pipeline.py --simplify --max-offset 3 --max-vertical 2
+  python scripts/pipeline.py --dem ../dem/taiwan_20m.tif --dem-mode blend --dem-weight 0.8
+  python scripts/pipeline.py --from split --to poi --resample 10
+  python scripts/pipeline.py --pace naismith --pace-start 2024-06-01T05:30:00+08:00
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# 各階段的模組（及其 NumPy、pandas 相依）在階段執行時才匯入，讓 --help 與只跑 gpx 的指令快速啟動
+from geojson_layout import as_written, existing_geojson, load_geojson, plain_path
+from build_graph import GLOBAL_KEY, BuildGraph
+
+# 讓 simple_update_all（位於專案根目錄）可以被匯入
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+STAGES = ("qa", "process", "dem", "simplify", "pace", "split", "features", "poi", "gpx")
+
+# 產出名稱 → 產生它的階段
+ARTIFACTS = {
+    "qa_report": "qa",
+    "data_work": "process",
+    "simplify_report": "simplify",
+    "segments": "split",  # 最終json_txt/1.切分過的路線
+    "roundtrip": "split",  # 最終json_txt/2.往前重複的geojson、3.往前重複的txt
+    "feature_report": "features",
+    "feature_report_final": "poi",
+    "gpx": "gpx",
+}
+
+
+class Pipeline:
+    """
+    在記憶體中串接各處理階段。
+
+    base_dir: 專案資料根目錄
+    routes: 只處理這些路線（None 表示全部）
+    write: 要寫出的產出名稱（見 ARTIFACTS）
+    simplify: simplify 階段的 (max_offset, max_vertical)，單位公尺
+    resample: features 階段重新取樣的間距（公尺），None 表示使用原始點位
+    dem: dem 階段的 {"path", "mode", "weight", "crs"}（見 dem.correct_elevations）
+    pace: pace 與 gpx 階段合成時間的 {"model", "factor"[, "start"]}（見 pace.pace_points）
+    """
+
+    def __init__(self, base_dir, routes=None, write=None, simplify=None, resample=None, dem=None, pace=None):
+        self.base_dir = Path(base_dir)
+        self.routes = list(routes) if routes else None
+        self.write = set(ARTIFACTS if write is None else write)
+        self.simplify = simplify
+        self.resample = resample
+        self.dem = dem
+        self.pace = pace
+
+        self.source_dir = self.base_dir / "已改好的txt_geojson"
+        self.output_base = self.base_dir / "最終json_txt"
+        self.segments_dir = self.output_base / "1.切分過的路線"
+        self.report_path = self.base_dir / "feature_report.csv"
+        self.final_report_path = self.base_dir / "feature_report_final.csv"
+        self.qa_report_path = self.base_dir / "qa_report.csv"
+        self.simplify_report_path = self.base_dir / "simplify_report.csv"
+
+        # 階段之間傳遞的資料
+        self.sources = {}  # {路線: (修正或簡化後的 points DataFrame, 原始通訊點)}
+        self.segments = None  # {路線: [{"filename", "geojson"}...]}
+        self.report = None  # feature_report DataFrame
+        # 各階段成功處理的路線（供 build_graph 記錄）
+        self.completed = {}
+
+    def _route_names(self, folder: Path, pattern=None) -> list:
+        if self.routes:
+            return self.routes
+        if not folder.is_dir():
+            return []
+        if pattern:
+            return sorted(path.stem for path in folder.glob(pattern))
+        return sorted(path.name for path in folder.iterdir() if path.is_dir())
+
+    def run_qa(self) -> None:
+        from route_qa import list_sources, print_summary, scan_files, summarize, write_report
+
+        rows = [
+            summarize(route_name, track, issues)
+            for route_name, track, issues in scan_files(list_sources(self.base_dir, "raw", self.routes))
+        ]
+        print_summary(rows)
+        self.completed["qa"] = [row["route"] for row in rows]
+        if "qa_report" in self.write and rows:
+            # 只檢查部分路線時，保留報告中其他路線的列
+            write_report(self.qa_report_path, rows, keep_existing=bool(self.routes))
+            print(f"報告已儲存至 {self.qa_report_path}")
+
+    def run_process(self) -> None:
+        from pt_process import build_work_routes, export_work_routes
+
+        raw_gpx_folder = self.base_dir / "data_raw" / "gpx"
+        raw_txt_folder = self.base_dir / "data_raw" / "txt"
+        work_folder = self.base_dir / "data_work"
+
+        self.completed["process"] = []
+        for base in self._route_names(raw_gpx_folder, "*.gpx"):
+            gpx_file = raw_gpx_folder / f"{base}.gpx"
+            txt_file = raw_txt_folder / f"{base}.txt"
+            if not gpx_file.exists() or not txt_file.exists():
+                print(f"缺少 {base} 的 GPX 或 TXT 檔案")
+                continue
+
+            print(f"\n處理中: {gpx_file.name}")
+            try:
+                routes = build_work_routes(gpx_file, txt_file)
+                if routes is None:
+                    continue
+                if "data_work" in self.write:
+                    export_work_routes(routes, work_folder, base)
+                self.completed["process"].append(base)
+            except Exception as e:
+                print(f"處理 {gpx_file.name} 時發生錯誤: {str(e)}")
+
+    def _route_source(self, route_name: str):
+        """split 的輸入：前面的階段處理過的點位，或由 已改好的txt_geojson 讀取"""
+        from route_splitter import load_route_source
+
+        if route_name in self.sources:
+            return self.sources[route_name]
+        return load_route_source(route_name, self.source_dir, self.base_dir / "data_raw" / "txt")
+
+    def run_dem(self) -> None:
+        from dem import DemRaster, correct_points
+
+        dem = DemRaster(self.dem["path"], crs=self.dem.get("crs"))
+        mode, weight = self.dem.get("mode", "replace"), self.dem.get("weight", 1.0)
+        print(f"DEM: {dem.path}（{dem.width}×{dem.height}，EPSG:{dem.crs}），{mode}")
+        self.completed["dem"] = []
+        rows = []
+        try:
+            for route_name in self._route_names(self.source_dir):
+                source = self._route_source(route_name)
+                if source is None:
+                    continue
+                df, original_comm_points = source
+                corrected, stats = correct_points(df, dem, mode, weight)
+                self.sources[route_name] = (corrected, original_comm_points)
+                self.completed["dem"].append(route_name)
+                rows.append((route_name, stats))
+        finally:
+            dem.close()
+
+        print(f"\n  {'路線':<18}{'點數':>6}{'DEM 有值':>10}{'GPS−DEM 平均':>14}{'|差| 95%':>10}")
+        for route_name, stats in rows:
+            print(
+                f"  {route_name:<20}{stats['points']:>6}{stats['sampled']:>10}"
+                f"{stats['mean_diff']:>+14.1f}{stats['p95_abs_diff']:>10.1f}"
+            )
+            if stats["sampled"] < stats["points"]:
+                print(f"    {stats['points'] - stats['sampled']} 點在 DEM 範圍外或無值，保留原本的海拔")
+
+    def run_simplify(self) -> None:
+        from simplify import DEFAULT_MAX_OFFSET, DEFAULT_MAX_VERTICAL, simplify_points
+
+        max_offset, max_vertical = self.simplify or (DEFAULT_MAX_OFFSET, DEFAULT_MAX_VERTICAL)
+        rows = []
+        self.completed["simplify"] = []
+        for route_name in self._route_names(self.source_dir):
+            print(f"\n簡化 {route_name}")
+            source = self._route_source(route_name)
+            if source is None:
+                continue
+            df, original_comm_points = source
+            simplified, stats = simplify_points(df, max_offset, max_vertical)
+            self.sources[route_name] = (simplified, original_comm_points)
+            self.completed["simplify"].append(route_name)
+            rows.append({
+                "route": route_name,
+                "max_offset": max_offset,
+                "max_vertical": max_vertical,
+                "points": stats.pop("points"),
+                "kept": stats.pop("kept"),
+                "reduction": round(1 - len(simplified) / len(df), 4),
+                **{key: round(value, 4 if key == "max_segment_distance_change" else 2) for key, value in stats.items()},
+            })
+
+        if not rows:
+            return
+        print(f"\n簡化結果（水平 {max_offset} m、垂直 {max_vertical} m）:")
+        print(f"  {'路線':<18}{'點數':>12}{'減少':>8}{'distance':>10}{'gain':>10}{'最大段差 距離/爬升':>18}")
+        for row in rows:
+            distance = row["distance_simplified"] / row["distance"] - 1 if row["distance"] else 0.0
+            gain = row["elevation_gain_simplified"] - row["elevation_gain"]
+            print(
+                f"  {row['route']:<20}{row['points']:>6} → {row['kept']:<4}{row['reduction']:>8.1%}"
+                f"{distance:>+10.2%}{gain:>+9.1f}m"
+                f"{row['max_segment_distance_change']:>10.2%} {row['max_segment_gain_change']:>6.1f}m"
+            )
+
+        if "simplify_report" in self.write:
+            import pandas as pd
+
+            report = pd.DataFrame(rows)
+            if self.routes and self.simplify_report_path.exists():
+                # 只處理部分路線時，保留報告中其他路線的列
+                existing = pd.read_csv(self.simplify_report_path, encoding="utf-8-sig")
+                existing = existing[~existing["route"].isin(report["route"])]
+                report = pd.concat([existing, report], ignore_index=True).sort_values("route")
+            report.to_csv(self.simplify_report_path, index=False, encoding="utf-8-sig")
+            print(f"報告已儲存至 {self.simplify_report_path}")
+
+    def run_pace(self) -> None:
+        from pace import format_duration, pace_points
+
+        model, factor = self.pace["model"], self.pace["factor"]
+        print(f"速度模型: {model}（校正係數 {factor:.2f}）")
+        self.completed["pace"] = []
+        rows = []
+        for route_name in self._route_names(self.source_dir):
+            source = self._route_source(route_name)
+            if source is None:
+                continue
+            df, original_comm_points = source
+            paced, stats = pace_points(df, model, factor, self.pace.get("start"))
+            self.sources[route_name] = (paced, original_comm_points)
+            self.completed["pace"].append(route_name)
+            rows.append((route_name, stats))
+
+        print(f"\n  {'路線':<18}{'點數':>6}{'合成時間':>10}{'總時間':>10}")
+        for route_name, stats in rows:
+            print(
+                f"  {route_name:<20}{stats['points']:>6}{stats['synthesized']:>10}"
+                f"{format_duration(stats['duration']):>10}"
+            )
+
+    def run_split(self) -> None:
+        from route_splitter import split_route, write_split_outputs
+
+        self.segments = {}
+        self.completed["split"] = []
+        write_segments = "segments" in self.write
+        write_roundtrip = "roundtrip" in self.write
+
+        for route_name in self._route_names(self.source_dir):
+            print(f"\n處理 {route_name}")
+            source = self._route_source(route_name)
+            if source is None:
+                continue
+
+            result = split_route(route_name, *source, pace=self.pace)
+            if write_segments or write_roundtrip:
+                write_split_outputs(
+                    route_name, result, self.output_base, write_segments, write_roundtrip
+                )
+            # 與寫出後再讀回的內容相同（依輸出設定取捨精度），但不經過序列化
+            self.segments[route_name] = [
+                {"filename": part["filename"], "geojson": as_written(part["geojson"])}
+                for part in result["segments"]
+            ]
+            self.completed["split"].append(route_name)
+
+    def _load_segments(self, routes) -> dict:
+        """由 最終json_txt 讀取切分段（未在本次 split 階段處理的路線）"""
+        from feature import collect_geojson_files
+
+        segments = {}
+        for file_info in collect_geojson_files(self.segments_dir, routes):
+            segments.setdefault(file_info["route_folder"], []).append(
+                {"filename": file_info["filename"], "geojson": load_geojson(file_info["filepath"])}
+            )
+        return segments
+
+    def run_features(self) -> None:
+        from feature import build_report, calculate_geojson_features, extract_part_number, merge_report_rows
+
+        segments = dict(self.segments or {})
+        routes = self._route_names(self.segments_dir)
+        if not self.routes:
+            # split 未寫出時，記憶體中的路線可能還不在磁碟上
+            routes = sorted(set(routes) | set(segments))
+        missing = [route_name for route_name in routes if route_name not in segments]
+        if missing:
+            print(f"讀取切分段: {self.segments_dir}（{len(missing)} 條路線）")
+            segments.update(self._load_segments(missing))
+
+        if self.resample:
+            print(f"坡度與海拔特徵以 {self.resample:g} 公尺間距重新取樣後計算")
+        results = []
+        self.completed["features"] = []
+        for route_name in routes:
+            if route_name not in segments:
+                continue
+            self.completed["features"].append(route_name)
+            parts = sorted(
+                segments[route_name],
+                key=lambda part: extract_part_number(part["filename"]),
+            )
+            for part in parts:
+                features = calculate_geojson_features(part["geojson"], self.resample, self.pace is not None)
+                features["filename"] = plain_path(part["filename"]).name
+                features["route_folder"] = route_name
+                features["part_number"] = extract_part_number(part["filename"])
+                results.append(features)
+
+        if not results:
+            print("沒有可計算特徵的切分段")
+            return
+
+        report = build_report(results)
+        if self.routes and self.report_path.exists():
+            import pandas as pd
+
+            # 只處理部分路線時，保留報告中其他路線的列
+            existing = pd.read_csv(self.report_path, encoding="utf-8-sig")
+            report = merge_report_rows(existing, report, self.completed["features"])
+        self.report = report
+        print(f"計算了 {len(results)} 個切分段的特徵")
+
+        if "feature_report" in self.write:
+            report.to_csv(self.report_path, index=False, encoding="utf-8-sig")
+            print(f"報告已儲存至 {self.report_path}")
+
+    def run_poi(self) -> None:
+        import pandas as pd
+
+        from simple_update_all import attach_poi_ids
+
+        if self.report is None:
+            self.report = pd.read_csv(self.report_path, encoding="utf-8-sig")
+
+        poi_df = pd.read_csv(self.base_dir / "FINAL_POI.csv", encoding="utf-8-sig")
+        final_report, unmatched = attach_poi_ids(self.report, poi_df)
+        print(f"更新了 {len(final_report) - len(unmatched)} 筆記錄")
+        if not unmatched.empty:
+            print(f"有 {len(unmatched)} 筆記錄找不到對應的 POI")
+
+        if "feature_report_final" in self.write:
+            final_report.to_csv(self.final_report_path, index=False, encoding="utf-8-sig")
+            print(f"結果已儲存至 {self.final_report_path}")
+
+    def run_gpx(self) -> None:
+        from geojson_to_gpx import geojson_to_gpx
+
+        output_dir = self.base_dir / "修改好的gpx"
+        if "gpx" in self.write:
+            output_dir.mkdir(exist_ok=True)
+
+        self.completed["gpx"] = []
+        for route_name in self._route_names(self.source_dir):
+            geojson_file = existing_geojson(self.source_dir / route_name / "route.geojson")
+            if geojson_file is None:
+                print(f"  -> 找不到 {route_name} 的 route.geojson")
+                continue
+            gpx_content = geojson_to_gpx(load_geojson(geojson_file), f"{route_name}.gpx", self.pace)
+            if "gpx" in self.write:
+                with open(output_dir / f"{route_name}.gpx", "w", encoding="utf-8") as f:
+                    f.write(gpx_content)
+                print(f"  -> {route_name} 轉換完成")
+            self.completed["gpx"].append(route_name)
+
+    def run(self, stages) -> dict:
+        """依序執行階段，回傳各階段耗時（秒）"""
+        timings = {}
+        for stage in stages:
+            print(f"\n=== {stage} ===")
+            start = time.perf_counter()
+            getattr(self, f"run_{stage}")()
+            timings[stage] = time.perf_counter() - start
+        return timings
+
+    def run_incremental(self, stages, graph, dry_run=False) -> dict:
+        """
+        只重建過期的產出（見 build_graph），逐階段、逐路線判斷。
+        dry_run 時只列出目前已知過期的項目；上游重建後下游才會過期，因此可能少列。
+        """
+        selected = self.routes
+        timings = {}
+        for stage in stages:
+            # dem、simplify、pace 的結果只在記憶體中交給 split，跟著 split 重建（設定記錄在 split 的程式版本中）
+            target = "split" if stage in ("dem", "simplify", "pace") else stage
+            routes = graph.routes(target)
+            if selected and stage != "poi":
+                routes = [route for route in routes if route in selected]
+            stale = {}
+            for route in routes:
+                reason = graph.stale_reason(target, route)
+                if reason:
+                    stale[route] = reason
+
+            print(f"\n=== {stage}：{len(stale)}/{len(routes)} 需要重建 ===")
+            for route, reason in stale.items():
+                print(f"  {route}: {reason}")
+            if dry_run or not stale:
+                continue
+
+            start = time.perf_counter()
+            self.routes = None if stage == "poi" else list(stale)
+            getattr(self, f"run_{stage}")()
+            if stage in ("dem", "simplify", "pace"):
+                timings[stage] = time.perf_counter() - start
+                continue
+            done = [GLOBAL_KEY] if stage == "poi" else self.completed.get(stage, [])
+            for route in done:
+                graph.record(stage, route)
+            graph.save()
+            timings[stage] = time.perf_counter() - start
+
+        self.routes = selected
+        return timings
+
+
+def select_stages(first=None, last=None) -> tuple:
+    """取出 first 到 last（含）之間的階段"""
+    start = STAGES.index(first) if first else 0
+    end = STAGES.index(last) if last else len(STAGES) - 1
+    if start > end:
+        raise ValueError(f"--from {first} 在 --to {last} 之後")
+    return STAGES[start : end + 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="依序執行路線處理的各個階段")
+    parser.add_argument("--base-dir", default=os.environ.get("GPX_TOOL_BASE_DIR", "."),
+                        help="專案資料根目錄（預設為目前目錄或 GPX_TOOL_BASE_DIR）")
+    parser.add_argument("--from", dest="first", choices=STAGES, help="起始階段")
+    parser.add_argument("--to", dest="last", choices=STAGES, help="結束階段（含）")
+    parser.add_argument("--routes", nargs="+", help="只處理指定的路線名稱")
+    parser.add_argument("--write", nargs="+", choices=sorted(ARTIFACTS),
+                        help="只寫出這些產出（預設為所有執行階段的產出）")
+    parser.add_argument("--incremental", action="store_true",
+                        help="依建置紀錄只重建過期的路線與產出")
+    parser.add_argument("--dry-run", action="store_true", help="搭配 --incremental，只列出過期項目")
+    parser.add_argument("--simplify", action="store_true",
+                        help="split 之前以 3D Douglas-Peucker 簡化點位（通訊點及其前後點一律保留）")
+    parser.add_argument("--max-offset", type=float, help="simplify 的最大水平誤差（公尺，預設 3）")
+    parser.add_argument("--max-vertical", type=float, help="simplify 的最大海拔誤差（公尺，預設 2）")
+    parser.add_argument("--dem", metavar="PATH",
+                        help="split 之前以本機 DEM（GeoTIFF 或 .flt/.bil + .hdr）修正點位海拔")
+    parser.add_argument("--dem-mode", choices=["replace", "blend"], default="replace",
+                        help="replace：以 DEM 取代；blend：與 GPS 海拔加權平均")
+    parser.add_argument("--dem-weight", type=float, default=0.8, help="blend 時 DEM 的權重（0–1）")
+    parser.add_argument("--dem-crs", type=int, help="DEM 的 EPSG 代碼（預設由 GeoTIFF 判斷）")
+    parser.add_argument("--pace", nargs="?", const="tobler", choices=["tobler", "naismith"],
+                        help="split 之前以步行速度模型為沒有時間的點位合成時間（預設 tobler）")
+    parser.add_argument("--pace-start", help="完全沒有時間的路線的出發時間（ISO 8601，預設 2000-01-01T06:00:00+08:00）")
+    parser.add_argument("--resample", type=float, nargs="?", const=10.0, metavar="STEP",
+                        help="features 階段先以固定間距重新取樣再計算坡度與海拔特徵（公尺，預設 10）")
+    args = parser.parse_args()
+    if args.incremental and args.write:
+        parser.error("--incremental 會寫出所有產出，不能與 --write 同時使用")
+    if args.dry_run and not args.incremental:
+        parser.error("--dry-run 需搭配 --incremental")
+
+    if "simplify" in (args.first, args.last) and not args.simplify:
+        parser.error("simplify 階段需加上 --simplify")
+    if "dem" in (args.first, args.last) and not args.dem:
+        parser.error("dem 階段需加上 --dem")
+    if "pace" in (args.first, args.last) and not args.pace:
+        parser.error("pace 階段需加上 --pace")
+    if args.pace_start and not args.pace:
+        parser.error("--pace-start 需搭配 --pace")
+    if not 0 <= args.dem_weight <= 1:
+        parser.error("--dem-weight 必須在 0 到 1 之間")
+    if (args.max_offset is not None or args.max_vertical is not None) and not args.simplify:
+        parser.error("--max-offset、--max-vertical 需搭配 --simplify")
+    if args.resample is not None and args.resample <= 0:
+        parser.error("--resample 必須大於 0")
+
+    try:
+        stages = select_stages(args.first, args.last)
+    except ValueError as e:
+        parser.error(str(e))
+    simplify = None
+    if args.simplify:
+        from simplify import DEFAULT_MAX_OFFSET, DEFAULT_MAX_VERTICAL
+
+        simplify = (
+            DEFAULT_MAX_OFFSET if args.max_offset is None else args.max_offset,
+            DEFAULT_MAX_VERTICAL if args.max_vertical is None else args.max_vertical,
+        )
+        if min(simplify) <= 0:
+            parser.error("--max-offset、--max-vertical 必須大於 0")
+    else:
+        stages = tuple(stage for stage in stages if stage != "simplify")
+    dem = None
+    if args.dem:
+        dem_path = Path(args.dem).resolve()
+        if not dem_path.is_file():
+            parser.error(f"找不到 DEM 檔案: {dem_path}")
+        dem = {"path": str(dem_path), "mode": args.dem_mode, "weight": args.dem_weight, "crs": args.dem_crs}
+    else:
+        stages = tuple(stage for stage in stages if stage != "dem")
+    pace = None
+    if args.pace:
+        from pace import CALIBRATION_NAME, load_calibration, parse_start
+
+        factor = load_calibration(Path(args.base_dir)).get(args.pace)
+        if factor is None:
+            print(f"沒有 {CALIBRATION_NAME} 的 {args.pace} 校正係數，使用未校正的模型（可先執行 pace.py --calibrate）")
+            factor = 1.0
+        pace = {"model": args.pace, "factor": factor}
+        if args.pace_start:
+            try:
+                pace["start"] = parse_start(args.pace_start)
+            except ValueError:
+                parser.error(f"無法解析 --pace-start: {args.pace_start}")
+    else:
+        stages = tuple(stage for stage in stages if stage != "pace")
+
+    write = args.write
+    if write is None:
+        write = [name for name, stage in ARTIFACTS.items() if stage in stages]
+
+    pipeline = Pipeline(
+        args.base_dir, routes=args.routes, write=write, simplify=simplify, resample=args.resample, dem=dem, pace=pace
+    )
+    start = time.perf_counter()
+    if args.incremental:
+        # 簡化與重新取樣的設定會改變 split、features 的產出
+        options = {}
+        if simplify:
+            options.setdefault("split", {})["simplify"] = list(simplify)
+        if dem:
+            # DEM 以路徑、大小與修改時間代表，不必每次雜湊整個檔案
+            stat = dem_path.stat()
+            options.setdefault("split", {})["dem"] = {**dem, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if pace:
+            options.setdefault("split", {})["pace"] = pace
+            options["gpx"] = {"pace": pace}
+        if args.resample:
+            options["features"] = {"resample": args.resample}
+        timings = pipeline.run_incremental(stages, BuildGraph(args.base_dir, options), args.dry_run)
+    else:
+        timings = pipeline.run(stages)
+
+    print("\n各階段耗時:")
+    for stage, seconds in timings.items():
+        print(f"  {stage}: {seconds:.2f} 秒")
+    print(f"總計: {time.perf_counter() - start:.2f} 秒")
+
+
+if __name__ == "__main__":
+    main()
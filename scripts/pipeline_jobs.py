@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線處理背景工作佇列
+編輯器儲存路線後，由 API 排入單一路線的處理工作，
+在有限的 worker 中只執行該路線受影響的階段：
+promote（複製編輯結果）→ split（route_splitter）→ features（feature）→ poi（simple_update_all），
+以及 gpx（geojson_to_gpx）。
+"""
+
+import json
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from geojson_layout import existing_geojson
+from points_table import write_points_table
+from route_store import atomic_write_text, file_lock
+
+# 讓 simple_update_all（位於專案根目錄）可以被匯入
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# 階段執行順序
+STAGES = ("promote", "split", "features", "poi", "gpx")
+DEFAULT_STAGES = ("split", "features", "poi", "gpx")
+
+
+class QueueFullError(Exception):
+    """等待中的工作已達上限"""
+
+
+def stage_promote(base_dir: Path, route_name: str, route_type: str) -> None:
+    """把 修改後的檔案 中的編輯結果複製到 已改好的txt_geojson"""
+    edited_dir = base_dir / "修改後的檔案"
+    target_dir = base_dir / "已改好的txt_geojson" / route_name
+    sources = {
+        "points.txt": edited_dir / "txt" / f"{route_name}_route_{route_type}_edited.txt",
+        "route.geojson": edited_dir / "geojson" / f"{route_name}_route_{route_type}_edited.geojson",
+    }
+    for filename, source in sources.items():
+        if not source.exists():
+            raise FileNotFoundError(f"找不到編輯後的檔案: {source}")
+        atomic_write_text(target_dir / filename, source.read_text(encoding="utf-8"))
+    write_points_table(target_dir / "points.txt")
+
+
+def stage_split(base_dir: Path, route_name: str) -> None:
+    """切分路線並產生往返路線（最終json_txt）"""
+    from route_splitter import process_single_route
+
+    processed = process_single_route(
+        route_name,
+        base_dir / "最終json_txt",
+        source_dir=base_dir / "已改好的txt_geojson",
+        raw_txt_dir=base_dir / "data_raw" / "txt",
+    )
+    if not processed:
+        # 缺少 points.txt、route.geojson 或原始通訊點時，讓工作標記為失敗
+        raise RuntimeError(f"無法讀取 {route_name} 的路線資料或原始通訊點")
+
+
+def stage_features(base_dir: Path, route_name: str) -> None:
+    """
+    重新計算該路線的切分段特徵，並更新 feature_report.csv 中該路線的列
+    （沒有切分段時移除該路線的列）
+    """
+    from feature import calculate_file_features, collect_geojson_files, update_feature_report
+
+    target_path = base_dir / "最終json_txt" / "1.切分過的路線"
+    files = collect_geojson_files(target_path, [route_name])
+    results = [calculate_file_features(file_info) for file_info in files]
+    update_feature_report(base_dir / "feature_report.csv", route_name, results)
+
+
+def stage_poi(base_dir: Path, route_name: str) -> None:
+    """重新對應 POI，產生 feature_report_final.csv"""
+    import pandas as pd
+
+    from simple_update_all import attach_poi_ids
+
+    poi_df = pd.read_csv(base_dir / "FINAL_POI.csv", encoding="utf-8-sig")
+    feature_df = pd.read_csv(base_dir / "feature_report.csv", encoding="utf-8-sig")
+    feature_df, _ = attach_poi_ids(feature_df, poi_df)
+    feature_df.to_csv(base_dir / "feature_report_final.csv", index=False, encoding="utf-8-sig")
+
+
+def stage_gpx(base_dir: Path, route_name: str) -> None:
+    """重新產生該路線的 GPX"""
+    from geojson_to_gpx import convert_route
+
+    output_dir = base_dir / "修改好的gpx"
+    output_dir.mkdir(exist_ok=True)
+    convert_route(
+        {
+            "file_path": existing_geojson(base_dir / "已改好的txt_geojson" / route_name / "route.geojson"),
+            "route_name": route_name,
+            "output_name": f"{route_name}.gpx",
+        },
+        output_dir,
+    )
+
+
+# 會讀寫整個語料共用檔案（feature_report*.csv）的階段需要全域鎖
+SHARED_STAGES = {"features", "poi"}
+
+
+def run_stage(base_dir: Path, stage: str, route_name: str, route_type=None) -> None:
+    """執行單一階段"""
+    if stage == "promote":
+        stage_promote(base_dir, route_name, route_type)
+    elif stage == "split":
+        stage_split(base_dir, route_name)
+    elif stage == "features":
+        stage_features(base_dir, route_name)
+    elif stage == "poi":
+        stage_poi(base_dir, route_name)
+    elif stage == "gpx":
+        stage_gpx(base_dir, route_name)
+    else:
+        raise ValueError(f"未知的階段: {stage}")
+
+
+def ordered_stages(stages) -> tuple:
+    """依 STAGES 的順序排列並去除重複"""
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"未知的階段: {', '.join(sorted(unknown))}")
+    return tuple(stage for stage in STAGES if stage in set(stages))
+
+
+class JobQueue:
+    """
+    單一路線處理工作的佇列。
+
+    base_dir: 專案資料根目錄
+    max_workers: 同時執行的工作數
+    max_pending: 等待中工作的上限
+    state_dir: 工作狀態與鎖檔目錄；狀態會寫成 JSON，讓其他 API worker 行程也能查詢
+    """
+
+    def __init__(self, base_dir, max_workers=2, max_pending=100, max_history=200, state_dir=None):
+        self.base_dir = Path(base_dir)
+        self.state_dir = Path(state_dir) if state_dir else self.base_dir / ".pipeline_jobs"
+        self.max_pending = max_pending
+        self.max_history = max_history
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pending_by_route = {}
+
+    def _save(self, job: dict) -> None:
+        """寫入工作狀態（呼叫端需持有 self._lock）"""
+        atomic_write_text(self.state_dir / f"{job['id']}.json", json.dumps(job, ensure_ascii=False))
+
+    def submit(self, route_name: str, stages=None, route_type=None) -> dict:
+        """
+        排入工作。同一路線已有等待中的工作時合併階段，回傳同一個工作。
+        指定 route_type（a/b）時會先執行 promote 階段。
+        """
+        stages = list(stages or DEFAULT_STAGES)
+        if route_type:
+            stages.append("promote")
+        stages = ordered_stages(stages)
+
+        with self._lock:
+            job = self._pending_by_route.get(route_name)
+            if job is not None:
+                job["stages"] = list(ordered_stages(job["stages"] + list(stages)))
+                if route_type:
+                    job["route_type"] = route_type
+                job["merged"] += 1
+                self._save(job)
+                return dict(job)
+
+            pending = len(self._pending_by_route)
+            if pending >= self.max_pending:
+                raise QueueFullError(f"等待中的工作已達上限 ({pending})")
+
+            job = {
+                "id": uuid.uuid4().hex,
+                "route_name": route_name,
+                "route_type": route_type,
+                "stages": list(stages),
+                "status": "pending",
+                "current_stage": None,
+                "completed_stages": [],
+                "progress": 0.0,
+                "merged": 0,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._jobs[job["id"]] = job
+            self._pending_by_route[route_name] = job
+            self._save(job)
+            self._trim_history()
+
+        self._executor.submit(self._run, job["id"])
+        return dict(job)
+
+    def _trim_history(self) -> None:
+        """只保留最近的已結束工作（呼叫端需持有 self._lock）"""
+        finished = sorted(
+            (job for job in self._jobs.values() if job["status"] in ("done", "failed")),
+            key=lambda job: job["finished_at"],
+        )
+        for job in finished[: max(0, len(finished) - self.max_history)]:
+            del self._jobs[job["id"]]
+            (self.state_dir / f"{job['id']}.json").unlink(missing_ok=True)
+
+    def _update(self, job: dict, **changes) -> None:
+        with self._lock:
+            job.update(changes)
+            self._save(job)
+
+    def _run(self, job_id: str) -> None:
+        job = self._jobs[job_id]
+        route_name = job["route_name"]
+
+        # 同一路線同時只執行一個工作（跨行程）；等待期間工作維持 pending，可繼續合併
+        with file_lock(self.state_dir / "locks" / f"route_{route_name}.lock"):
+            with self._lock:
+                if self._pending_by_route.get(route_name) is job:
+                    del self._pending_by_route[route_name]
+                job.update(status="running", started_at=time.time())
+                stages = list(job["stages"])
+                self._save(job)
+
+            try:
+                for index, stage in enumerate(stages):
+                    self._update(job, current_stage=stage)
+                    if stage in SHARED_STAGES:
+                        with file_lock(self.state_dir / "locks" / "feature_report.lock"):
+                            run_stage(self.base_dir, stage, route_name, job["route_type"])
+                    else:
+                        run_stage(self.base_dir, stage, route_name, job["route_type"])
+                    self._update(
+                        job,
+                        completed_stages=stages[: index + 1],
+                        progress=round((index + 1) / len(stages), 3),
+                    )
+                self._update(job, status="done", current_stage=None, finished_at=time.time())
+            except Exception as e:
+                print(f"處理工作 {job_id}（{route_name}）失敗: {e}")
+                self._update(job, status="failed", error=str(e), finished_at=time.time())
+
+    def get(self, job_id: str):
+        """取得工作狀態；不在記憶體中時從狀態檔讀取（其他 worker 排入的工作）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        state_file = self.state_dir / f"{job_id}.json"
+        if len(job_id) != 32 or not state_file.exists():
+            return None
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def list(self) -> list:
+        """列出此行程中的工作（新的在前）"""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def shutdown(self, wait=True) -> None:
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線點位的型別化中間檔（points.bin）
+
+points.txt 的 順序 混有 "2(start)" 這類字串、海拔以 "N/A" 表示缺值，
+每次讀取都要重新解析文字。points.bin 以固定型別的欄位儲存同樣的內容，
+讀取時以 memory-map 直接取用，不需解析：
+
+  seq        int32    順序的數字部分
+  seq_label  int16    順序括號內的標記（類別編號，-1 為無）
+  lat, lon   float64
+  elevation  float64  缺值為 NaN
+  type       int16    類型（類別編號，-1 為缺值）
+  name       int16    名稱（類別編號，-1 為缺值）
+  time       int64    UTC epoch 奈秒，缺值為 TIME_MISSING；
+                      無法以原字串還原時改存固定寬度字串
+
+檔案結構：MAGIC、4 bytes 標頭長度、JSON 標頭（欄位位移、類別清單、來源 TSV 的 sha256），
+之後是對齊 16 bytes 的欄位資料。
+
+points.txt 仍是給人看與編輯器使用的格式。標頭記錄了產生時 points.txt 的雜湊，
+points.txt 被編輯過（雜湊不同）時 load_points() 會重新解析並更新 points.bin。
+海拔保留 float64（float32 會改變輸出檔中的海拔數值）。
+"""
+
+import csv
+import hashlib
+import io
+import json
+import re
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from route_store import atomic_write_bytes
+
+MAGIC = b"GPXPTS\x00\x01"
+HEADER_LENGTH = struct.Struct("<I")
+ALIGNMENT = 16
+
+TABLE_NAME = "points.bin"
+TEXT_NAME = "points.txt"
+
+# points.txt 的欄位；時間 欄位可有可無
+BASE_COLUMNS = ["順序", "緯度", "經度", "海拔（約）", "類型", "名稱"]
+TIME_COLUMN = "時間"
+
+TIME_MISSING = np.iinfo(np.int64).min
+
+# 與 pandas.read_csv 預設視為缺值的字串相同
+NA_VALUES = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+SEQUENCE_PATTERN = re.compile(r"^(\d+)(?:\((.*)\))?$")
+
+
+def _categorize(values) -> tuple:
+    """字串 → (類別編號陣列, 類別清單)；缺值為 -1"""
+    categories = {}
+    codes = np.empty(len(values), dtype=np.int16)
+    for i, value in enumerate(values):
+        if value is None:
+            codes[i] = -1
+        else:
+            codes[i] = categories.setdefault(value, len(categories))
+    return codes, list(categories)
+
+
+def _parse_float(value: str, column: str) -> float:
+    if value in NA_VALUES:
+        return float("nan")
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{column} 無法轉為數值: {value!r}") from None
+
+
+def format_times(ns) -> list:
+    """epoch 奈秒 → 與 pandas.Timestamp(tz="UTC").isoformat() 相同的字串；TIME_MISSING 為 None"""
+    ns = np.asarray(ns, dtype=np.int64)
+    seconds, fraction = np.divmod(ns, 1_000_000_000)
+    texts = np.datetime_as_string(seconds.astype("datetime64[s]")).tolist()
+    result = []
+    for value, text, frac in zip(ns.tolist(), texts, fraction.tolist()):
+        if value == TIME_MISSING:
+            result.append(None)
+        elif frac == 0:
+            result.append(f"{text}+00:00")
+        elif frac % 1000 == 0:
+            result.append(f"{text}.{frac // 1000:06d}+00:00")
+        else:
+            result.append(f"{text}.{frac:09d}+00:00")
+    return result
+
+
+def parse_points_text(text: str) -> dict:
+    """
+    解析 points.txt 的內容，回傳欄位陣列與類別清單。
+    格式不符（欄位不同、順序無法解析）時丟出 ValueError。
+    """
+    import pandas as pd
+
+    # pandas 寫出時會為含引號、定位字元或換行的欄位加引號，以 csv 模組還原
+    lines = [row for row in csv.reader(io.StringIO(text), delimiter="\t") if row]
+    if not lines:
+        raise ValueError("空白的 points.txt")
+    header = lines[0]
+    if header[: len(BASE_COLUMNS)] != BASE_COLUMNS or header[len(BASE_COLUMNS):] not in ([], [TIME_COLUMN]):
+        raise ValueError(f"不支援的欄位: {header}")
+    rows = lines[1:]
+    if any(len(row) != len(header) for row in rows):
+        raise ValueError("欄位數與標題不符")
+
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+    seq = np.empty(len(rows), dtype=np.int32)
+    labels = []
+    for i, value in enumerate(columns[0]):
+        match = SEQUENCE_PATTERN.match(value)
+        if match is None or str(int(match.group(1))) != match.group(1):
+            raise ValueError(f"無法解析的順序: {value!r}")
+        seq[i] = int(match.group(1))
+        labels.append(match.group(2))
+
+    seq_label, seq_labels = _categorize(labels)
+    types, type_names = _categorize([None if v in NA_VALUES else v for v in columns[4]])
+    names, name_values = _categorize([None if v in NA_VALUES else v for v in columns[5]])
+    table = {
+        "columns": header,
+        "arrays": {
+            "seq": seq,
+            "seq_label": seq_label,
+            "lat": np.array([_parse_float(v, "緯度") for v in columns[1]], dtype=np.float64),
+            "lon": np.array([_parse_float(v, "經度") for v in columns[2]], dtype=np.float64),
+            "elevation": np.array([_parse_float(v, "海拔（約）") for v in columns[3]], dtype=np.float64),
+            "type": types,
+            "name": names,
+        },
+        "categories": {"seq_label": seq_labels, "type": type_names, "name": name_values},
+        "time_encoding": None,
+    }
+
+    if TIME_COLUMN in header:
+        times = [None if v in NA_VALUES else v for v in columns[6]]
+        try:
+            ns = np.array(
+                [TIME_MISSING if t is None else pd.Timestamp(t).value for t in times], dtype=np.int64
+            )
+            # 只有能還原成原字串時才以數值儲存
+            exact = format_times(ns) == times
+        except ValueError:
+            exact = False
+        if exact:
+            table["arrays"]["time"] = ns
+            table["time_encoding"] = "epoch_ns"
+        else:
+            # 時區或格式與 pandas 的 isoformat 不同，保留原字串（空字串表示缺值）
+            width = max([len(t) for t in times if t is not None] + [1])
+            table["arrays"]["time"] = np.array([t or "" for t in times], dtype=f"<U{width}")
+            table["time_encoding"] = "text"
+    return table
+
+
+def encode_table(table: dict, source_sha256: str) -> bytes:
+    """把欄位陣列編碼成 points.bin 的內容"""
+    arrays = table["arrays"]
+    layout = {}
+    offset = 0
+    for key, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[key] = {"dtype": array.dtype.str, "offset": offset}
+        offset += array.nbytes
+
+    header = {
+        "rows": len(arrays["seq"]),
+        "columns": table["columns"],
+        "categories": table["categories"],
+        "time_encoding": table["time_encoding"],
+        "source_sha256": source_sha256,
+        "arrays": layout,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(len(MAGIC) + HEADER_LENGTH.size + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    header_bytes += b" " * (data_start - len(MAGIC) - HEADER_LENGTH.size - len(header_bytes))
+
+    body = bytearray(offset)
+    for key, array in arrays.items():
+        start = layout[key]["offset"]
+        body[start:start + array.nbytes] = np.ascontiguousarray(array).tobytes()
+    return MAGIC + HEADER_LENGTH.pack(len(header_bytes)) + header_bytes + bytes(body)
+
+
+def read_table(path: Path) -> dict:
+    """以 memory-map 讀取 points.bin；陣列為唯讀的檔案映射"""
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(mapped[: len(MAGIC)]) != MAGIC:
+        raise ValueError(f"不是 points.bin 格式: {path}")
+    (length,) = HEADER_LENGTH.unpack(bytes(mapped[len(MAGIC):len(MAGIC) + HEADER_LENGTH.size]))
+    header_end = len(MAGIC) + HEADER_LENGTH.size + length
+    header = json.loads(bytes(mapped[len(MAGIC) + HEADER_LENGTH.size:header_end]).decode("utf-8"))
+
+    rows = header["rows"]
+    arrays = {}
+    for key, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        start = header_end + spec["offset"]
+        arrays[key] = mapped[start:start + rows * dtype.itemsize].view(dtype)
+    return {
+        "columns": header["columns"],
+        "arrays": arrays,
+        "categories": header["categories"],
+        "time_encoding": header["time_encoding"],
+        "source_sha256": header["source_sha256"],
+    }
+
+
+def _category_column(codes, categories):
+    """類別編號 → 與 pandas.read_csv 相同的欄位（字串，缺值為 NaN；全部缺值時為 float64）"""
+    if len(codes) and (codes < 0).all():
+        return np.full(len(codes), np.nan)
+    lookup = np.array(categories + [np.nan], dtype=object)
+    return lookup[np.asarray(codes, dtype=np.int64)]
+
+
+def table_to_frame(table: dict):
+    """還原成與 pandas.read_csv(points.txt, sep="\\t") 相同的 DataFrame"""
+    import pandas as pd
+
+    arrays = table["arrays"]
+    categories = table["categories"]
+    seq = np.asarray(arrays["seq"], dtype=np.int64)
+    if (arrays["seq_label"] < 0).all():
+        order = seq
+    else:
+        labels = categories["seq_label"]
+        order = np.array(
+            [str(n) if code < 0 else f"{n}({labels[code]})" for n, code in zip(seq.tolist(), arrays["seq_label"].tolist())],
+            dtype=object,
+        )
+
+    data = {
+        "順序": order,
+        "緯度": np.array(arrays["lat"]),
+        "經度": np.array(arrays["lon"]),
+        "海拔（約）": np.array(arrays["elevation"]),
+        "類型": _category_column(arrays["type"], categories["type"]),
+        "名稱": _category_column(arrays["name"], categories["name"]),
+    }
+    if TIME_COLUMN in table["columns"]:
+        if table["time_encoding"] == "epoch_ns":
+            times = format_times(arrays["time"])
+        else:
+            times = [t or None for t in arrays["time"].tolist()]
+        if any(t is not None for t in times):
+            data[TIME_COLUMN] = np.array([np.nan if t is None else t for t in times], dtype=object)
+        else:
+            data[TIME_COLUMN] = np.full(len(times), np.nan)
+    return pd.DataFrame(data)
+
+
+def write_points_table(text_path: Path) -> Path:
+    """由 points.txt 產生同目錄的 points.bin，回傳其路徑"""
+    text_path = Path(text_path)
+    raw = text_path.read_bytes()
+    table = parse_points_text(raw.decode("utf-8-sig"))
+    table_path = text_path.with_name(TABLE_NAME)
+    atomic_write_bytes(table_path, encode_table(table, hashlib.sha256(raw).hexdigest()))
+    return table_path
+
+
+def load_points(folder: Path):
+    """
+    讀取路線資料夾的點位 DataFrame。
+    points.bin 與 points.txt 一致時直接映射讀取；否則解析 points.txt 並更新 points.bin。
+    """
+    folder = Path(folder)
+    text_path = folder / TEXT_NAME
+    table_path = folder / TABLE_NAME
+    raw = text_path.read_bytes()
+    digest = hashlib.sha256(raw).hexdigest()
+
+    if table_path.exists():
+        try:
+            table = read_table(table_path)
+            if table["source_sha256"] == digest:
+                return table_to_frame(table)
+        except (ValueError, KeyError, OSError) as e:
+            print(f"  {table_path} 無法讀取，重新產生: {e}")
+
+    table = parse_points_text(raw.decode("utf-8-sig"))
+    try:
+        atomic_write_bytes(table_path, encode_table(table, digest))
+    except OSError as e:
+        print(f"  無法寫入 {table_path}: {e}")
+    return table_to_frame(table)
@@ -1,17 +1,26 @@
-import gpxpy
-import pandas as pd
-import geopandas as gpd
+# geopandas、pandas、gpxpy 載入較慢，只在實際處理時才匯入
+from __future__ import annotations
+
 from pathlib import Path
-from shapely.geometry import Point, LineString
-from haversine import haversine, Unit
-import json
-from typing import Tuple, List
+from typing import TYPE_CHECKING, Tuple, List
 from datetime import datetime, timedelta
 
+from geodesy import haversine
+from geojson_layout import write_geojson
+from points_table import write_points_table
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+    from shapely.geometry import Point
+
 
 # 1. GPX → GeoDataFrame (保留時間)
 def load_gpx_to_gdf(gpx_path: Path) -> gpd.GeoDataFrame:
     """從 GPX 檔案載入軌跡點，並保留時間資訊"""
+    import geopandas as gpd
+    import gpxpy
+    from shapely.geometry import Point
+
     with open(gpx_path, "r", encoding="utf-8") as f:
         gpx = gpxpy.parse(f)
     rows = []
@@ -36,6 +45,9 @@ def load_gpx_to_gdf(gpx_path: Path) -> gpd.GeoDataFrame:
 # 1. TXT → GeoDataFrame（通訊點） - 修正以處理實際格式
 def load_txt_to_gdf(txt_path: Path) -> gpd.GeoDataFrame:
     """從 TXT 檔案載入通訊點"""
+    import geopandas as gpd
+    import pandas as pd
+
     df = pd.read_csv(txt_path, sep="\t", encoding="utf-8")
 
     # 處理緯度欄位
@@ -73,9 +85,14 @@ def split_route_by_last_comm(
     路線 A：起點到最後通訊點最近的 GPX 點
     路線 B：最後通訊點最近的 GPX 點到終點
     """
-    # 找到距離最後通訊點最近的 GPX 軌跡點
-    distances = route_gdf.geometry.distance(last_comm_geom)
-    closest_idx = distances.idxmin()
+    # 找到距離最後通訊點最近的 GPX 軌跡點（以公尺計）
+    distances = haversine(
+        route_gdf["latitude"].to_numpy(dtype=float),
+        route_gdf["longitude"].to_numpy(dtype=float),
+        last_comm_geom.y,
+        last_comm_geom.x,
+    )
+    closest_idx = int(distances.argmin())
 
     # 路線 A：從起點到最近點（包含）
     route_a = route_gdf.iloc[: closest_idx + 1].copy().reset_index(drop=True)
@@ -86,13 +103,127 @@ def split_route_by_last_comm(
     return route_a, route_b
 
 
+def _interpolate_at_nearest(route_gdf: gpd.GeoDataFrame, distances, comm_geom) -> dict:
+    """以最近的 GPX 點及其前後點，依距離比例插值通訊點的時間和高度"""
+    import pandas as pd
+
+    closest_idx = int(distances.argmin())
+
+    # 獲取最近點及其前後點的時間和高度資訊
+    closest_point = route_gdf.iloc[closest_idx]
+    time1 = closest_point.time
+    elevation1 = closest_point.elevation
+
+    # 計算插值時間和高度
+    interpolated_time = None
+    interpolated_elevation = None
+
+    # 如果有前一個點，計算與前一個點的插值
+    if closest_idx > 0:
+        prev_point = route_gdf.iloc[closest_idx - 1]
+        time0 = prev_point.time
+        elevation0 = prev_point.elevation
+
+        # 計算通訊點在兩點之間的相對位置
+        total_distance = haversine(
+            prev_point.latitude, prev_point.longitude,
+            closest_point.latitude, closest_point.longitude,
+        )
+        if total_distance > 0:
+            distance_to_prev = haversine(
+                prev_point.latitude, prev_point.longitude, comm_geom.y, comm_geom.x
+            )
+            ratio = min(1.0, max(0.0, distance_to_prev / total_distance))
+
+            # 時間插值
+            if pd.notna(time0) and pd.notna(time1):
+                time_diff = time1 - time0
+                interpolated_time = time0 + time_diff * ratio
+
+            # 高度插值
+            if pd.notna(elevation0) and pd.notna(elevation1):
+                elevation_diff = elevation1 - elevation0
+                interpolated_elevation = elevation0 + elevation_diff * ratio
+
+    # 如果有後一個點，計算與後一個點的插值
+    if closest_idx < len(route_gdf) - 1:
+        next_point = route_gdf.iloc[closest_idx + 1]
+        time2 = next_point.time
+        elevation2 = next_point.elevation
+
+        # 計算通訊點在兩點之間的相對位置
+        total_distance = haversine(
+            closest_point.latitude, closest_point.longitude,
+            next_point.latitude, next_point.longitude,
+        )
+        if total_distance > 0:
+            distance_to_closest = haversine(
+                closest_point.latitude, closest_point.longitude, comm_geom.y, comm_geom.x
+            )
+            ratio = min(1.0, max(0.0, distance_to_closest / total_distance))
+
+            # 時間插值（如果還沒有計算）
+            if interpolated_time is None and pd.notna(time1) and pd.notna(time2):
+                time_diff = time2 - time1
+                interpolated_time = time1 + time_diff * ratio
+
+            # 高度插值（如果還沒有計算）
+            if (
+                interpolated_elevation is None
+                and pd.notna(elevation1)
+                and pd.notna(elevation2)
+            ):
+                elevation_diff = elevation2 - elevation1
+                interpolated_elevation = elevation1 + elevation_diff * ratio
+
+    return {
+        "time": interpolated_time,
+        "elevation": interpolated_elevation,
+        "nearest_elevation": elevation1,
+        "insert_index": closest_idx + 0.5,  # 用於無時間時的排序
+    }
+
+
+def _interpolate_on_segment(route_gdf: gpd.GeoDataFrame, match: dict) -> dict:
+    """以 map-matching 對應到的線段與線段內位置，插值通訊點的時間和高度"""
+    import pandas as pd
+
+    segment = match["segment"]
+    fraction = match["fraction"]
+    start = route_gdf.iloc[segment]
+    end = route_gdf.iloc[segment + 1]
+
+    interpolated_time = None
+    if pd.notna(start.time) and pd.notna(end.time):
+        interpolated_time = start.time + (end.time - start.time) * fraction
+
+    interpolated_elevation = None
+    if pd.notna(start.elevation) and pd.notna(end.elevation):
+        interpolated_elevation = start.elevation + (end.elevation - start.elevation) * fraction
+
+    return {
+        "time": interpolated_time,
+        "elevation": interpolated_elevation,
+        "nearest_elevation": (start if fraction < 0.5 else end).elevation,
+        # 落在兩端點之間（不與 GPX 點的索引相同），同一線段上的多個通訊點依位置排序
+        "insert_index": segment + 0.25 + 0.5 * fraction,
+    }
+
+
 # 3. (改進) 將所有通訊點插入路線並進行時間和高度插值
 def insert_comm_points_with_interpolation(
     route_gdf: gpd.GeoDataFrame, comm_gdf: gpd.GeoDataFrame
 ) -> gpd.GeoDataFrame:
     """
     將所有通訊點插入到路線中，並為通訊點計算插值時間和高度。
+    插入位置以 map_match 依通訊點順序對應到路線上（避免之字形路段對到錯誤的一段），
+    對應不到（半徑內沒有路線）的通訊點改用最近的 GPX 點。
     """
+    import geopandas as gpd
+    import pandas as pd
+
+    from map_match import match_ordered_points
+
     all_points = route_gdf.to_dict("records")
 
     # 如果路線只有一個點，無法插入通訊點
@@ -100,89 +231,46 @@ def insert_comm_points_with_interpolation(
         print("警告：路線少於2個點，無法插入通訊點")
         return route_gdf
 
+    route_lats = route_gdf["latitude"].to_numpy(dtype=float)
+    route_lons = route_gdf["longitude"].to_numpy(dtype=float)
+    matches = match_ordered_points(
+        route_lats,
+        route_lons,
+        comm_gdf.geometry.y.to_numpy(dtype=float),
+        comm_gdf.geometry.x.to_numpy(dtype=float),
+    )
+
     # 為每個通訊點找到最適合的插入位置
-    for _, comm_point in comm_gdf.iterrows():
+    for (_, comm_point), match in zip(comm_gdf.iterrows(), matches):
         comm_geom = comm_point.geometry
 
-        # 找到距離通訊點最近的 GPX 點
-        distances = route_gdf.geometry.distance(comm_geom)
-        closest_idx = distances.idxmin()
-
-        # 獲取最近點及其前後點的時間和高度資訊
-        closest_point = route_gdf.iloc[closest_idx]
-        time1 = closest_point.time
-        elevation1 = closest_point.elevation
-
-        # 計算插值時間和高度
-        interpolated_time = None
-        interpolated_elevation = None
-
-        # 如果有前一個點，計算與前一個點的插值
-        if closest_idx > 0:
-            prev_point = route_gdf.iloc[closest_idx - 1]
-            time0 = prev_point.time
-            elevation0 = prev_point.elevation
-
-            # 計算通訊點在兩點之間的相對位置
-            total_distance = prev_point.geometry.distance(closest_point.geometry)
-            if total_distance > 0:
-                distance_to_prev = prev_point.geometry.distance(comm_geom)
-                ratio = min(1.0, max(0.0, distance_to_prev / total_distance))
-
-                # 時間插值
-                if pd.notna(time0) and pd.notna(time1):
-                    time_diff = time1 - time0
-                    interpolated_time = time0 + time_diff * ratio
-
-                # 高度插值
-                if pd.notna(elevation0) and pd.notna(elevation1):
-                    elevation_diff = elevation1 - elevation0
-                    interpolated_elevation = elevation0 + elevation_diff * ratio
-
-        # 如果有後一個點，計算與後一個點的插值
-        if closest_idx < len(route_gdf) - 1:
-            next_point = route_gdf.iloc[closest_idx + 1]
-            time2 = next_point.time
-            elevation2 = next_point.elevation
-
-            # 計算通訊點在兩點之間的相對位置
-            total_distance = closest_point.geometry.distance(next_point.geometry)
-            if total_distance > 0:
-                distance_to_closest = closest_point.geometry.distance(comm_geom)
-                ratio = min(1.0, max(0.0, distance_to_closest / total_distance))
-
-                # 時間插值（如果還沒有計算）
-                if interpolated_time is None and pd.notna(time1) and pd.notna(time2):
-                    time_diff = time2 - time1
-                    interpolated_time = time1 + time_diff * ratio
-
-                # 高度插值（如果還沒有計算）
-                if (
-                    interpolated_elevation is None
-                    and pd.notna(elevation1)
-                    and pd.notna(elevation2)
-                ):
-                    elevation_diff = elevation2 - elevation1
-                    interpolated_elevation = elevation1 + elevation_diff * ratio
+        if match is not None:
+            position = _interpolate_on_segment(route_gdf, match)
+        else:
+            # 找到距離通訊點最近的 GPX 點（以公尺計）
+            distances = haversine(route_lats, route_lons, comm_geom.y, comm_geom.x)
+            position = _interpolate_at_nearest(route_gdf, distances, comm_geom)
+
+        interpolated_elevation = position["elevation"]
 
         # 如果通訊點本身有高度，優先使用
         if pd.notna(comm_point.get("海拔（約）")):
             interpolated_elevation = comm_point.get("海拔（約）")
 
         # 如果還是沒有高度，使用最近點的高度
-        if interpolated_elevation is None and pd.notna(elevation1):
-            interpolated_elevation = elevation1
+        if interpolated_elevation is None and pd.notna(position["nearest_elevation"]):
+            interpolated_elevation = position["nearest_elevation"]
 
         # 建立通訊點資料
         new_point = {
             "latitude": comm_point.geometry.y,
             "longitude": comm_point.geometry.x,
             "elevation": interpolated_elevation,
-            "time": interpolated_time,
+            "time": position["time"],
             "geometry": comm_point.geometry,
             "point_type": "comm",
             "name": comm_point.get("點位名稱") or "通訊點",
-            "insert_index": closest_idx + 0.5,  # 用於無時間時的排序
+            "insert_index": position["insert_index"],  # 用於無時間時的排序
         }
 
         all_points.append(new_point)
@@ -199,6 +287,8 @@ def final_time_sort(merged_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
     對包含 GPX 軌跡點和通訊點的合併路線進行最終時間排序。
     優先使用時間排序，如果沒有時間則使用插入索引。
     """
+    import pandas as pd
+
     # 複製資料以避免修改原始資料
     sorted_gdf = merged_gdf.copy()
 
@@ -247,9 +337,11 @@ def final_time_sort(merged_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
 
 # 5. 匯出 TXT + GeoJSON (改進版)
 def export_gdf_to_txt_geojson(
-    gdf: gpd.GeoDataFrame, output_path: Path, route_name: str
+    gdf: gpd.GeoDataFrame, output_path: Path, route_name: str, layout: str = None
 ):
-    """將處理好的路線資料匯出成 TXT 和 GeoJSON"""
+    """將處理好的路線資料匯出成 TXT 和 GeoJSON（layout 見 geojson_layout）"""
+    import pandas as pd
+
     output_path.mkdir(parents=True, exist_ok=True)
 
     export_df = gdf.copy()
@@ -291,6 +383,8 @@ def export_gdf_to_txt_geojson(
     txt_df.to_csv(
         output_path / "points.txt", sep="\t", index=False, encoding="utf-8-sig"
     )
+    # 後續階段讀取的型別化版本（points.txt 只供人工檢視與編輯）
+    write_points_table(output_path / "points.txt")
 
     # 建立 GeoJSON
     geojson = {"type": "FeatureCollection", "features": []}
@@ -338,19 +432,77 @@ def export_gdf_to_txt_geojson(
         geojson["features"].append(feature)
 
     # 寫入 GeoJSON 檔案
-    with open(output_path / "route.geojson", "w", encoding="utf-8") as f:
-        json.dump(geojson, f, ensure_ascii=False, indent=2)
+    write_geojson(output_path / "route.geojson", geojson, layout)
 
     print(
         f"  -> 匯出完成：{len(gdf)} 個點位 (GPX: {len(gdf[gdf['point_type'] == 'gpx'])}, 通訊點: {len(gdf[gdf['point_type'] == 'comm'])})"
     )
 
 
-# 6. 主流程 (完全重構)
-if __name__ == "__main__":
-    raw_gpx_folder = Path("./data_raw/gpx")
-    raw_txt_folder = Path("./data_raw/txt")
-    work_folder = Path("./data_work")
+# 6. 單一路線：讀取、分割、插入通訊點並排序（不寫檔）
+def build_work_routes(gpx_file: Path, txt_file: Path):
+    """
+    由原始 GPX 與通訊點 TXT 產生路線 A、B。
+    回傳 (final_route_a, final_route_b)；任一檔案為空時回傳 None。
+    """
+    # 1. 讀取資料 (保留 time 欄位)
+    print("  -> 讀取 GPX 軌跡...")
+    route_gdf = load_gpx_to_gdf(gpx_file)
+
+    print("  -> 讀取通訊點...")
+    comm_gdf = load_txt_to_gdf(txt_file)
+
+    if route_gdf.empty:
+        print(f"GPX 檔案為空: {gpx_file.name}")
+        return None
+
+    if comm_gdf.empty:
+        print(f"通訊點檔案為空: {txt_file.name}")
+        return None
+
+    print(f"  -> GPX 軌跡點: {len(route_gdf)}, 通訊點: {len(comm_gdf)}")
+
+    # 2. 根據最後通訊點分割原始路線
+    print("  -> 依最後通訊點分割路線...")
+    last_comm_geom = comm_gdf.geometry.iloc[-1]
+    route_a_base, route_b_base = split_route_by_last_comm(route_gdf, last_comm_geom)
+
+    print(f"     路線 A: {len(route_a_base)} 個點")
+    print(f"     路線 B: {len(route_b_base)} 個點")
+
+    # 3. 分別為路線 A 和 B 插入所有通訊點
+    print("  -> 為路線 A 插入通訊點並進行時間插值...")
+    route_a_with_comm = insert_comm_points_with_interpolation(route_a_base, comm_gdf)
+
+    print("  -> 為路線 B 插入通訊點並進行時間插值...")
+    route_b_with_comm = insert_comm_points_with_interpolation(route_b_base, comm_gdf)
+
+    # 4. 對兩條路線進行最終時間排序
+    print("  -> 進行最終時間排序...")
+    return final_time_sort(route_a_with_comm), final_time_sort(route_b_with_comm)
+
+
+def export_work_routes(routes, work_folder: Path, base: str) -> None:
+    """匯出路線 A、B 至 data_work/route_a|route_b/<路線>"""
+    final_route_a, final_route_b = routes
+    if not final_route_a.empty:
+        print("  -> 匯出路線 A...")
+        export_gdf_to_txt_geojson(
+            final_route_a, work_folder / "route_a" / base, f"{base}_路線A"
+        )
+
+    if not final_route_b.empty:
+        print("  -> 匯出路線 B...")
+        export_gdf_to_txt_geojson(
+            final_route_b, work_folder / "route_b" / base, f"{base}_路線B"
+        )
+
+
+# 7. 主流程
+def main(base_dir: Path = Path(".")):
+    raw_gpx_folder = base_dir / "data_raw" / "gpx"
+    raw_txt_folder = base_dir / "data_raw" / "txt"
+    work_folder = base_dir / "data_work"
 
     # 建立輸出資料夾
     work_folder.mkdir(parents=True, exist_ok=True)
@@ -368,61 +520,12 @@ if __name__ == "__main__":
         print(f"\n處理中: {gpx_file.name}")
 
         try:
-            # 1. 讀取資料 (保留 time 欄位)
-            print("  -> 讀取 GPX 軌跡...")
-            route_gdf = load_gpx_to_gdf(gpx_file)
-
-            print("  -> 讀取通訊點...")
-            comm_gdf = load_txt_to_gdf(txt_file)
-
-            if route_gdf.empty:
-                print(f"GPX 檔案為空: {gpx_file.name}")
-                continue
-
-            if comm_gdf.empty:
-                print(f"通訊點檔案為空: {txt_file.name}")
+            routes = build_work_routes(gpx_file, txt_file)
+            if routes is None:
                 continue
 
-            print(f"  -> GPX 軌跡點: {len(route_gdf)}, 通訊點: {len(comm_gdf)}")
-
-            # 2. 根據最後通訊點分割原始路線
-            print("  -> 依最後通訊點分割路線...")
-            last_comm_geom = comm_gdf.geometry.iloc[-1]
-            route_a_base, route_b_base = split_route_by_last_comm(
-                route_gdf, last_comm_geom
-            )
-
-            print(f"     路線 A: {len(route_a_base)} 個點")
-            print(f"     路線 B: {len(route_b_base)} 個點")
-
-            # 3. 分別為路線 A 和 B 插入所有通訊點
-            print("  -> 為路線 A 插入通訊點並進行時間插值...")
-            route_a_with_comm = insert_comm_points_with_interpolation(
-                route_a_base, comm_gdf
-            )
-
-            print("  -> 為路線 B 插入通訊點並進行時間插值...")
-            route_b_with_comm = insert_comm_points_with_interpolation(
-                route_b_base, comm_gdf
-            )
-
-            # 4. 對兩條路線進行最終時間排序
-            print("  -> 進行最終時間排序...")
-            final_route_a = final_time_sort(route_a_with_comm)
-            final_route_b = final_time_sort(route_b_with_comm)
-
             # 5. 匯出結果
-            if not final_route_a.empty:
-                print("  -> 匯出路線 A...")
-                export_gdf_to_txt_geojson(
-                    final_route_a, work_folder / "route_a" / base, f"{base}_路線A"
-                )
-
-            if not final_route_b.empty:
-                print("  -> 匯出路線 B...")
-                export_gdf_to_txt_geojson(
-                    final_route_b, work_folder / "route_b" / base, f"{base}_路線B"
-                )
+            export_work_routes(routes, work_folder, base)
 
         except Exception as e:
             print(f"處理 {gpx_file.name} 時發生錯誤: {str(e)}")
@@ -430,3 +533,7 @@ if __name__ == "__main__":
 
     print("\n所有路線處理完成！")
     print(f"結果已匯出至: {work_folder.absolute()}")
+
+
+if __name__ == "__main__":
+    main()
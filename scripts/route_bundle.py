@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線資料包
+把編輯器載入一條路線所需的資料（A/B 兩段 GeoJSON、通訊點、切分段資訊與檔案清單）
+合併成一個 JSON，讓前端一次請求就能完成載入。
+"""
+
+import json
+from pathlib import Path
+
+from geojson_layout import existing_geojson, list_geojson, load_geojson, plain_path, read_text
+
+SIDES = ("route_a", "route_b")
+
+
+def part_sort_key(path: Path):
+    """依 _partN 的編號排序"""
+    stem = plain_path(path).stem
+    number = stem.rsplit("_part", 1)[-1]
+    return (int(number) if number.isdigit() else float("inf"), stem)
+
+
+def bundle_sources(base_dir: Path, route_name: str) -> dict:
+    """
+    列出資料包的來源檔案。
+
+    回傳 {"route_a": route.geojson, "route_b": route.geojson,
+          "parts": [切分段 geojson...], "segment_files": {"route_a": [...], "route_b": [...]}}
+    """
+    base_dir = Path(base_dir)
+    parts_dir = base_dir / "最終json_txt" / "1.切分過的路線" / route_name
+    sources = {}
+    for side in SIDES:
+        route_geojson = base_dir / "data_work" / side / route_name / "route.geojson"
+        sources[side] = existing_geojson(route_geojson) or route_geojson
+    sources["parts"] = sorted(list_geojson(parts_dir), key=part_sort_key)
+    sources["segment_files"] = {
+        side: list_geojson(base_dir / "路線切分" / side / "geojson" / route_name) for side in SIDES
+    }
+    return sources
+
+
+def source_paths(sources: dict) -> list:
+    """所有來源檔案（用於判斷快取是否失效）"""
+    paths = [sources[side] for side in SIDES] + list(sources["parts"])
+    for side in SIDES:
+        paths.extend(sources["segment_files"][side])
+    return paths
+
+
+def comm_points(geojson: dict) -> list:
+    """取出通訊點（含在整條路線中的順序位置）"""
+    points = []
+    seq = 0
+    for feature in geojson.get("features", []):
+        if feature["geometry"]["type"] != "Point":
+            continue
+        seq += 1
+        props = feature.get("properties") or {}
+        if props.get("type") != "comm":
+            continue
+        lon, lat = feature["geometry"]["coordinates"][:2]
+        points.append(
+            {
+                "seq": seq,
+                "order": props.get("order"),
+                "name": props.get("name"),
+                "lat": lat,
+                "lon": lon,
+                "elevation": props.get("elevation"),
+            }
+        )
+    return points
+
+
+def part_metadata(part_path: Path) -> dict:
+    """讀取切分段 GeoJSON 的 LineString 屬性"""
+    geojson = json.loads(read_text(part_path))
+    metadata = {"file": part_path.name, "size": part_path.stat().st_size}
+    for feature in geojson.get("features", []):
+        if feature["geometry"]["type"] == "LineString":
+            props = feature.get("properties") or {}
+            for key in ("part_number", "start_point", "end_point", "total_points"):
+                metadata[key] = props.get(key)
+            break
+    return metadata
+
+
+def build_route_bundle(route_name: str, sources: dict) -> bytes:
+    """產生精簡格式的資料包 JSON"""
+    bundle = {"success": True, "route_name": route_name, "comm_points": {}}
+    for side in SIDES:
+        geojson = load_geojson(sources[side])
+        bundle[side] = geojson
+        bundle["comm_points"][side] = comm_points(geojson)
+
+    bundle["parts"] = [part_metadata(part_path) for part_path in sources["parts"]]
+    bundle["segment_files"] = {
+        side: [path.name for path in sources["segment_files"][side]] for side in SIDES
+    }
+    return json.dumps(bundle, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線目錄快取
+記住 route_a / route_b 兩邊都存在的路線與各檔案狀態，
+只在資料夾或檔案的 mtime 改變時才重新掃描磁碟。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from geojson_layout import existing_geojson, gzip_path, list_geojson
+
+
+def count_lines(file_path: Path) -> int:
+    """計算檔案行數（不含標題列）"""
+    with open(file_path, "rb") as f:
+        lines = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    return max(lines - 1, 0)
+
+
+def stat_mtime(path: Path):
+    """取得 mtime（奈秒），不存在時回傳 None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class RouteCatalog:
+    """
+    路線目錄的記憶體快取。
+
+    side_dirs: {"route_a": 目錄, "route_b": 目錄}
+    scan_route: 接收路線資料夾，回傳 (是否有效, 詳細資訊, 需監看的檔案清單)
+        路線清單為各個存在的資料夾共同擁有的路線；不存在的資料夾不參與篩選
+    check_interval: 兩次 mtime 檢查的最短間隔（秒）
+    """
+
+    def __init__(self, side_dirs, scan_route, check_interval=2.0):
+        self.side_dirs = {side: Path(path) for side, path in side_dirs.items()}
+        self.scan_route = scan_route
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._watched = {}
+        self._last_check = 0.0
+        self._watcher = None
+        self._stop = threading.Event()
+        # 重新掃描次數（在 refresh 的鎖內更新）
+        self.rebuilds = 0
+
+    def _rebuild(self):
+        """重新掃描磁碟並建立新的快照"""
+        watched = {}
+        side_routes = {}
+        side_details = {}
+        existing_sides = []
+
+        for side, side_dir in self.side_dirs.items():
+            watched[side_dir] = stat_mtime(side_dir)
+            side_routes[side] = set()
+            side_details[side] = {}
+            if not side_dir.exists():
+                continue
+            existing_sides.append(side)
+
+            for entry in os.scandir(side_dir):
+                if not entry.is_dir():
+                    continue
+                route_dir = Path(entry.path)
+                watched[route_dir] = entry.stat().st_mtime_ns
+                valid, details, files = self.scan_route(route_dir)
+                for file_path in files:
+                    watched[file_path] = stat_mtime(file_path)
+                if valid:
+                    side_routes[side].add(entry.name)
+                    side_details[side][entry.name] = details
+
+        # 只保留在每個（存在的）資料夾都有的路線；例如 route_b 尚未建立時只看 route_a
+        routes = sorted(set.intersection(*(side_routes[side] for side in existing_sides))) if existing_sides else []
+        details = {
+            route: {side: side_details[side][route] for side in existing_sides}
+            for route in routes
+        }
+
+        payload = {"success": True, "routes": routes, "count": len(routes), "details": details}
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+        self.rebuilds += 1
+        self._watched = watched
+        self._snapshot = {
+            "routes": routes,
+            "route_set": frozenset(routes),
+            "details": details,
+            "body": body,
+            "etag": hashlib.sha1(body).hexdigest(),
+            "built_at": time.time(),
+        }
+
+    def _is_stale(self) -> bool:
+        """比對所有監看路徑的 mtime"""
+        return any(stat_mtime(path) != mtime for path, mtime in self._watched.items())
+
+    def refresh(self, force=False) -> bool:
+        """若資料有變動則重新掃描，回傳是否重建"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            if force or self._snapshot is None or self._is_stale():
+                self._rebuild()
+                return True
+            return False
+
+    def snapshot(self) -> dict:
+        """取得目前的快照；監看執行緒未啟動時，依 check_interval 檢查變動"""
+        if self._snapshot is None:
+            self.refresh(force=True)
+        elif self._watcher is None and (
+            time.monotonic() - self._last_check >= self.check_interval
+        ):
+            self.refresh()
+        return self._snapshot
+
+    def start_watcher(self, interval=None):
+        """啟動背景執行緒定期檢查 mtime，請求路徑只讀取快照"""
+        if self._watcher is not None:
+            return
+        interval = interval or self.check_interval
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"路線目錄檢查失敗: {e}")
+
+        self.refresh()
+        self._watcher = threading.Thread(target=watch, name="route-catalog", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        """停止背景監看執行緒"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+        self._stop.clear()
+
+
+def scan_work_route(route_dir: Path):
+    """data_work 的路線：需有 route.geojson（或 .geojson.gz），並記錄檔案大小與點位數"""
+    route_geojson = existing_geojson(route_dir / "route.geojson")
+    points_file = route_dir / "points.txt"
+    if route_geojson is None:
+        return False, None, [route_dir / "route.geojson", gzip_path(route_dir / "route.geojson")]
+
+    stat = route_geojson.stat()
+    details = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "points": count_lines(points_file) if points_file.exists() else None,
+    }
+    return True, details, [route_dir / "route.geojson", gzip_path(route_dir / "route.geojson"), points_file]
+
+
+def scan_segment_route(route_dir: Path):
+    """路線切分的路線：需至少有一個切分後的 .geojson 檔"""
+    part_files = list_geojson(route_dir)
+    if not part_files:
+        return False, None, []
+
+    details = {
+        "parts": len(part_files),
+        "size": sum(part_file.stat().st_size for part_file in part_files),
+    }
+    return True, details, part_files
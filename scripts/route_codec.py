@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線二進位編碼
+把路線 GeoJSON（LineString + 每個點位的 Point Feature）壓成精簡的欄位式二進位格式：
+
+- 經緯度量化為 1e-6 度的整數並做差分
+- 海拔以公寸（0.1 m）為單位，時間以秒為單位並做差分
+- 類型、名稱與順序標記放在值表中，以索引表示（保留原本的型別，例如名稱為 NaN 的點位）
+- 所有整數使用 zigzag + varint 編碼
+
+解碼後的 GeoJSON 與原始檔案在上述精度內相同（經緯度 1e-6 度、海拔 0.1 m、時間 1 秒）。
+
+    python route_codec.py encode route.geojson route.grc
+    python route_codec.py decode route.grc route.geojson
+    python route_codec.py stats ../data_work
+"""
+
+import argparse
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from geojson_layout import list_geojson, plain_path, read_text, to_point_features
+
+MAGIC = b"GRC1"
+MIMETYPE = "application/vnd.gpx-tool.route"
+FILE_SUFFIX = ".grc"
+
+COORD_SCALE = 1_000_000
+ELEVATION_SCALE = 10
+
+# Point 屬性中以欄位編碼的鍵，其餘的鍵放在 extras
+POINT_KEYS = ("order", "type", "name", "elevation", "time")
+
+# order 欄位的種類：None、整數、數字字串、"數字(標記)"、其他文字
+ORDER_NONE, ORDER_INT, ORDER_DIGITS, ORDER_LABEL, ORDER_TEXT = range(5)
+
+
+class RouteCodecError(ValueError):
+    """二進位內容格式不正確"""
+
+
+# ---------- varint ----------
+
+def write_varint(out: bytearray, value: int) -> None:
+    """寫入無號 varint（LEB128）"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def write_signed(out: bytearray, value: int) -> None:
+    """寫入 zigzag 編碼的有號整數"""
+    write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+
+
+def write_deltas(out: bytearray, values) -> None:
+    """寫入差分後的有號整數序列"""
+    previous = 0
+    for value in values:
+        write_signed(out, value - previous)
+        previous = value
+
+
+def write_bitmap(out: bytearray, flags) -> None:
+    """每 8 個布林值壓成一個位元組"""
+    byte = 0
+    for index, flag in enumerate(flags):
+        if flag:
+            byte |= 1 << (index & 7)
+        if index & 7 == 7:
+            out.append(byte)
+            byte = 0
+    if len(flags) & 7:
+        out.append(byte)
+
+
+class Reader:
+    """依序讀取 varint 欄位"""
+
+    def __init__(self, data: bytes, offset: int = 0):
+        self.data = data
+        self.offset = offset
+
+    def varint(self) -> int:
+        result = 0
+        shift = 0
+        data = self.data
+        while True:
+            if self.offset >= len(data):
+                raise RouteCodecError("資料提前結束")
+            byte = data[self.offset]
+            self.offset += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def signed(self) -> int:
+        value = self.varint()
+        return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+    def deltas(self, count: int) -> list:
+        values = []
+        current = 0
+        for _ in range(count):
+            current += self.signed()
+            values.append(current)
+        return values
+
+    def bitmap(self, count: int) -> list:
+        size = (count + 7) // 8
+        chunk = self.data[self.offset:self.offset + size]
+        if len(chunk) != size:
+            raise RouteCodecError("資料提前結束")
+        self.offset += size
+        return [bool(chunk[index >> 3] & (1 << (index & 7))) for index in range(count)]
+
+    def raw(self, size: int) -> bytes:
+        chunk = self.data[self.offset:self.offset + size]
+        if len(chunk) != size:
+            raise RouteCodecError("資料提前結束")
+        self.offset += size
+        return chunk
+
+
+# ---------- 時間 ----------
+
+def parse_time(value):
+    """ISO 8601 時間轉為 (秒, 時區字串)，無法解析時回傳 None"""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        # Python 3.10 以前不接受 9 位數的小數秒，截到微秒後再解析
+        text = str(value)
+        head, dot, rest = text.partition(".")
+        if not dot:
+            return None
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        try:
+            parsed = datetime.fromisoformat(head + "." + rest[:min(digits, 6)] + rest[digits:])
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        return None
+    return int(parsed.timestamp()), parsed.strftime("%z")
+
+
+def format_time(seconds: int, tz: str) -> str:
+    """秒數轉回 ISO 8601（使用檔案的時區）"""
+    sign = -1 if tz.startswith("-") else 1
+    offset = timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5])) * sign
+    return datetime.fromtimestamp(seconds, timezone(offset)).isoformat()
+
+
+# ---------- 編碼 ----------
+
+def quantize(value: float, scale: int) -> int:
+    return int(round(float(value) * scale))
+
+
+def split_order(order, seq: int):
+    """把 order 拆成 (種類, 數值, 標記)；數值以與 seq 的差記錄"""
+    if order is None:
+        return ORDER_NONE, seq, None
+    if isinstance(order, bool) or not isinstance(order, (int, str)):
+        raise ValueError(f"不支援的順序欄位: {order!r}")
+    if isinstance(order, int):
+        return ORDER_INT, order, None
+    digits = len(order) - len(order.lstrip("0123456789"))
+    if digits == 0 or (digits > 1 and order[0] == "0"):
+        return ORDER_TEXT, seq, order
+    number = int(order[:digits])
+    if digits == len(order):
+        return ORDER_DIGITS, number, None
+    return ORDER_LABEL, number, order[digits:]
+
+
+def encode_route(geojson: dict) -> bytes:
+    """GeoJSON FeatureCollection（points 或 columnar 格式）→ 二進位"""
+    geojson = to_point_features(geojson)
+    strings = []
+    string_index = {}
+
+    def intern(value) -> int:
+        """值表索引，0 表示 None；以 (型別, repr) 為鍵，NaN 與 "nan"、1 與 "1" 不會混在一起"""
+        if value is None:
+            return 0
+        key = (type(value).__name__, repr(value))
+        if key not in string_index:
+            strings.append(value)
+            string_index[key] = len(strings)
+        return string_index[key]
+
+    points = []
+    lines = []
+    extras = {}
+    for position, feature in enumerate(geojson.get("features", [])):
+        geometry = feature["geometry"]
+        properties = feature.get("properties") or {}
+        if geometry["type"] == "Point":
+            extra = {key: value for key, value in properties.items() if key not in POINT_KEYS}
+            if extra:
+                extras[str(len(points))] = extra
+            points.append((geometry["coordinates"], properties))
+        else:
+            lines.append({"position": position, "geometry": geometry, "properties": properties})
+
+    lats = [quantize(coords[1], COORD_SCALE) for coords, _ in points]
+    lons = [quantize(coords[0], COORD_SCALE) for coords, _ in points]
+
+    # LineString 座標與點位相同時只記錄旗標，不重複儲存
+    line_meta = []
+    line_coords = []
+    for line in lines:
+        meta = {"position": line["position"], "type": line["geometry"]["type"], "properties": line["properties"]}
+        coords = line["geometry"].get("coordinates")
+        if line["geometry"]["type"] == "LineString":
+            quantized = [(quantize(c[1], COORD_SCALE), quantize(c[0], COORD_SCALE)) for c in coords]
+            if quantized == list(zip(lats, lons)):
+                meta["shared"] = True
+            else:
+                line_coords.append(quantized)
+        else:
+            meta["geometry"] = line["geometry"]
+        line_meta.append(meta)
+
+    elevations = [properties.get("elevation") for _, properties in points]
+    has_elevation = [value is not None for value in elevations]
+
+    times = []
+    tz = None
+    for _, properties in points:
+        parsed = parse_time(properties["time"]) if properties.get("time") else None
+        if parsed is not None:
+            times.append(parsed[0])
+            tz = tz or parsed[1]
+        else:
+            times.append(None)
+    has_time = [value is not None for value in times]
+
+    orders = [
+        split_order(properties.get("order"), seq) for seq, (_, properties) in enumerate(points, 1)
+    ]
+
+    # 無法以欄位表示的時間（空值或無法解析的字串）原樣放在 extras
+    for index, (_, properties) in enumerate(points):
+        if "time" in properties and times[index] is None:
+            extras.setdefault(str(index), {})["time"] = properties["time"]
+
+    columns = bytearray()
+    write_deltas(columns, lats)
+    write_deltas(columns, lons)
+    write_bitmap(columns, has_elevation)
+    write_deltas(columns, [quantize(value, ELEVATION_SCALE) for value in elevations if value is not None])
+    write_bitmap(columns, has_time)
+    write_deltas(columns, [value for value in times if value is not None])
+    for _, properties in points:
+        write_varint(columns, intern(properties.get("type")))
+        write_varint(columns, intern(properties.get("name")))
+    for seq, (kind, number, label) in enumerate(orders, 1):
+        write_varint(columns, kind)
+        if kind != ORDER_NONE:
+            write_signed(columns, number - seq)
+        if kind in (ORDER_LABEL, ORDER_TEXT):
+            write_varint(columns, intern(label))
+    for coords in line_coords:
+        write_varint(columns, len(coords))
+        write_deltas(columns, [lat for lat, _ in coords])
+        write_deltas(columns, [lon for _, lon in coords])
+
+    meta = {
+        "collection": {key: value for key, value in geojson.items() if key != "features"},
+        "lines": line_meta,
+        "extras": extras,
+        "tz": tz or "+0000",
+        "strings": strings,
+    }
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    out = bytearray(MAGIC)
+    write_varint(out, len(meta_bytes))
+    out += meta_bytes
+    write_varint(out, len(points))
+    out += columns
+    return bytes(out)
+
+
+# ---------- 解碼 ----------
+
+def decode_route(data: bytes) -> dict:
+    """二進位 → GeoJSON FeatureCollection"""
+    if data[:4] != MAGIC:
+        raise RouteCodecError("不是路線二進位格式")
+    reader = Reader(data, 4)
+    try:
+        meta = json.loads(reader.raw(reader.varint()).decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise RouteCodecError(f"標頭內容不正確: {e}")
+    strings = [None] + meta["strings"]
+    tz = meta["tz"]
+    count = reader.varint()
+
+    lats = reader.deltas(count)
+    lons = reader.deltas(count)
+    has_elevation = reader.bitmap(count)
+    elevations = iter(reader.deltas(sum(has_elevation)))
+    has_time = reader.bitmap(count)
+    times = iter(reader.deltas(sum(has_time)))
+    types_names = [(strings[reader.varint()], strings[reader.varint()]) for _ in range(count)]
+
+    point_features = []
+    for index in range(count):
+        seq = index + 1
+        kind = reader.varint()
+        if kind == ORDER_NONE:
+            order = None
+        else:
+            number = seq + reader.signed()
+            if kind == ORDER_INT:
+                order = number
+            elif kind == ORDER_DIGITS:
+                order = str(number)
+            elif kind == ORDER_LABEL:
+                order = f"{number}{strings[reader.varint()]}"
+            elif kind == ORDER_TEXT:
+                order = strings[reader.varint()]
+            else:
+                raise RouteCodecError(f"未知的順序種類: {kind}")
+
+        point_type, name = types_names[index]
+        properties = {
+            "order": order,
+            "type": point_type,
+            "name": name,
+            "elevation": next(elevations) / ELEVATION_SCALE if has_elevation[index] else None,
+        }
+        if has_time[index]:
+            properties["time"] = format_time(next(times), tz)
+        properties.update(meta["extras"].get(str(index), {}))
+        point_features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [lons[index] / COORD_SCALE, lats[index] / COORD_SCALE],
+                },
+                "properties": properties,
+            }
+        )
+
+    shared_coords = [[lon / COORD_SCALE, lat / COORD_SCALE] for lat, lon in zip(lats, lons)]
+    line_features = []
+    for line in meta["lines"]:
+        if line["type"] == "LineString":
+            if line.get("shared"):
+                coordinates = [list(coords) for coords in shared_coords]
+            else:
+                line_count = reader.varint()
+                line_lats = reader.deltas(line_count)
+                line_lons = reader.deltas(line_count)
+                coordinates = [
+                    [lon / COORD_SCALE, lat / COORD_SCALE] for lat, lon in zip(line_lats, line_lons)
+                ]
+            geometry = {"type": "LineString", "coordinates": coordinates}
+        else:
+            geometry = line["geometry"]
+        line_features.append(
+            (line["position"], {"type": "Feature", "geometry": geometry, "properties": line["properties"]})
+        )
+
+    features = point_features
+    for position, feature in line_features:
+        features.insert(position, feature)
+
+    geojson = dict(meta["collection"])
+    geojson["features"] = features
+    return geojson
+
+
+# ---------- 檔案 ----------
+
+def encode_geojson_file(geojson_path: Path) -> bytes:
+    """讀取 GeoJSON 檔案（可為 .geojson.gz）並編碼"""
+    return encode_route(json.loads(read_text(geojson_path)))
+
+
+def encode_file(geojson_path: Path, output_path: Path = None) -> Path:
+    """GeoJSON 檔案 → .grc 檔案"""
+    geojson_path = Path(geojson_path)
+    output_path = Path(output_path) if output_path else plain_path(geojson_path).with_suffix(FILE_SUFFIX)
+    output_path.write_bytes(encode_geojson_file(geojson_path))
+    return output_path
+
+
+def decode_file(route_path: Path, output_path: Path = None) -> Path:
+    """.grc 檔案 → GeoJSON 檔案"""
+    route_path = Path(route_path)
+    output_path = Path(output_path) if output_path else route_path.with_suffix(".geojson")
+    geojson = decode_route(route_path.read_bytes())
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(geojson, f, ensure_ascii=False, indent=2)
+    return output_path
+
+
+def print_stats(folder: Path) -> None:
+    """統計資料夾中所有 GeoJSON 的編碼前後大小"""
+    total_json = 0
+    total_binary = 0
+    files = [path for route_dir in sorted({p.parent for p in Path(folder).rglob("*.geojson*")})
+             for path in list_geojson(route_dir)]
+    for geojson_path in files:
+        encoded = encode_geojson_file(geojson_path)
+        total_json += geojson_path.stat().st_size
+        total_binary += len(encoded)
+    if not files:
+        print("找不到 GeoJSON 檔案")
+        return
+    print(f"{len(files)} 個檔案：GeoJSON {total_json / 1024:.1f} KB → 二進位 {total_binary / 1024:.1f} KB "
+          f"（{total_json / max(total_binary, 1):.1f} 倍）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="路線 GeoJSON 與二進位格式互轉")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    encode_parser = subparsers.add_parser("encode", help="GeoJSON → 二進位")
+    encode_parser.add_argument("input")
+    encode_parser.add_argument("output", nargs="?")
+    decode_parser = subparsers.add_parser("decode", help="二進位 → GeoJSON")
+    decode_parser.add_argument("input")
+    decode_parser.add_argument("output", nargs="?")
+    stats_parser = subparsers.add_parser("stats", help="統計資料夾的壓縮比")
+    stats_parser.add_argument("folder")
+    args = parser.parse_args()
+
+    if args.command == "encode":
+        print(f"已輸出: {encode_file(args.input, args.output)}")
+    elif args.command == "decode":
+        print(f"已輸出: {decode_file(args.input, args.output)}")
+    else:
+        print_stats(args.folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線資料品質檢查
+在 pt_process 之前檢查 data_raw/gpx 的軌跡（或 已改好的txt_geojson 的編輯結果），
+找出會被 final_time_sort 默默吸收、進而影響坡度特徵的錯誤資料：
+
+  missing_time / missing_elevation  缺少時間或海拔
+  time_reversal     時間比前一點早
+  duplicate_time    時間與前一點相同
+  speed             水平速度超過 max_speed
+  teleport          單點飄移：進出該點的速度都超過 max_speed，略過該點則正常
+  vertical_speed    垂直速度超過 max_vspeed
+  elevation_spike   海拔偏離滑動中位數超過 spike_m，且同時高於（或低於）前後兩點
+
+所有檢查都以 NumPy 陣列運算完成，整個語料可在數秒內掃描完畢。
+--repair 會修正 GPX：移除飄移點與時間倒退、重複的點，海拔突波改為滑動中位數
+（原始檔備份於 data_raw/gpx_original/）。
+
+    python route_qa.py                      # 檢查 data_raw/gpx，寫出 qa_report.csv
+    python route_qa.py --source edited      # 檢查 已改好的txt_geojson，寫出 qa_report_edited.csv
+    python route_qa.py --repair mt_jade_west
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import sys
+import warnings
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from geodesy import consecutive_distances, haversine
+from geojson_layout import existing_geojson, load_geojson, to_point_features
+
+DEFAULT_THRESHOLDS = {
+    "max_speed": 10.0,  # 水平速度上限（m/s）
+    "max_vspeed": 3.0,  # 垂直速度上限（m/s）
+    "spike_m": 30.0,  # 海拔突波門檻（公尺）
+    "window": 7,  # 滑動中位數視窗（點數，奇數）
+}
+
+ISSUES = (
+    "missing_time",
+    "missing_elevation",
+    "time_reversal",
+    "duplicate_time",
+    "speed",
+    "teleport",
+    "vertical_speed",
+    "elevation_spike",
+)
+
+# 修復時移除的點位類型；其餘只回報
+DROP_ISSUES = ("time_reversal", "duplicate_time", "teleport")
+
+# 移除超過此比例的點時不修復（多半是整段時間錯誤，需要人工處理）
+MAX_DROP_RATIO = 0.1
+
+# 各資料來源的報告檔名
+REPORT_NAMES = {"raw": "qa_report.csv", "edited": "qa_report_edited.csv"}
+
+
+def parse_time(text):
+    """ISO 8601 → epoch 秒；沒有時間時回傳 NaN"""
+    if not text:
+        return np.nan
+    try:
+        return datetime.fromisoformat(text.strip().replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return np.nan
+
+
+def _namespace(root) -> str:
+    return root.tag[: root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+
+
+def read_gpx_track(path: Path) -> dict:
+    """讀取 GPX 的所有軌跡點（依檔案順序，所有 trk/trkseg 串接）"""
+    root = ET.parse(path).getroot()
+    ns = _namespace(root)
+    points = list(root.iter(f"{ns}trkpt"))
+    elevations = [point.findtext(f"{ns}ele") for point in points]
+    return {
+        "lat": np.array([float(point.get("lat")) for point in points]),
+        "lon": np.array([float(point.get("lon")) for point in points]),
+        "elevation": np.array([float(ele) if ele and ele.strip() else np.nan for ele in elevations]),
+        "time": np.array([parse_time(point.findtext(f"{ns}time")) for point in points]),
+    }
+
+
+def read_geojson_track(path: Path) -> dict:
+    """
+    讀取路線 GeoJSON 的軌跡點（points 或 columnar 格式）。
+    通訊點的時間與海拔是插入時由前後點推得的，不列入檢查。
+    """
+    points = [
+        feature
+        for feature in to_point_features(load_geojson(path))["features"]
+        if feature["geometry"]["type"] == "Point"
+    ]
+    kept = [
+        (position, feature)
+        for position, feature in enumerate(points)
+        if (feature.get("properties") or {}).get("type") != "comm"
+    ]
+    features = [feature for _, feature in kept]
+    properties = [feature.get("properties") or {} for feature in features]
+    elevations = [props.get("elevation") for props in properties]
+    return {
+        "index": np.array([int(position) for position, _ in kept]),
+        "lat": np.array([feature["geometry"]["coordinates"][1] for feature in features], dtype=float),
+        "lon": np.array([feature["geometry"]["coordinates"][0] for feature in features], dtype=float),
+        "elevation": np.array([np.nan if ele in (None, "") else float(ele) for ele in elevations]),
+        "time": np.array([parse_time(props.get("time")) for props in properties]),
+    }
+
+
+def rolling_median(values: np.ndarray, window: int) -> np.ndarray:
+    """置中的滑動中位數（忽略 NaN，兩端以端點值補齊）"""
+    if len(values) == 0:
+        return values.copy()
+    half = window // 2
+    padded = np.pad(values, half, mode="edge")
+    windows = sliding_window_view(padded, 2 * half + 1)
+    with warnings.catch_warnings():
+        # 全為 NaN 的視窗結果為 NaN，不需警告
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmedian(windows, axis=1)
+
+
+def scan_track(track: dict, thresholds=None) -> dict:
+    """
+    檢查一條軌跡，回傳 {問題: (點位索引陣列, 對應數值陣列)}。
+    數值為速度（m/s）、海拔偏差（m）、時間差（秒）或距離（m），列在報告的 details 中。
+    """
+    limits = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    lat, lon, ele, t = track["lat"], track["lon"], track["elevation"], track["time"]
+    n = len(lat)
+    empty = (np.zeros(0, dtype=int), np.zeros(0))
+    issues = {issue: empty for issue in ISSUES}
+    if n == 0:
+        return issues
+
+    issues["missing_time"] = (np.flatnonzero(np.isnan(t)), np.zeros(int(np.isnan(t).sum())))
+    issues["missing_elevation"] = (np.flatnonzero(np.isnan(ele)), np.zeros(int(np.isnan(ele).sum())))
+    if n < 2:
+        return issues
+
+    distance = consecutive_distances(lat, lon)
+    dt = np.diff(t)
+    with np.errstate(all="ignore"):
+        # 單點時間超前：比之前與下一點都晚，移除後下一點接得上之前的時間。
+        # 先找出這類點，否則之後所有正常的點都會被當成時間倒退
+        outlier = np.zeros(n, dtype=bool)
+        if n >= 3:
+            before = np.fmax.accumulate(t)[:-2]
+            outlier[1:-1] = (t[1:-1] > before) & (t[1:-1] > t[2:]) & (t[2:] >= before)
+            # 第一點沒有前一點，改看後兩點：比兩者都晚，且後兩點本身順序正常
+            outlier[0] = t[0] > t[2] >= t[1]
+
+        # 排除超前的點後，時間倒退（比之前出現過的最晚時間早）與重複
+        latest = np.fmax.accumulate(np.where(outlier, np.nan, t))[:-1]
+        reversal = (t[1:] < latest) & ~outlier[1:]
+        duplicate = ~reversal & ~outlier[1:] & (t[1:] == latest)
+        ahead = np.flatnonzero(outlier)
+        index = np.concatenate([ahead, np.flatnonzero(reversal) + 1])
+        values = np.concatenate([t[ahead + 1] - t[ahead], (t[1:] - latest)[reversal]])
+        order = np.argsort(index, kind="stable")
+        issues["time_reversal"] = (index[order], values[order])
+        issues["duplicate_time"] = (np.flatnonzero(duplicate) + 1, distance[duplicate])
+
+        speed = np.where(dt > 0, distance / dt, np.nan)
+        fast = speed > limits["max_speed"]
+        issues["speed"] = (np.flatnonzero(fast) + 1, speed[fast])
+
+        vertical = np.where(dt > 0, np.abs(np.diff(ele)) / dt, np.nan)
+        steep = vertical > limits["max_vspeed"]
+        issues["vertical_speed"] = (np.flatnonzero(steep) + 1, vertical[steep])
+
+        if n >= 3:
+            # 單點飄移：i-1 → i → i+1 兩段都過快，但 i-1 → i+1 正常
+            bypass_distance = haversine(lat[:-2], lon[:-2], lat[2:], lon[2:])
+            bypass_dt = t[2:] - t[:-2]
+            bypass_speed = np.where(bypass_dt > 0, bypass_distance / bypass_dt, np.nan)
+            teleport = fast[:-1] & fast[1:] & (bypass_speed <= limits["max_speed"])
+            index = np.flatnonzero(teleport) + 1
+            issues["teleport"] = (index, np.fmin(speed[index - 1], speed[index]))
+
+            # 海拔突波：偏離滑動中位數，且同時高於（或低於）前後兩點至少門檻的一半
+            deviation = ele - rolling_median(ele, int(limits["window"]))
+            rise = ele[1:-1] - ele[:-2]
+            fall = ele[1:-1] - ele[2:]
+            spike = (
+                (np.abs(deviation[1:-1]) > limits["spike_m"])
+                & (np.sign(rise) == np.sign(fall))
+                & (np.fmin(np.abs(rise), np.abs(fall)) > limits["spike_m"] / 2)
+            )
+            index = np.flatnonzero(spike) + 1
+            issues["elevation_spike"] = (index, deviation[index])
+    return issues
+
+
+def repair_plan(track: dict, issues: dict, window: int):
+    """
+    修復內容：(保留的點位遮罩, 修正後的海拔陣列)。
+    移除的點超過 MAX_DROP_RATIO 時回傳 None。
+    """
+    n = len(track["lat"])
+    drop = np.zeros(n, dtype=bool)
+    for issue in DROP_ISSUES:
+        drop[issues[issue][0]] = True
+    if n and drop.sum() / n > MAX_DROP_RATIO:
+        return None
+
+    elevation = track["elevation"].copy()
+    spikes = issues["elevation_spike"][0]
+    if len(spikes):
+        # 以移除突波後的滑動中位數取代
+        cleaned = elevation.copy()
+        cleaned[spikes] = np.nan
+        elevation[spikes] = np.round(rolling_median(cleaned, window)[spikes], 1)
+    return ~drop, elevation
+
+
+def _register_namespaces(path: Path) -> None:
+    """沿用原檔的命名空間前綴，避免寫回時變成 ns0:"""
+    for _, (prefix, uri) in ET.iterparse(path, events=("start-ns",)):
+        ET.register_namespace(prefix, uri)
+
+
+def repair_gpx(path: Path, keep: np.ndarray, elevation: np.ndarray, backup_dir: Path) -> None:
+    """依修復內容改寫 GPX（只改動被移除的點與修正的海拔），原檔先備份"""
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    backup = backup_dir / path.name
+    if not backup.exists():
+        shutil.copy2(path, backup)
+
+    _register_namespaces(path)
+    tree = ET.parse(path)
+    root = tree.getroot()
+    ns = _namespace(root)
+    index = 0
+    for segment in root.iter(f"{ns}trkseg"):
+        for point in list(segment.findall(f"{ns}trkpt")):
+            if not keep[index]:
+                segment.remove(point)
+            else:
+                ele = point.find(f"{ns}ele")
+                if ele is not None and not np.isnan(elevation[index]):
+                    original = float(ele.text) if ele.text and ele.text.strip() else np.nan
+                    if original != elevation[index]:
+                        ele.text = f"{elevation[index]:.1f}"
+            index += 1
+    tree.write(path, encoding="UTF-8", xml_declaration=True)
+
+
+def list_sources(base_dir: Path, source: str, routes=None) -> dict:
+    """路線名稱 → 要檢查的檔案"""
+    base_dir = Path(base_dir)
+    if source == "raw":
+        folder = base_dir / "data_raw" / "gpx"
+        files = {path.stem: path for path in sorted(folder.glob("*.gpx"))} if folder.is_dir() else {}
+    else:
+        folder = base_dir / "已改好的txt_geojson"
+        files = {}
+        if folder.is_dir():
+            for route_dir in sorted(path for path in folder.iterdir() if path.is_dir()):
+                geojson_file = existing_geojson(route_dir / "route.geojson")
+                if geojson_file is not None:
+                    files[route_dir.name] = geojson_file
+    if routes:
+        files = {name: path for name, path in files.items() if name in routes}
+    return files
+
+
+def read_track(path: Path) -> dict:
+    return read_gpx_track(path) if path.suffix == ".gpx" else read_geojson_track(path)
+
+
+def summarize(route_name: str, track: dict, issues: dict, max_details=5) -> dict:
+    """一條路線的報告列：各問題的點數與前幾個點位（檔案中的順序，從 0 起算）"""
+    row = {"route": route_name, "points": len(track["lat"])}
+    details = []
+    for issue in ISSUES:
+        index, values = issues[issue]
+        if "index" in track:
+            # 以檔案中的點位順序回報
+            index = track["index"][index]
+        row[issue] = len(index)
+        if len(index) and not issue.startswith("missing"):
+            shown = ", ".join(f"{i}({v:.1f})" for i, v in zip(index[:max_details].tolist(), values[:max_details].tolist()))
+            more = f" 等 {len(index)} 點" if len(index) > max_details else ""
+            details.append(f"{issue}: {shown}{more}")
+    row["details"] = "; ".join(details)
+    return row
+
+
+def scan_files(files: dict, thresholds=None) -> list:
+    """檢查多條路線，回傳 [(路線, 軌跡, 問題)]"""
+    results = []
+    for route_name, path in files.items():
+        track = read_track(path)
+        results.append((route_name, track, scan_track(track, thresholds)))
+    return results
+
+
+def write_report(path: Path, rows: list, keep_existing=False) -> None:
+    """寫出 qa_report.csv；keep_existing 時保留報告中其他路線的列"""
+    path = Path(path)
+    fieldnames = ["route", "points", *ISSUES, "details"]
+    if keep_existing and path.exists():
+        updated = {row["route"] for row in rows}
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            existing = [row for row in csv.DictReader(f) if row["route"] not in updated]
+        rows = sorted(existing + rows, key=lambda row: row["route"])
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_summary(rows: list) -> int:
+    """印出有問題的路線，回傳有問題的路線數"""
+    flagged = [row for row in rows if any(int(row[issue]) for issue in ISSUES)]
+    print(f"檢查了 {len(rows)} 條路線，{len(flagged)} 條有問題")
+    for row in flagged:
+        counts = ", ".join(f"{issue} {row[issue]}" for issue in ISSUES if int(row[issue]))
+        print(f"  {row['route']}（{row['points']} 點）: {counts}")
+        if row["details"]:
+            print(f"    {row['details']}")
+    return len(flagged)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="檢查路線軌跡的時間、速度與海拔錯誤")
+    parser.add_argument("routes", nargs="*", help="只檢查指定的路線名稱（預設為全部）")
+    parser.add_argument("--base-dir", default=os.environ.get("GPX_TOOL_BASE_DIR", "."),
+                        help="專案資料根目錄（預設為目前目錄）")
+    parser.add_argument("--source", choices=["raw", "edited"], default="raw",
+                        help="raw：data_raw/gpx；edited：已改好的txt_geojson")
+    parser.add_argument("--max-speed", type=float, default=DEFAULT_THRESHOLDS["max_speed"],
+                        help="水平速度上限（m/s）")
+    parser.add_argument("--max-vspeed", type=float, default=DEFAULT_THRESHOLDS["max_vspeed"],
+                        help="垂直速度上限（m/s）")
+    parser.add_argument("--spike", type=float, default=DEFAULT_THRESHOLDS["spike_m"],
+                        help="海拔突波門檻（公尺）")
+    parser.add_argument("--window", type=int, default=DEFAULT_THRESHOLDS["window"],
+                        help="滑動中位數視窗點數")
+    parser.add_argument("--report", help="報告路徑（預設為 <base-dir>/qa_report.csv 或 qa_report_edited.csv）")
+    parser.add_argument("--repair", action="store_true", help="修正 GPX（只適用於 --source raw）")
+    parser.add_argument("--strict", action="store_true", help="有任何問題時以結束碼 1 結束")
+    args = parser.parse_args()
+    if args.repair and args.source != "raw":
+        parser.error("--repair 只能用於 --source raw")
+
+    base_dir = Path(args.base_dir)
+    thresholds = {
+        "max_speed": args.max_speed,
+        "max_vspeed": args.max_vspeed,
+        "spike_m": args.spike,
+        "window": args.window,
+    }
+    files = list_sources(base_dir, args.source, args.routes)
+    if not files:
+        print("找不到要檢查的路線")
+        return
+
+    results = scan_files(files, thresholds)
+    rows = [summarize(route_name, track, issues) for route_name, track, issues in results]
+    flagged = print_summary(rows)
+    report_path = Path(args.report) if args.report else base_dir / REPORT_NAMES[args.source]
+    write_report(report_path, rows, keep_existing=bool(args.routes))
+    print(f"報告已儲存至 {report_path}")
+
+    if args.repair:
+        backup_dir = base_dir / "data_raw" / "gpx_original"
+        for route_name, track, issues in results:
+            plan = repair_plan(track, issues, args.window)
+            if plan is None:
+                print(f"  {route_name}: 需移除的點超過 {MAX_DROP_RATIO:.0%}，不自動修復")
+                continue
+            keep, elevation = plan
+            dropped = int((~keep).sum())
+            fixed = len(issues["elevation_spike"][0])
+            if dropped or fixed:
+                repair_gpx(files[route_name], keep, elevation, backup_dir)
+                print(f"  {route_name}: 移除 {dropped} 點，修正 {fixed} 個海拔突波（原檔備份於 {backup_dir}）")
+
+    if args.strict and flagged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,159 +1,122 @@
-import pandas as pd
-import json
+# pandas 載入較慢，只在實際處理時才匯入
+from __future__ import annotations
+
 import os
-import math
 from pathlib import Path
-from typing import List, Dict, Tuple, Any
+from typing import TYPE_CHECKING, List, Dict, Tuple, Any
 
+import numpy as np
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """計算兩點間的地理距離（公尺），使用 Haversine 公式"""
-    # 轉換為弧度
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+from geodesy import chainage
+from geojson_layout import existing_geojson, load_geojson, write_geojson
+
+if TYPE_CHECKING:
+    import pandas as pd
 
-    # Haversine 公式
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = (
-        math.sin(dlat / 2) ** 2
-        + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
-    )
-    c = 2 * math.asin(math.sqrt(a))
 
-    # 地球半徑（公尺）
-    earth_radius = 6371000
-    return earth_radius * c
+def _is_missing(value) -> bool:
+    """缺值（NaN、空字串或 N/A）"""
+    import pandas as pd
+
+    return pd.isna(value) or str(value).strip() in ("", "N/A")
 
 
 def interpolate_missing_data_df(df: pd.DataFrame) -> pd.DataFrame:
     """對 DataFrame 中缺少時間和高度的點位進行插值"""
     from datetime import datetime
 
+    import pandas as pd
+
     # 建立副本避免修改原始資料
     df_copy = df.copy()
 
-    # 處理高度插值
-    for i in range(len(df_copy)):
-        if (
-            pd.isna(df_copy.iloc[i].get("海拔（約）"))
-            or str(df_copy.iloc[i].get("海拔（約）")).strip() == "N/A"
-        ):
-            # 找前一個有高度的點
+    # 座標不會被插值改動，累積里程只需計算一次
+    distances = chainage(
+        pd.to_numeric(df_copy["緯度"], errors="coerce").to_numpy(dtype=float),
+        pd.to_numeric(df_copy["經度"], errors="coerce").to_numpy(dtype=float),
+    ).tolist()
+
+    # 處理高度插值（已插值的點會作為後續缺值點的前一個點）
+    elevations = [None if _is_missing(v) else float(v) for v in df_copy["海拔（約）"].tolist()]
+    for i in [i for i, ele in enumerate(elevations) if ele is None]:
+        # 找前一個有高度的點
+        prev_idx = i - 1
+        while prev_idx >= 0 and elevations[prev_idx] is None:
+            prev_idx -= 1
+
+        # 找後一個有高度的點
+        next_idx = i + 1
+        while next_idx < len(elevations) and elevations[next_idx] is None:
+            next_idx += 1
+
+        # 如果前後都有高度，進行插值
+        if prev_idx >= 0 and next_idx < len(elevations):
+            # 由累積里程取得區間距離
+            total_distance = distances[next_idx] - distances[prev_idx]
+            current_distance = distances[i] - distances[prev_idx]
+
+            # 高度插值
+            if total_distance > 0:
+                ratio = current_distance / total_distance
+                prev_ele = elevations[prev_idx]
+                next_ele = elevations[next_idx]
+                elevations[i] = round(prev_ele + (next_ele - prev_ele) * ratio, 1)
+                df_copy.iloc[i, df_copy.columns.get_loc("海拔（約）")] = elevations[i]
+
+    # 處理時間插值（如果有時間欄位）
+    if "時間" in df_copy.columns:
+        times = [None if _is_missing(v) else str(v) for v in df_copy["時間"].tolist()]
+        for i in [i for i, t in enumerate(times) if t is None]:
+            # 找前一個有時間的點
             prev_idx = i - 1
-            while prev_idx >= 0 and (
-                pd.isna(df_copy.iloc[prev_idx].get("海拔（約）"))
-                or str(df_copy.iloc[prev_idx].get("海拔（約）")).strip() == "N/A"
-            ):
+            while prev_idx >= 0 and times[prev_idx] is None:
                 prev_idx -= 1
 
-            # 找後一個有高度的點
+            # 找後一個有時間的點
             next_idx = i + 1
-            while next_idx < len(df_copy) and (
-                pd.isna(df_copy.iloc[next_idx].get("海拔（約）"))
-                or str(df_copy.iloc[next_idx].get("海拔（約）")).strip() == "N/A"
-            ):
+            while next_idx < len(times) and times[next_idx] is None:
                 next_idx += 1
 
-            # 如果前後都有高度，進行插值
-            if prev_idx >= 0 and next_idx < len(df_copy):
-                prev_point = df_copy.iloc[prev_idx]
-                next_point = df_copy.iloc[next_idx]
-
-                # 計算累積距離
-                total_distance = 0
-                current_distance = 0
-
-                for j in range(prev_idx, next_idx):
-                    dist = calculate_distance(
-                        float(df_copy.iloc[j]["緯度"]),
-                        float(df_copy.iloc[j]["經度"]),
-                        float(df_copy.iloc[j + 1]["緯度"]),
-                        float(df_copy.iloc[j + 1]["經度"]),
-                    )
-                    total_distance += dist
-                    if j < i:
-                        current_distance += dist
-
-                # 高度插值
+            # 如果前後都有時間，進行插值
+            if prev_idx >= 0 and next_idx < len(times):
+                # 由累積里程取得區間距離
+                total_distance = distances[next_idx] - distances[prev_idx]
+                current_distance = distances[i] - distances[prev_idx]
+
+                # 時間插值
                 if total_distance > 0:
                     ratio = current_distance / total_distance
-                    prev_ele = float(prev_point["海拔（約）"])
-                    next_ele = float(next_point["海拔（約）"])
-                    interpolated_ele = prev_ele + (next_ele - prev_ele) * ratio
-                    df_copy.iloc[i, df_copy.columns.get_loc("海拔（約）")] = round(
-                        interpolated_ele, 1
-                    )
-
-    # 處理時間插值（如果有時間欄位）
-    if "時間" in df_copy.columns:
-        for i in range(len(df_copy)):
-            if pd.isna(df_copy.iloc[i].get("時間")) or str(
-                df_copy.iloc[i].get("時間")
-            ).strip() in ["", "N/A"]:
-                # 找前一個有時間的點
-                prev_idx = i - 1
-                while prev_idx >= 0 and (
-                    pd.isna(df_copy.iloc[prev_idx].get("時間"))
-                    or str(df_copy.iloc[prev_idx].get("時間")).strip() in ["", "N/A"]
-                ):
-                    prev_idx -= 1
-
-                # 找後一個有時間的點
-                next_idx = i + 1
-                while next_idx < len(df_copy) and (
-                    pd.isna(df_copy.iloc[next_idx].get("時間"))
-                    or str(df_copy.iloc[next_idx].get("時間")).strip() in ["", "N/A"]
-                ):
-                    next_idx += 1
-
-                # 如果前後都有時間，進行插值
-                if prev_idx >= 0 and next_idx < len(df_copy):
-                    prev_point = df_copy.iloc[prev_idx]
-                    next_point = df_copy.iloc[next_idx]
-
-                    # 計算累積距離
-                    total_distance = 0
-                    current_distance = 0
-
-                    for j in range(prev_idx, next_idx):
-                        dist = calculate_distance(
-                            float(df_copy.iloc[j]["緯度"]),
-                            float(df_copy.iloc[j]["經度"]),
-                            float(df_copy.iloc[j + 1]["緯度"]),
-                            float(df_copy.iloc[j + 1]["經度"]),
+                    try:
+                        prev_time = datetime.fromisoformat(
+                            times[prev_idx].replace("Z", "+00:00")
                         )
-                        total_distance += dist
-                        if j < i:
-                            current_distance += dist
-
-                    # 時間插值
-                    if total_distance > 0:
-                        ratio = current_distance / total_distance
-                        prev_time_str = str(prev_point["時間"])
-                        next_time_str = str(next_point["時間"])
-
-                        try:
-                            prev_time = datetime.fromisoformat(
-                                prev_time_str.replace("Z", "+00:00")
-                            )
-                            next_time = datetime.fromisoformat(
-                                next_time_str.replace("Z", "+00:00")
-                            )
-                            time_diff = next_time - prev_time
-                            interpolated_time = prev_time + time_diff * ratio
-                            df_copy.iloc[
-                                i, df_copy.columns.get_loc("時間")
-                            ] = interpolated_time.isoformat().replace(
-                                "+00:00", "+00:00"
-                            )
-                        except:
-                            pass  # 如果時間格式有問題，跳過
+                        next_time = datetime.fromisoformat(
+                            times[next_idx].replace("Z", "+00:00")
+                        )
+                        time_diff = next_time - prev_time
+                        times[i] = (prev_time + time_diff * ratio).isoformat()
+                        df_copy.iloc[i, df_copy.columns.get_loc("時間")] = times[i]
+                    except ValueError:
+                        pass  # 如果時間格式有問題，跳過
 
     return df_copy
 
 
 def read_points_file(points_path: Path) -> pd.DataFrame:
-    """讀取 points.txt 檔案"""
+    """讀取 points.txt 檔案（經由同目錄的 points.bin，見 points_table）"""
+    import pandas as pd
+
+    from points_table import load_points
+
+    try:
+        return load_points(Path(points_path).parent)
+    except ValueError as e:
+        # 無法轉成型別化格式（欄位或順序格式不同），直接讀取 TSV
+        print(f"  {points_path} 無法轉為 points.bin（{e}），改為直接讀取")
+    except Exception as e:
+        print(f"讀取 {points_path} 失敗: {e}")
+        return pd.DataFrame()
+
     try:
         df = pd.read_csv(points_path, sep="\t", encoding="utf-8-sig")
         return df
@@ -163,18 +126,21 @@ def read_points_file(points_path: Path) -> pd.DataFrame:
 
 
 def read_geojson_file(geojson_path: Path) -> Dict[str, Any]:
-    """讀取 route.geojson 檔案"""
+    """讀取 route.geojson 檔案（points 或 columnar 格式）"""
     try:
-        with open(geojson_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return load_geojson(geojson_path)
     except Exception as e:
         print(f"讀取 {geojson_path} 失敗: {e}")
         return {}
 
 
-def read_original_comm_points(route_name: str) -> List[Dict[str, Any]]:
+def read_original_comm_points(
+    route_name: str, raw_txt_dir: Path = Path("./data_raw/txt")
+) -> List[Dict[str, Any]]:
     """讀取原始通訊點資料"""
-    raw_txt_path = Path(f"./data_raw/txt/{route_name}.txt")
+    import pandas as pd
+
+    raw_txt_path = Path(raw_txt_dir) / f"{route_name}.txt"
 
     if not raw_txt_path.exists():
         print(f"  找不到原始通訊點檔案: {raw_txt_path}")
@@ -208,38 +174,46 @@ def find_comm_points_in_original_route(
     df: pd.DataFrame, original_comm_points: List[Dict[str, Any]]
 ) -> List[Tuple[int, str, str]]:
     """在原始路線中找出通訊點位置（用於確定來回路線的切分點）"""
+    import pandas as pd
+
+    from map_match import match_ordered_points, nearest_vertex
+
     comm_points = []
+    lats = pd.to_numeric(df["緯度"], errors="coerce").to_numpy(dtype=float)
+    lons = pd.to_numeric(df["經度"], errors="coerce").to_numpy(dtype=float)
+
+    # 依通訊點順序對應到路線上（路線從自己旁邊經過時不會對到錯誤的一段），
+    # 對應不到的通訊點改用最接近的點
+    valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+    matches = match_ordered_points(
+        lats[valid],
+        lons[valid],
+        np.array([pt["lat"] for pt in original_comm_points], dtype=float),
+        np.array([pt["lon"] for pt in original_comm_points], dtype=float),
+    )
 
     # 為每個原始通訊點找到在原始路線中的對應位置
-    for original_pt in original_comm_points:
+    for original_pt, match in zip(original_comm_points, matches):
         target_lat = original_pt["lat"]
         target_lon = original_pt["lon"]
         target_name = original_pt["name"]
 
-        # 在 DataFrame 中尋找最接近的點
-        min_distance = float("inf")
-        best_match_idx = None
-        best_match_order = None
-
-        for idx, row in df.iterrows():
-            row_lat = float(row.get("緯度", 0))
-            row_lon = float(row.get("經度", 0))
-
-            # 計算距離（簡單的歐幾里得距離）
-            distance = (
-                (row_lat - target_lat) ** 2 + (row_lon - target_lon) ** 2
-            ) ** 0.5
-
-            if distance < min_distance:
-                min_distance = distance
-                best_match_idx = idx
-                best_match_order = str(row.get("順序", ""))
-
-        if best_match_idx is not None:
-            comm_points.append((best_match_idx, target_name, best_match_order))
-            print(
-                f"    找到通訊點 '{target_name}' 在原始路線索引 {best_match_idx} (順序: {best_match_order})"
-            )
+        if match is not None:
+            position = int(valid[nearest_vertex(match)])
+        else:
+            # 在 DataFrame 中尋找最接近的點（簡單的歐幾里得距離，相同時取第一個）
+            distances = (lats - target_lat) ** 2 + (lons - target_lon) ** 2
+            distances[np.isnan(distances)] = np.inf
+            if not (len(distances) and np.isfinite(distances.min())):
+                continue
+            position = int(np.argmin(distances))
+
+        best_match_idx = df.index[position]
+        best_match_order = str(df["順序"].iloc[position])
+        comm_points.append((best_match_idx, target_name, best_match_order))
+        print(
+            f"    找到通訊點 '{target_name}' 在原始路線索引 {best_match_idx} (順序: {best_match_order})"
+        )
 
     # 按照在路線中的順序排列
     comm_points.sort(key=lambda x: x[0])
@@ -349,6 +323,8 @@ def calculate_roundtrip_segments(
 
 def create_roundtrip_route(df: pd.DataFrame) -> pd.DataFrame:
     """建立往返路線：從最後一個點開始反向重複"""
+    import pandas as pd
+
     if len(df) <= 1:
         return df.copy()
 
@@ -396,12 +372,15 @@ def create_roundtrip_comm_points(
     return roundtrip_comm
 
 
-def export_segment_geojson(
-    segment: Dict[str, Any], output_path: Path, route_name: str, part_num: int
-) -> None:
-    """匯出路線段的 GeoJSON 檔案（來回路線的切分段）"""
-    filename = f"{route_name}_part{part_num}.geojson"
-    file_path = output_path / filename
+def segment_filename(route_name: str, part_num: int) -> str:
+    return f"{route_name}_part{part_num}.geojson"
+
+
+def build_segment_geojson(
+    segment: Dict[str, Any], route_name: str, part_num: int
+) -> Dict[str, Any]:
+    """建立路線段的 GeoJSON（來回路線的切分段）"""
+    import pandas as pd
 
     # 建立新的 GeoJSON
     new_geojson = {"type": "FeatureCollection", "features": []}
@@ -460,19 +439,31 @@ def export_segment_geojson(
 
         new_geojson["features"].append(point_feature)
 
+    return new_geojson
+
+
+def export_segment_geojson(
+    segment: Dict[str, Any],
+    output_path: Path,
+    route_name: str,
+    part_num: int,
+    layout: str = None,
+    geojson: Dict[str, Any] = None,
+) -> None:
+    """匯出路線段的 GeoJSON 檔案；geojson 為已建立好的內容時直接寫入"""
+    filename = segment_filename(route_name, part_num)
+    if geojson is None:
+        geojson = build_segment_geojson(segment, route_name, part_num)
+
     # 匯出檔案
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(new_geojson, f, ensure_ascii=False, indent=2)
+    write_geojson(output_path / filename, geojson, layout)
 
     print(f"      匯出來回切分路線: {filename}")
 
 
-def export_roundtrip_geojson(
-    df: pd.DataFrame, output_path: Path, route_name: str
-) -> None:
-    """匯出往返路線的 GeoJSON 檔案"""
-    filename = f"{route_name}_roundtrip.geojson"
-    file_path = output_path / filename
+def build_roundtrip_geojson(df: pd.DataFrame, route_name: str) -> Dict[str, Any]:
+    """建立往返路線的 GeoJSON"""
+    import pandas as pd
 
     # 建立新的 GeoJSON
     new_geojson = {"type": "FeatureCollection", "features": []}
@@ -525,9 +516,23 @@ def export_roundtrip_geojson(
 
         new_geojson["features"].append(point_feature)
 
+    return new_geojson
+
+
+def export_roundtrip_geojson(
+    df: pd.DataFrame,
+    output_path: Path,
+    route_name: str,
+    layout: str = None,
+    geojson: Dict[str, Any] = None,
+) -> None:
+    """匯出往返路線的 GeoJSON 檔案；geojson 為已建立好的內容時直接寫入"""
+    filename = f"{route_name}_roundtrip.geojson"
+    if geojson is None:
+        geojson = build_roundtrip_geojson(df, route_name)
+
     # 匯出檔案
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(new_geojson, f, ensure_ascii=False, indent=2)
+    write_geojson(output_path / filename, geojson, layout)
 
     print(f"      匯出往返路線: {filename}")
 
@@ -536,6 +541,8 @@ def export_roundtrip_txt(
     comm_points: List[Dict[str, Any]], output_path: Path, route_name: str
 ) -> None:
     """匯出往返通訊點的 TXT 檔案"""
+    import pandas as pd
+
     filename = f"{route_name}_roundtrip.txt"
     file_path = output_path / filename
 
@@ -560,30 +567,34 @@ def export_roundtrip_txt(
     print(f"      匯出往返通訊點: {filename}")
 
 
-def process_single_route(route_name: str, output_base: Path) -> None:
-    """處理單一路線的完整流程"""
-    print(f"\n處理 {route_name}")
-
+def load_route_source(
+    route_name: str,
+    source_dir: Path = Path("./已改好的txt_geojson"),
+    raw_txt_dir: Path = Path("./data_raw/txt"),
+):
+    """
+    讀取路線的 points.txt（並插值）與原始通訊點。
+    回傳 (points DataFrame, 原始通訊點清單)，資料不完整時回傳 None。
+    """
     # 檔案路徑
-    points_file = Path(f"./已改好的txt_geojson/{route_name}/points.txt")
-    geojson_file = Path(f"./已改好的txt_geojson/{route_name}/route.geojson")
+    points_file = Path(source_dir) / route_name / "points.txt"
+    geojson_file = Path(source_dir) / route_name / "route.geojson"
 
     # 檢查檔案是否存在
     if not points_file.exists():
         print(f"  找不到 {points_file}")
-        return
-    if not geojson_file.exists():
+        return None
+    if existing_geojson(geojson_file) is None:
         print(f"  找不到 {geojson_file}")
-        return
+        return None
 
     # 讀取資料
     print(f"  -> 讀取資料...")
     df = read_points_file(points_file)
-    geojson = read_geojson_file(geojson_file)
 
-    if df.empty or not geojson:
+    if df.empty:
         print(f"  資料讀取失敗")
-        return
+        return None
 
     # 進行插值處理
     print(f"  -> 進行高度和時間插值...")
@@ -591,21 +602,28 @@ def process_single_route(route_name: str, output_base: Path) -> None:
 
     # 讀取原始通訊點資料
     print(f"  -> 讀取原始通訊點資料...")
-    original_comm_points = read_original_comm_points(route_name)
+    original_comm_points = read_original_comm_points(route_name, raw_txt_dir)
 
     if not original_comm_points:
         print(f"  無法讀取原始通訊點資料")
-        return
+        return None
 
-    # 建立輸出目錄
-    cut_output_dir = output_base / "1.切分過的路線" / route_name
-    roundtrip_geojson_dir = output_base / "2.往前重複的geojson" / route_name
-    roundtrip_txt_dir = output_base / "3.往前重複的txt" / route_name
+    return df, original_comm_points
 
-    cut_output_dir.mkdir(parents=True, exist_ok=True)
-    roundtrip_geojson_dir.mkdir(parents=True, exist_ok=True)
-    roundtrip_txt_dir.mkdir(parents=True, exist_ok=True)
 
+def split_route(
+    route_name: str,
+    df: pd.DataFrame,
+    original_comm_points: List[Dict[str, Any]],
+    pace: Dict[str, Any] = None,
+) -> Dict[str, Any]:
+    """
+    建立來回路線並依通訊點切分（不寫檔）。
+    pace: 以步行速度模型推算回程時間（pace.pace_points 的參數，如 {"model", "factor"}）
+
+    回傳 {"segments": [{"part_number", "filename", "segment", "geojson"}...],
+          "roundtrip": 往返路線 DataFrame, "roundtrip_geojson": ..., "roundtrip_comm": [...]}
+    """
     # *** 修正流程：先在原始路線找通訊點，再建立來回路線，最後按邏輯切分 ***
 
     # 1. 在原始路線中定位通訊點位置
@@ -617,7 +635,15 @@ def process_single_route(route_name: str, output_base: Path) -> None:
     # 2. 建立完整的來回路線
     print(f"  -> 建立來回路線...")
     roundtrip_route = create_roundtrip_route(df)
+    if pace:
+        from pace import pace_points
 
+        # 回程沿用的是去程時間的倒序；清除後以速度模型接續去程的時間推算
+        if "時間" in roundtrip_route.columns:
+            roundtrip_route.loc[len(df):, "時間"] = np.nan
+        roundtrip_route, _ = pace_points(roundtrip_route, **pace)
+
+    segments = []
     if len(comm_points_in_original) >= 2:
         # 3. 提取通訊點索引和資料
         original_comm_indices = [idx for idx, _, _ in comm_points_in_original]
@@ -627,26 +653,93 @@ def process_single_route(route_name: str, output_base: Path) -> None:
         roundtrip_segments = calculate_roundtrip_segments(
             roundtrip_route, original_comm_indices, original_comm_points
         )
-
-        if roundtrip_segments:
-            print(f"  -> 匯出 {len(roundtrip_segments)} 個來回切分段落...")
-            for segment in roundtrip_segments:
-                export_segment_geojson(
-                    segment, cut_output_dir, route_name, segment["part_number"]
-                )
+        for segment in roundtrip_segments:
+            part_num = segment["part_number"]
+            segments.append(
+                {
+                    "part_number": part_num,
+                    "filename": segment_filename(route_name, part_num),
+                    "segment": segment,
+                    "geojson": build_segment_geojson(segment, route_name, part_num),
+                }
+            )
     else:
         print(f"  原始路線中通訊點不足，跳過切分")
 
-    # 4. 匯出完整往返路線 (GeoJSON)
-    print(f"  -> 匯出完整往返路線...")
-    export_roundtrip_geojson(roundtrip_route, roundtrip_geojson_dir, route_name)
-
-    # 5. 往返通訊點 (TXT)
+    # 5. 往返通訊點
     print(f"  -> 建立往返通訊點...")
     roundtrip_comm = create_roundtrip_comm_points(original_comm_points)
-    export_roundtrip_txt(roundtrip_comm, roundtrip_txt_dir, route_name)
+
+    return {
+        "segments": segments,
+        "roundtrip": roundtrip_route,
+        "roundtrip_geojson": build_roundtrip_geojson(roundtrip_route, route_name),
+        "roundtrip_comm": roundtrip_comm,
+    }
+
+
+def write_split_outputs(
+    route_name: str,
+    result: Dict[str, Any],
+    output_base: Path,
+    segments: bool = True,
+    roundtrip: bool = True,
+) -> None:
+    """
+    寫出 split_route() 的結果。
+    segments: 1.切分過的路線；roundtrip: 2.往前重複的geojson 與 3.往前重複的txt
+    """
+    if segments:
+        cut_output_dir = output_base / "1.切分過的路線" / route_name
+        cut_output_dir.mkdir(parents=True, exist_ok=True)
+        if result["segments"]:
+            print(f"  -> 匯出 {len(result['segments'])} 個來回切分段落...")
+            for part in result["segments"]:
+                export_segment_geojson(
+                    part["segment"],
+                    cut_output_dir,
+                    route_name,
+                    part["part_number"],
+                    geojson=part["geojson"],
+                )
+
+    if roundtrip:
+        roundtrip_geojson_dir = output_base / "2.往前重複的geojson" / route_name
+        roundtrip_txt_dir = output_base / "3.往前重複的txt" / route_name
+        roundtrip_geojson_dir.mkdir(parents=True, exist_ok=True)
+        roundtrip_txt_dir.mkdir(parents=True, exist_ok=True)
+
+        # 完整往返路線 (GeoJSON)
+        print(f"  -> 匯出完整往返路線...")
+        export_roundtrip_geojson(
+            result["roundtrip"],
+            roundtrip_geojson_dir,
+            route_name,
+            geojson=result["roundtrip_geojson"],
+        )
+
+        # 往返通訊點 (TXT)
+        export_roundtrip_txt(result["roundtrip_comm"], roundtrip_txt_dir, route_name)
+
+
+def process_single_route(
+    route_name: str,
+    output_base: Path,
+    source_dir: Path = Path("./已改好的txt_geojson"),
+    raw_txt_dir: Path = Path("./data_raw/txt"),
+) -> bool:
+    """處理單一路線的完整流程；路線資料不完整而未處理時回傳 False"""
+    print(f"\n處理 {route_name}")
+
+    source = load_route_source(route_name, source_dir, raw_txt_dir)
+    if source is None:
+        return False
+
+    result = split_route(route_name, *source)
+    write_split_outputs(route_name, result, Path(output_base))
 
     print(f"  {route_name} 處理完成")
+    return True
 
 
 def main():
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+編輯中路線的伺服器端副本
+保存每條路線 A/B 的點位與版本號，套用前端送來的差異修補 (patch)，
+重新產生 TXT 與 GeoJSON 並以原子方式寫入 修改後的檔案。
+"""
+
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from geojson_layout import LAYOUT_POINTS, dumps_geojson, existing_geojson, read_text, to_point_features
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class StalePatchError(Exception):
+    """修補的基準版本與伺服器上的版本不同"""
+
+    def __init__(self, current_version):
+        super().__init__(f"路線已被修改，目前版本為 {current_version}")
+        self.current_version = current_version
+
+
+class PatchError(ValueError):
+    """修補內容不正確"""
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """先寫入同目錄的暫存檔再取代，避免讀取端看到寫到一半的檔案"""
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """atomic_write_text 的位元組版本"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def file_lock(lock_path: Path):
+    """跨行程的檔案鎖，讓多個 API worker 不會同時修改同一條路線"""
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def file_version(path: Path):
+    """檔案的 (mtime, 大小)，用來判斷快取是否過期"""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def points_from_geojson(geojson: dict) -> list:
+    """從 GeoJSON 的點位 Features 取出點位清單（依檔案順序，也接受 columnar 格式）"""
+    points = []
+    for feature in to_point_features(geojson).get("features", []):
+        if feature["geometry"]["type"] != "Point":
+            continue
+        lon, lat = feature["geometry"]["coordinates"][:2]
+        props = feature.get("properties") or {}
+        points.append(
+            {
+                "lat": float(lat),
+                "lon": float(lon),
+                "elevation": props.get("elevation"),
+                "type": props.get("type") or "gpx",
+                "name": props.get("name"),
+                "time": props.get("time"),
+            }
+        )
+    return points
+
+
+def order_label(seq: int, point: dict):
+    """順序欄位：通訊點加上名稱標記，與 pt_process 匯出格式相同"""
+    if point["type"] == "comm":
+        return f"{seq}({point.get('name') or '通訊點'})"
+    return seq
+
+
+def render_txt(points: list) -> str:
+    """產生 points.txt 格式的 TSV 內容"""
+    has_time = any(point.get("time") for point in points)
+    header = ["順序", "緯度", "經度", "海拔（約）", "類型", "名稱"] + (["時間"] if has_time else [])
+    lines = ["\t".join(header)]
+    for seq, point in enumerate(points, 1):
+        elevation = point.get("elevation")
+        row = [
+            str(order_label(seq, point)),
+            f"{point['lat']:.6f}",
+            f"{point['lon']:.6f}",
+            f"{float(elevation):.1f}" if elevation is not None else "N/A",
+            point["type"],
+            point.get("name") or "",
+        ]
+        if has_time:
+            row.append(point.get("time") or "")
+        lines.append("\t".join(row))
+    return "\n".join(lines) + "\n"
+
+
+def render_geojson(points: list, route_label: str, version: int) -> dict:
+    """產生與 pt_process 相同結構的 GeoJSON，並記錄版本號"""
+    geojson = {"type": "FeatureCollection", "version": version, "features": []}
+    if len(points) > 1:
+        geojson["features"].append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "LineString",
+                    "coordinates": [[p["lon"], p["lat"]] for p in points],
+                },
+                "properties": {
+                    "name": route_label,
+                    "route_type": "main_route",
+                    "total_points": len(points),
+                    "comm_points": sum(p["type"] == "comm" for p in points),
+                    "gpx_points": sum(p["type"] == "gpx" for p in points),
+                },
+            }
+        )
+    for seq, point in enumerate(points, 1):
+        properties = {
+            "order": order_label(seq, point),
+            "type": point["type"],
+            "name": point.get("name"),
+            "elevation": point.get("elevation"),
+        }
+        if point.get("time"):
+            properties["time"] = point["time"]
+        geojson["features"].append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [point["lon"], point["lat"]]},
+                "properties": properties,
+            }
+        )
+    return geojson
+
+
+def _patched_point(base: dict, changes: dict) -> dict:
+    """以 changes 中有提供的欄位更新點位"""
+    point = dict(base)
+    for key in ("lat", "lon", "elevation", "type", "name", "time"):
+        if key in changes:
+            point[key] = changes[key]
+    point["lat"] = float(point["lat"])
+    point["lon"] = float(point["lon"])
+    return point
+
+
+def apply_patch(points: list, patch: dict) -> list:
+    """
+    套用修補並回傳新的點位清單。順序編號 (seq) 皆以基準版本為準（從 1 開始）。
+
+    deleted: [seq, ...]
+    moved: [{"seq": n, "lat": ..., "lon": ..., 其他欄位可選}, ...]
+    inserted: [{"after": seq（0 表示最前面）, "point": {"lat": ..., "lon": ..., ...}}, ...]
+    """
+    total = len(points)
+
+    def check_seq(seq, allow_zero=False):
+        if not isinstance(seq, int) or not (0 if allow_zero else 1) <= seq <= total:
+            raise PatchError(f"無效的順序編號: {seq}")
+        return seq
+
+    deleted = {check_seq(seq) for seq in patch.get("deleted", [])}
+
+    moved = {}
+    for change in patch.get("moved", []):
+        seq = check_seq(change.get("seq"))
+        if seq in deleted:
+            raise PatchError(f"順序 {seq} 同時被刪除與移動")
+        moved[seq] = change
+
+    inserted = {}
+    for insertion in patch.get("inserted", []):
+        after = check_seq(insertion.get("after"), allow_zero=True)
+        point = insertion.get("point") or {}
+        if "lat" not in point or "lon" not in point:
+            raise PatchError("新增點位缺少經緯度")
+        new_point = _patched_point(
+            {"elevation": None, "type": "gpx", "name": None, "time": None}, point
+        )
+        inserted.setdefault(after, []).append(new_point)
+
+    result = list(inserted.get(0, []))
+    for seq, point in enumerate(points, 1):
+        if seq not in deleted:
+            result.append(_patched_point(point, moved[seq]) if seq in moved else point)
+        result.extend(inserted.get(seq, []))
+    return result
+
+
+class RouteStore:
+    """
+    編輯中路線的記憶體快取與修補寫入。
+
+    edited_dir: 修改後的檔案 資料夾（內含 txt/ 與 geojson/）
+    work_dir: data_work 資料夾，尚未編輯過的路線從這裡讀取
+    """
+
+    def __init__(self, edited_dir, work_dir):
+        self.edited_dir = Path(edited_dir)
+        self.work_dir = Path(work_dir)
+        self._states = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def txt_path(self, route_name: str, route_type: str) -> Path:
+        return self.edited_dir / "txt" / f"{route_name}_route_{route_type}_edited.txt"
+
+    def geojson_path(self, route_name: str, route_type: str) -> Path:
+        return self.edited_dir / "geojson" / f"{route_name}_route_{route_type}_edited.geojson"
+
+    @contextmanager
+    def lock(self, route_name: str, route_type: str):
+        """同一條路線的執行緒鎖加上跨行程檔案鎖"""
+        with self._locks_guard:
+            thread_lock = self._locks.setdefault((route_name, route_type), threading.Lock())
+        with thread_lock:
+            with file_lock(self.edited_dir / "locks" / f"{route_name}_route_{route_type}.lock"):
+                yield
+
+    def _load(self, route_name: str, route_type: str) -> dict:
+        """讀取已編輯的檔案（沒有時讀 data_work），檔案變動時才重新解析"""
+        source = self.geojson_path(route_name, route_type)
+        if not source.exists():
+            work_geojson = self.work_dir / f"route_{route_type}" / route_name / "route.geojson"
+            source = existing_geojson(work_geojson) or work_geojson
+        mtime = file_version(source)
+
+        # 其他 worker 寫入後 mtime 或大小會改變，此時重新讀取
+        key = (route_name, route_type)
+        state = self._states.get(key)
+        if state is not None and state["source"] == source and state["mtime"] == mtime:
+            return state
+
+        geojson = json.loads(read_text(source))
+        state = {
+            "source": source,
+            "mtime": mtime,
+            "version": int(geojson.get("version", 0)),
+            "points": points_from_geojson(geojson),
+        }
+        self._states[key] = state
+        return state
+
+    def get(self, route_name: str, route_type: str) -> dict:
+        """取得路線目前的版本與點位"""
+        with self.lock(route_name, route_type):
+            return self._load(route_name, route_type)
+
+    def save(self, route_name: str, route_type: str, points: list, version: int) -> dict:
+        """以原子方式寫入 TXT 與 GeoJSON，並更新快取（呼叫端需持有鎖）"""
+        txt_path = self.txt_path(route_name, route_type)
+        geojson_path = self.geojson_path(route_name, route_type)
+        geojson = render_geojson(points, f"{route_name}_route_{route_type}", version)
+
+        atomic_write_text(txt_path, render_txt(points))
+        atomic_write_text(geojson_path, dumps_geojson(geojson, LAYOUT_POINTS))
+
+        state = {
+            "source": geojson_path,
+            "mtime": file_version(geojson_path),
+            "version": version,
+            "points": points,
+        }
+        self._states[(route_name, route_type)] = state
+        return {"state": state, "txt_path": txt_path, "geojson_path": geojson_path}
+
+    def replace(self, route_name: str, route_type: str, txt_content: str, geojson_content: str) -> dict:
+        """整份取代（前端上傳完整檔案），同樣以原子方式寫入並遞增版本號"""
+        geojson = json.loads(geojson_content)
+        with self.lock(route_name, route_type):
+            try:
+                version = self._load(route_name, route_type)["version"] + 1
+            except FileNotFoundError:
+                version = 1
+            geojson["version"] = version
+
+            txt_path = self.txt_path(route_name, route_type)
+            geojson_path = self.geojson_path(route_name, route_type)
+            atomic_write_text(txt_path, txt_content)
+            atomic_write_text(geojson_path, dumps_geojson(geojson, LAYOUT_POINTS))
+
+            state = {
+                "source": geojson_path,
+                "mtime": file_version(geojson_path),
+                "version": version,
+                "points": points_from_geojson(geojson),
+            }
+            self._states[(route_name, route_type)] = state
+            return {"state": state, "txt_path": txt_path, "geojson_path": geojson_path}
+
+    def patch(self, route_name: str, route_type: str, base_version: int, patch: dict) -> dict:
+        """套用修補；base_version 與目前版本不同時拋出 StalePatchError"""
+        with self.lock(route_name, route_type):
+            state = self._load(route_name, route_type)
+            if base_version != state["version"]:
+                raise StalePatchError(state["version"])
+            points = apply_patch(state["points"], patch)
+            return self.save(route_name, route_type, points, state["version"] + 1)
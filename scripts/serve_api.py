@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線更新 API 正式環境啟動程式
+使用多 worker 的 WSGI 服務器（gunicorn，Windows 上改用 waitress），關閉 debug 與自動重載。
+
+    python serve_api.py --workers 4 --threads 8
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+
+def run_gunicorn(app, host, port, workers, threads, timeout):
+    """以 gunicorn 的 gthread worker 啟動（多行程 × 多執行緒）"""
+    from gunicorn.app.base import BaseApplication
+
+    class StandaloneApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "threads": threads,
+        "worker_class": "gthread",
+        "timeout": timeout,
+        "accesslog": None,
+    }
+    StandaloneApplication(app, options).run()
+
+
+def run_waitress(app, host, port, threads):
+    """以 waitress 啟動（單一行程多執行緒，適用 Windows）"""
+    from waitress import serve
+
+    serve(app, host=host, port=port, threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以正式環境模式啟動路線更新 API")
+    parser.add_argument("--host", default="0.0.0.0", help="監聽位址")
+    parser.add_argument("--port", type=int, default=5000, help="監聽埠號")
+    parser.add_argument(
+        "--workers", type=int, default=max(2, (os.cpu_count() or 1)), help="worker 行程數"
+    )
+    parser.add_argument("--threads", type=int, default=4, help="每個 worker 的執行緒數")
+    parser.add_argument("--timeout", type=int, default=60, help="請求逾時秒數（gunicorn）")
+    parser.add_argument(
+        "--server",
+        choices=["auto", "gunicorn", "waitress"],
+        default="auto",
+        help="WSGI 服務器（auto：有 gunicorn 且非 Windows 時使用 gunicorn）",
+    )
+    parser.add_argument("--data-dir", help="資料根目錄（預設為專案根目錄）")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        os.environ["GPX_TOOL_BASE_DIR"] = str(Path(args.data_dir).resolve())
+
+    # 讓 update_route_api 能以同目錄模組方式匯入
+    sys.path.insert(0, str(Path(__file__).parent))
+    from update_route_api import BASE_DIR, app
+
+    app.debug = False
+
+    server = args.server
+    if server == "auto":
+        try:
+            import gunicorn  # noqa: F401
+
+            server = "waitress" if os.name == "nt" else "gunicorn"
+        except ImportError:
+            server = "waitress"
+
+    print(f"啟動路線更新 API ({server})：http://{args.host}:{args.port}")
+    print(f"資料目錄: {BASE_DIR}")
+
+    if server == "gunicorn":
+        print(f"workers={args.workers}, threads={args.threads}")
+        run_gunicorn(app, args.host, args.port, args.workers, args.threads, args.timeout)
+    else:
+        if args.workers > 1:
+            print("waitress 只使用單一行程，--workers 參數將被忽略")
+        print(f"threads={args.threads}")
+        run_waitress(app, args.host, args.port, args.threads)
+
+
+if __name__ == "__main__":
+    main()
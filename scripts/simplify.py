@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線簡化工具
+以 Douglas-Peucker 演算法移除多餘的軌跡點，通訊點及其前後點一律保留。
+提供地圖編輯器依縮放等級使用的多層級 (LOD) 簡化路線，
+以及 pipeline 的 simplify 階段使用的 3D（平面 + 海拔）簡化。
+"""
+
+import math
+
+import numpy as np
+
+from geodesy import consecutive_distances, local_xy
+
+# Web Mercator 在赤道、縮放等級 0 時每像素代表的公尺數
+METERS_PER_PIXEL_Z0 = 156543.03392
+
+# 預先計算的縮放等級；超過最大等級時回傳完整路線
+LOD_ZOOMS = (8, 10, 12, 14, 16)
+
+# 容許誤差（像素）
+LOD_PIXEL_TOLERANCE = 1.0
+
+# simplify 階段的預設容許誤差（公尺）：偏離路線的水平距離、與線性內插海拔的差
+DEFAULT_MAX_OFFSET = 3.0
+DEFAULT_MAX_VERTICAL = 2.0
+
+
+def _project_to_chord(points: np.ndarray, start: int, end: int) -> tuple:
+    """
+    start 與 end 之間的點投影到線段 start→end。
+    回傳 (投影位置 t，0 為 start、1 為 end；到線段的距離)
+    """
+    a = points[start]
+    b = points[end]
+    inner = points[start + 1 : end]
+    ab = b - a
+    denom = float(ab @ ab)
+    if denom == 0.0:
+        return np.zeros(len(inner)), np.linalg.norm(inner - a, axis=1)
+    t = np.clip((inner - a) @ ab / denom, 0.0, 1.0)
+    return t, np.linalg.norm(inner - (a + t[:, None] * ab), axis=1)
+
+
+def _distances_to_chord(points: np.ndarray, start: int, end: int) -> np.ndarray:
+    """計算 start 與 end 之間的點到線段 start→end 的距離"""
+    return _project_to_chord(points, start, end)[1]
+
+
+def _split_spans(n: int, keep, farthest) -> np.ndarray:
+    """
+    Douglas-Peucker 的區段分割。
+    farthest(start, end) 回傳區段內超出容許誤差最多的點，都在誤差內時回傳 None。
+    """
+    mask = np.zeros(n, dtype=bool)
+    if n == 0:
+        return mask
+    if keep is not None:
+        mask |= keep
+    mask[0] = True
+    mask[-1] = True
+
+    anchors = np.flatnonzero(mask)
+    stack = list(zip(anchors[:-1], anchors[1:]))
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        split = farthest(start, end)
+        if split is not None:
+            mask[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return mask
+
+
+def douglas_peucker(points: np.ndarray, tolerance: float, keep=None) -> np.ndarray:
+    """
+    Douglas-Peucker 簡化，回傳要保留的點的布林遮罩。
+
+    points: (n, d) 的投影座標（公尺）
+    tolerance: 最大容許偏移（公尺）
+    keep: 必須保留的點的布林遮罩，會把路線切成獨立簡化的區段
+    """
+
+    def farthest(start, end):
+        distances = _distances_to_chord(points, start, end)
+        index = int(np.argmax(distances))
+        return start + 1 + index if distances[index] > tolerance else None
+
+    return _split_spans(len(points), keep, farthest)
+
+
+def douglas_peucker_3d(
+    points: np.ndarray, elevations: np.ndarray, max_offset: float, max_vertical: float, keep=None
+) -> np.ndarray:
+    """
+    同時限制水平與垂直誤差的 Douglas-Peucker 簡化，回傳要保留的點的布林遮罩。
+
+    points: (n, 2) 的投影座標（公尺）
+    elevations: 海拔（公尺），缺值（NaN）不計垂直誤差
+    max_offset: 到簡化後路線的最大水平距離（公尺）
+    max_vertical: 與簡化後路線（兩端海拔線性內插）的最大海拔差（公尺）
+    keep: 必須保留的點的布林遮罩
+
+    兩種誤差各自除以容許值後取較大者，超過 1 的點中取最大的分割。
+    """
+    elevations = np.asarray(elevations, dtype=float)
+
+    def farthest(start, end):
+        t, horizontal = _project_to_chord(points, start, end)
+        expected = elevations[start] + t * (elevations[end] - elevations[start])
+        vertical = np.abs(elevations[start + 1 : end] - expected)
+        score = np.fmax(horizontal / max_offset, np.nan_to_num(vertical, nan=0.0) / max_vertical)
+        index = int(np.argmax(score))
+        return start + 1 + index if score[index] > 1.0 else None
+
+    return _split_spans(len(points), keep, farthest)
+
+
+def anchor_mask(n: int, anchor_indices, neighbours: int = 1) -> np.ndarray:
+    """建立錨點遮罩：錨點本身與前後 neighbours 個點都要保留"""
+    mask = np.zeros(n, dtype=bool)
+    anchor_indices = np.asarray(list(anchor_indices), dtype=int)
+    if n == 0 or len(anchor_indices) == 0:
+        return mask
+    for offset in range(-neighbours, neighbours + 1):
+        shifted = np.clip(anchor_indices + offset, 0, n - 1)
+        mask[shifted] = True
+    return mask
+
+
+def zoom_tolerance(zoom: float, latitude: float) -> float:
+    """縮放等級下 LOD_PIXEL_TOLERANCE 像素對應的公尺數"""
+    meters_per_pixel = METERS_PER_PIXEL_Z0 * math.cos(math.radians(latitude)) / 2**zoom
+    return meters_per_pixel * LOD_PIXEL_TOLERANCE
+
+
+def lod_level(zoom: float):
+    """回傳不超過 zoom 的最大預先計算等級，超過最大等級時回傳 None（完整路線）"""
+    if zoom > LOD_ZOOMS[-1]:
+        return None
+    levels = [level for level in LOD_ZOOMS if level <= zoom]
+    return levels[-1] if levels else LOD_ZOOMS[0]
+
+
+def simplify_geojson(geojson: dict, tolerance: float) -> dict:
+    """
+    簡化路線 GeoJSON：LineString 與點位 Features 只保留簡化後的點，
+    通訊點及其前後點一律保留。
+    """
+    features = geojson.get("features", [])
+    lines = [f for f in features if f["geometry"]["type"] == "LineString"]
+    points = [f for f in features if f["geometry"]["type"] == "Point"]
+
+    if points:
+        coords = np.array([p["geometry"]["coordinates"][:2] for p in points], dtype=float)
+        comm_indices = [
+            i for i, p in enumerate(points) if (p.get("properties") or {}).get("type") == "comm"
+        ]
+    elif lines:
+        coords = np.array([c[:2] for c in lines[0]["geometry"]["coordinates"]], dtype=float)
+        comm_indices = []
+    else:
+        return geojson
+
+    keep = anchor_mask(len(coords), comm_indices)
+    mask = douglas_peucker(local_xy(coords[:, 0], coords[:, 1]), tolerance, keep)
+    kept = np.flatnonzero(mask)
+
+    simplified = {key: value for key, value in geojson.items() if key != "features"}
+    simplified["features"] = []
+    for line in lines[:1]:
+        line_coords = (
+            [points[i]["geometry"]["coordinates"] for i in kept]
+            if points
+            else [line["geometry"]["coordinates"][i] for i in kept]
+        )
+        properties = dict(line.get("properties") or {})
+        properties["lod"] = {
+            "tolerance_m": round(tolerance, 2),
+            "kept_points": len(kept),
+            "total_points": len(coords),
+        }
+        simplified["features"].append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": line_coords},
+                "properties": properties,
+            }
+        )
+    simplified["features"].extend(points[i] for i in kept)
+    return simplified
+
+
+def route_center_latitude(geojson: dict) -> float:
+    """路線的平均緯度（用於換算容許誤差）"""
+    lats = [
+        f["geometry"]["coordinates"][1]
+        for f in geojson.get("features", [])
+        if f["geometry"]["type"] == "Point"
+    ]
+    if not lats:
+        for f in geojson.get("features", []):
+            if f["geometry"]["type"] == "LineString":
+                lats = [c[1] for c in f["geometry"]["coordinates"]]
+                break
+    return float(np.mean(lats)) if lats else 0.0
+
+
+def _segment_profile(lats, lons, elevations, boundaries) -> tuple:
+    """
+    boundaries 相鄰索引之間各段的（水平距離, 累積上升, 累積下降），算法與 feature.py 相同。
+    缺少海拔的點不計入上升與下降。
+    """
+    steps = consecutive_distances(lats, lons)
+    changes = np.diff(elevations)
+    changes = np.where(np.isnan(changes), 0.0, changes)
+    starts = np.asarray(boundaries[:-1], dtype=int)
+    if len(steps) == 0 or len(starts) == 0:
+        return np.zeros(len(starts)), np.zeros(len(starts)), np.zeros(len(starts))
+    return (
+        np.add.reduceat(steps, starts),
+        np.add.reduceat(np.fmax(changes, 0.0), starts),
+        np.add.reduceat(np.fmax(-changes, 0.0), starts),
+    )
+
+
+def simplify_points(df, max_offset=DEFAULT_MAX_OFFSET, max_vertical=DEFAULT_MAX_VERTICAL) -> tuple:
+    """
+    以 douglas_peucker_3d 簡化 points.txt 的 DataFrame（順序、緯度、經度、海拔（約）、類型）。
+    通訊點及其前後點一律保留。
+
+    回傳 (簡化後的 DataFrame（重新編排索引）, 統計)。統計比較簡化前後的
+    distance、elevation_gain、elevation_loss，並列出通訊點之間各段變化最大者，
+    這些是切分段特徵的組成（切分段以通訊點為界，而通訊點都會保留）。
+    """
+    import pandas as pd
+
+    lats = pd.to_numeric(df["緯度"], errors="coerce").to_numpy(dtype=float)
+    lons = pd.to_numeric(df["經度"], errors="coerce").to_numpy(dtype=float)
+    elevations = pd.to_numeric(df["海拔（約）"], errors="coerce").to_numpy(dtype=float)
+    comm = np.flatnonzero((df["類型"] == "comm").to_numpy())
+
+    keep = anchor_mask(len(df), comm)
+    # 座標缺值的點無法計算誤差，一律保留
+    keep |= np.isnan(lats) | np.isnan(lons)
+    mask = douglas_peucker_3d(local_xy(lons, lats), elevations, max_offset, max_vertical, keep)
+    kept = np.flatnonzero(mask)
+
+    # 段落邊界：起點、通訊點、終點（都在保留的點中）
+    boundaries = np.union1d(comm, [0, len(df) - 1]) if len(df) else np.zeros(0, dtype=int)
+    new_boundaries = np.searchsorted(kept, boundaries)
+    before = _segment_profile(lats, lons, elevations, boundaries)
+    after = _segment_profile(lats[kept], lons[kept], elevations[kept], new_boundaries)
+
+    distance_change = after[0] - before[0]
+    relative = np.divide(distance_change, before[0], out=np.zeros_like(distance_change), where=before[0] > 0)
+    gain_change = np.abs(np.concatenate([after[1] - before[1], after[2] - before[2]]))
+    stats = {
+        "points": len(df),
+        "kept": len(kept),
+        "distance": float(before[0].sum()),
+        "distance_simplified": float(after[0].sum()),
+        "elevation_gain": float(before[1].sum()),
+        "elevation_gain_simplified": float(after[1].sum()),
+        "elevation_loss": float(before[2].sum()),
+        "elevation_loss_simplified": float(after[2].sum()),
+        "max_segment_distance_change": float(np.abs(relative).max()) if len(relative) else 0.0,
+        "max_segment_gain_change": float(gain_change.max()) if len(gain_change) else 0.0,
+    }
+    return df.iloc[kept].reset_index(drop=True), stats
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+指令啟動時間測試
+以全新的子行程重複執行常用指令（模組匯入、--help、單一路線轉 GPX），
+回報最短與中位數耗時，並可列出 -X importtime 中最耗時的模組。
+
+    python startup_bench.py --runs 10 --route mt_jade_main --top 10
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+SCRIPTS_DIR = Path(__file__).parent
+
+# 子行程在暫存資料目錄中執行，需能匯入 scripts/ 下的模組
+BENCH_ENV = {**os.environ, "PYTHONPATH": str(SCRIPTS_DIR)}
+
+
+def build_commands(route_name: str) -> dict:
+    """測試項目名稱 → 子行程參數（相對於 SCRIPTS_DIR 的腳本）"""
+    return {
+        "python (空)": ["-c", "pass"],
+        "import pt_process": ["-c", "import pt_process"],
+        "import route_splitter": ["-c", "import route_splitter"],
+        "import feature": ["-c", "import feature"],
+        "import pipeline": ["-c", "import pipeline"],
+        "pipeline.py --help": [str(SCRIPTS_DIR / "pipeline.py"), "--help"],
+        "geojson_to_gpx.py <route>": [str(SCRIPTS_DIR / "geojson_to_gpx.py"), route_name],
+        "pipeline.py gpx <route>": [
+            str(SCRIPTS_DIR / "pipeline.py"), "--base-dir", ".",
+            "--routes", route_name, "--from", "gpx", "--to", "gpx",
+        ],
+    }
+
+
+def prepare_data_dir(route_name: str) -> Path:
+    """建立只含單一路線的暫存資料目錄（轉檔輸出不會寫入專案目錄）"""
+    data_dir = Path(tempfile.mkdtemp(prefix="gpx_startup_bench_"))
+    shutil.copytree(
+        BASE_DIR / "已改好的txt_geojson" / route_name,
+        data_dir / "已改好的txt_geojson" / route_name,
+    )
+    return data_dir
+
+
+def time_command(args, cwd: Path, runs: int) -> list:
+    """執行 runs 次，回傳每次的耗時（毫秒）"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, *args],
+            cwd=cwd,
+            env=BENCH_ENV,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode("utf-8", "replace").strip())
+    return timings
+
+
+def import_offenders(args, cwd: Path, top: int) -> list:
+    """以 -X importtime 取得累計耗時最多的頂層匯入（模組名稱, 毫秒）"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=cwd,
+        env=BENCH_ENV,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    offenders = []
+    for line in result.stderr.decode("utf-8", "replace").splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # 只看頂層匯入（縮排一格），避免重複計算子模組
+        if name.startswith(" ") and not name.startswith("  "):
+            offenders.append((name.strip(), int(cumulative) / 1000))
+    return sorted(offenders, key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="指令啟動時間測試")
+    parser.add_argument("--runs", type=int, default=10, help="每個指令的執行次數")
+    parser.add_argument("--route", default="mt_jade_main", help="轉 GPX 測試使用的路線")
+    parser.add_argument("--top", type=int, default=0, help="列出每個指令最耗時的 N 個匯入")
+    args = parser.parse_args()
+
+    data_dir = prepare_data_dir(args.route)
+    try:
+        print(f"{'指令':<30}{'最短 (ms)':>12}{'中位數 (ms)':>14}")
+        for name, command in build_commands(args.route).items():
+            timings = time_command(command, data_dir, args.runs)
+            print(f"{name:<30}{min(timings):>12.0f}{statistics.median(timings):>14.0f}")
+            for module, elapsed in import_offenders(command, data_dir, args.top):
+                print(f"    {module:<34}{elapsed:>8.1f} ms")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
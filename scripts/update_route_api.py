@@ -6,16 +6,108 @@
 
 import json
 import os
+import time
 from pathlib import Path
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
 
+from metrics import SIZE_BUCKETS, Metrics
+from geojson_layout import existing_geojson, load_geojson
+from payload_cache import PayloadCache, minify_json_file
+from pipeline_jobs import STAGES, JobQueue, QueueFullError
+from route_bundle import build_route_bundle, bundle_sources, source_paths
+from route_codec import MIMETYPE as ROUTE_CODEC_MIMETYPE, encode_geojson_file
+from route_catalog import RouteCatalog, scan_segment_route, scan_work_route
+from route_store import PatchError, RouteStore, StalePatchError
+from simplify import LOD_ZOOMS, lod_level, route_center_latitude, simplify_geojson, zoom_tolerance
+
 app = Flask(__name__)
 CORS(app)  # 允許跨域請求
 
-# 設定工作目錄
-WORK_DIR = Path("../data_work")
+# 設定工作目錄（可用環境變數 GPX_TOOL_BASE_DIR 指定其他資料目錄）
+BASE_DIR = Path(os.environ.get("GPX_TOOL_BASE_DIR", Path(__file__).parent.parent))
+WORK_DIR = BASE_DIR / "data_work"
+
+# 路線目錄快取（資料夾 mtime 改變時才重新掃描）
+route_catalog = RouteCatalog(
+    {
+        'route_a': BASE_DIR / "data_work" / "route_a",
+        'route_b': BASE_DIR / "data_work" / "route_b",
+    },
+    scan_work_route,
+)
+segment_catalog = RouteCatalog(
+    {
+        'route_a': BASE_DIR / "路線切分" / "route_a" / "geojson",
+        'route_b': BASE_DIR / "路線切分" / "route_b" / "geojson",
+    },
+    scan_segment_route,
+)
+
+# 路線 A/B 的代號與資料夾名稱
+ROUTE_TYPES = {'a': 'route_a', 'b': 'route_b', 'route_a': 'route_a', 'route_b': 'route_b'}
+
+# 精簡化並預先壓縮的路線 GeoJSON 與各 LOD 等級
+route_payloads = PayloadCache()
+lod_payloads = PayloadCache(max_entries=512)
+
+# 編輯中路線的伺服器端副本（修補儲存）
+route_store = RouteStore(BASE_DIR / "修改後的檔案", BASE_DIR / "data_work")
+
+# 儲存後重新執行處理流程的背景工作佇列
+pipeline_jobs = JobQueue(BASE_DIR, max_workers=int(os.environ.get("GPX_TOOL_PIPELINE_WORKERS", 2)))
+
+# 請求統計（/api/metrics）
+metrics = Metrics()
+metrics.describe('api_requests_total', 'counter', '依端點、方法與狀態碼統計的請求數')
+metrics.describe('api_request_duration_seconds', 'histogram', '請求處理時間（秒）')
+metrics.describe('api_response_bytes_total', 'counter', '回應內容的位元組數')
+metrics.describe('api_save_request_bytes', 'histogram', '儲存請求的內容大小（位元組）')
+metrics.describe('api_cache_hits_total', 'counter', '回應快取命中次數')
+metrics.describe('api_cache_misses_total', 'counter', '回應快取未命中（重新產生）次數')
+metrics.describe('api_cache_entries', 'gauge', '回應快取目前的項目數')
+metrics.describe('api_catalog_rebuilds_total', 'counter', '路線目錄重新掃描次數（命中率 = 1 - 重建數 / 請求數）')
+metrics.describe('api_catalog_routes', 'gauge', '路線目錄中的路線數')
+
+def collect_cache_metrics():
+    """輸出時讀取快取物件自己維護的命中統計"""
+    samples = []
+    for name, cache in (('route-data', route_payloads), ('route-lod', lod_payloads)):
+        labels = (('cache', name),)
+        samples.append(('api_cache_hits_total', labels, cache.hits))
+        samples.append(('api_cache_misses_total', labels, cache.misses))
+        samples.append(('api_cache_entries', labels, len(cache)))
+    for name, catalog in (('routes', route_catalog), ('segment-routes', segment_catalog)):
+        labels = (('catalog', name),)
+        samples.append(('api_catalog_rebuilds_total', labels, catalog.rebuilds))
+        samples.append(('api_catalog_routes', labels, len(catalog.snapshot()['routes'])))
+    return samples
+
+metrics.add_collector(collect_cache_metrics)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """記錄每個請求的狀態碼、處理時間與回應大小（以路由規則分組）"""
+    start = g.get('request_start')
+    if start is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    labels = (('endpoint', endpoint), ('method', request.method))
+    metrics.inc('api_requests_total', labels + (('status', str(response.status_code)),))
+    metrics.observe('api_request_duration_seconds', labels, time.perf_counter() - start)
+    if response.content_length:
+        metrics.inc('api_response_bytes_total', labels, response.content_length)
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文字格式的請求統計"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -26,102 +118,234 @@ def health_check():
         'work_dir': str(WORK_DIR.absolute())
     })
 
-@app.route('/api/routes', methods=['GET'])
-def get_available_routes():
-    """動態讀取 data_work 資料夾中的可用路線"""
+def catalog_response(catalog, error_message):
+    """從路線目錄快取回傳 JSON，支援 ETag 條件式請求"""
     try:
-        base_dir = Path(__file__).parent.parent / "data_work"
-        route_a_dir = base_dir / "route_a"
-        route_b_dir = base_dir / "route_b"
-        
-        available_routes = []
-        
-        # 檢查 route_a 資料夾
-        if route_a_dir.exists():
-            for route_dir in route_a_dir.iterdir():
-                if route_dir.is_dir():
-                    route_geojson = route_dir / "route.geojson"
-                    if route_geojson.exists():
-                        route_name = route_dir.name
-                        if route_name not in available_routes:
-                            available_routes.append(route_name)
-        
-        # 檢查 route_b 資料夾（確保兩邊都有的路線）
-        if route_b_dir.exists():
-            route_b_routes = []
-            for route_dir in route_b_dir.iterdir():
-                if route_dir.is_dir():
-                    route_geojson = route_dir / "route.geojson"
-                    if route_geojson.exists():
-                        route_b_routes.append(route_dir.name)
-            
-            # 只保留在兩個資料夾都存在的路線
-            available_routes = [route for route in available_routes if route in route_b_routes]
-        
-        return jsonify({
-            'success': True,
-            'routes': available_routes,
-            'count': len(available_routes)
-        })
-        
+        snapshot = catalog.snapshot()
     except Exception as e:
-        print(f"讀取路線列表時發生錯誤: {e}")
+        print(f"{error_message}: {e}")
         return jsonify({
             'success': False,
             'error': str(e),
             'routes': []
         })
 
+    etag = snapshot['etag']
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(snapshot['body'], mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/routes', methods=['GET'])
+def get_available_routes():
+    """讀取 data_work 資料夾中 route_a 與 route_b 都有的路線（使用快取）"""
+    return catalog_response(route_catalog, "讀取路線列表時發生錯誤")
+
 @app.route('/api/segment-routes', methods=['GET'])
 def get_segment_routes():
-    """動態讀取路線切分資料夾中的可用路線"""
+    """讀取路線切分資料夾中 route_a 與 route_b 都有的路線（使用快取）"""
+    return catalog_response(segment_catalog, "讀取切分路線列表時發生錯誤")
+
+def cached_payload_response(entry, mimetype='application/json', vary='Accept-Encoding'):
+    """回傳快取的內容：用戶端支援時送出 gzip 版本，並處理 If-None-Match"""
+    use_gzip = 'gzip' in request.accept_encodings
+    # 不同編碼的位元組不同，強 ETag 也要區分
+    etag = entry['etag'] + ('-gzip' if use_gzip else '')
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry['gzip'] if use_gzip else entry['identity'], mimetype=mimetype)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Vary'] = vary
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def resolve_route_file(route_name, route_type, filename="route.geojson"):
+    """檢查路線名稱與 A/B 代號，回傳 data_work 中的檔案路徑（無效時回傳 None）"""
+    side = ROUTE_TYPES.get(route_type)
+    if side is None or route_name not in route_catalog.snapshot()['route_set']:
+        return None
+    path = BASE_DIR / "data_work" / side / route_name / filename
+    return existing_geojson(path) or path
+
+@app.route('/api/route-data/<route_name>/<route_type>', methods=['GET'])
+def get_route_data(route_name, route_type):
+    """
+    回傳路線 A/B 的 GeoJSON（精簡化、gzip 壓縮，支援 ETag / 304）；
+    Accept 指定 application/vnd.gpx-tool.route 時回傳二進位編碼（見 route_codec）
+    """
+    geojson_path = resolve_route_file(route_name, route_type)
+    if geojson_path is None:
+        return jsonify({'success': False, 'error': f'找不到路線: {route_name} ({route_type})'}), 404
+
+    use_binary = request.accept_mimetypes.best_match(
+        ['application/json', ROUTE_CODEC_MIMETYPE]
+    ) == ROUTE_CODEC_MIMETYPE
     try:
-        base_dir = Path(__file__).parent.parent / "路線切分"
-        route_a_dir = base_dir / "route_a" / "geojson"
-        route_b_dir = base_dir / "route_b" / "geojson"
-        
-        available_routes = []
-        
-        # 檢查 route_a 資料夾
-        if route_a_dir.exists():
-            for route_dir in route_a_dir.iterdir():
-                if route_dir.is_dir():
-                    # 檢查是否有切分檔案
-                    geojson_files = list(route_dir.glob("*.geojson"))
-                    if geojson_files:
-                        route_name = route_dir.name
-                        if route_name not in available_routes:
-                            available_routes.append(route_name)
-        
-        # 檢查 route_b 資料夾（確保兩邊都有的路線）
-        if route_b_dir.exists():
-            route_b_routes = []
-            for route_dir in route_b_dir.iterdir():
-                if route_dir.is_dir():
-                    geojson_files = list(route_dir.glob("*.geojson"))
-                    if geojson_files:
-                        route_b_routes.append(route_dir.name)
-            
-            # 只保留在兩個資料夾都存在的路線
-            available_routes = [route for route in available_routes if route in route_b_routes]
-        
-        return jsonify({
-            'success': True,
-            'routes': available_routes,
-            'count': len(available_routes)
-        })
-        
+        if use_binary:
+            entry = route_payloads.get(
+                ('route-codec', str(geojson_path)),
+                [geojson_path],
+                lambda: encode_geojson_file(geojson_path),
+            )
+        else:
+            entry = route_payloads.get(
+                ('route-data', str(geojson_path)),
+                [geojson_path],
+                lambda: minify_json_file(geojson_path, load=load_geojson),
+            )
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': f'找不到路線檔案: {geojson_path.name}'}), 404
+    except Exception as e:
+        print(f"讀取路線資料時發生錯誤: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    if use_binary:
+        return cached_payload_response(entry, ROUTE_CODEC_MIMETYPE, vary='Accept, Accept-Encoding')
+    return cached_payload_response(entry, vary='Accept, Accept-Encoding')
+
+@app.route('/api/route-bundle/<route_name>', methods=['GET'])
+def get_route_bundle(route_name):
+    """
+    一次回傳編輯器載入路線所需的全部資料：A/B 兩段 GeoJSON、通訊點、
+    切分段資訊與可用的切分檔案（gzip 壓縮，支援 ETag / 304）
+    """
+    if route_name not in route_catalog.snapshot()['route_set']:
+        return jsonify({'success': False, 'error': f'找不到路線: {route_name}'}), 404
+
+    sources = bundle_sources(BASE_DIR, route_name)
+    try:
+        entry = route_payloads.get(
+            ('route-bundle', route_name),
+            source_paths(sources),
+            lambda: build_route_bundle(route_name, sources),
+        )
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'error': f'找不到路線檔案: {Path(e.filename).name}'}), 404
+    except Exception as e:
+        print(f"產生路線資料包時發生錯誤: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return cached_payload_response(entry)
+
+@app.route('/api/route-lod/<route_name>/<route_type>', methods=['GET'])
+def get_route_lod(route_name, route_type):
+    """依縮放等級 (?zoom=) 回傳簡化後的路線 GeoJSON，通訊點及其前後點一律保留"""
+    geojson_path = resolve_route_file(route_name, route_type)
+    if geojson_path is None:
+        return jsonify({'success': False, 'error': f'找不到路線: {route_name} ({route_type})'}), 404
+
+    zoom = request.args.get('zoom', type=float)
+    if zoom is None:
+        return jsonify({'success': False, 'error': '缺少 zoom 參數'}), 400
+
+    level = lod_level(zoom)
+    source = {}
+
+    def lod_key(lod_zoom):
+        return ('route-lod', str(geojson_path), lod_zoom)
+
+    def build_level(lod_zoom):
+        # 同一次請求中只解析一次原始 GeoJSON
+        if 'data' not in source:
+            source['data'] = load_geojson(geojson_path)
+        data = source['data']
+        if lod_zoom is None:
+            simplified = data
+        else:
+            tolerance = zoom_tolerance(lod_zoom, route_center_latitude(data))
+            simplified = simplify_geojson(data, tolerance)
+        return json.dumps(simplified, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def build_all_levels():
+        # 快取未命中時一併預先計算其他 LOD 等級
+        for lod_zoom in LOD_ZOOMS + (None,):
+            if lod_zoom != level:
+                lod_payloads.get(
+                    lod_key(lod_zoom),
+                    [geojson_path],
+                    lambda lod_zoom=lod_zoom: build_level(lod_zoom),
+                )
+        return build_level(level)
+
+    try:
+        entry = lod_payloads.get(lod_key(level), [geojson_path], build_all_levels)
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': f'找不到路線檔案: {geojson_path.name}'}), 404
     except Exception as e:
-        print(f"讀取切分路線列表時發生錯誤: {e}")
+        print(f"簡化路線時發生錯誤: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    response = cached_payload_response(entry)
+    response.headers['X-LOD-Zoom'] = 'full' if level is None else str(level)
+    return response
+
+@app.route('/api/edited-route/<route_name>/<route_type>', methods=['GET'])
+def get_edited_route(route_name, route_type):
+    """回傳伺服器上編輯中路線的版本號與點位（修補儲存的基準）"""
+    side = ROUTE_TYPES.get(route_type)
+    if side is None or route_name not in route_catalog.snapshot()['route_set']:
+        return jsonify({'success': False, 'error': f'找不到路線: {route_name} ({route_type})'}), 404
+
+    state = route_store.get(route_name, side[-1])
+    return jsonify({
+        'success': True,
+        'version': state['version'],
+        'points': state['points']
+    })
+
+@app.route('/api/save-edited-patch', methods=['POST'])
+def save_edited_patch():
+    """
+    以差異修補儲存編輯結果：只傳送新增、刪除與移動的點位（依基準版本的順序編號），
+    伺服器套用後重新產生 TXT 與 GeoJSON，基準版本過舊時回傳 409
+    """
+    metrics.observe('api_save_request_bytes', (('kind', 'patch'),), request.content_length or 0, SIZE_BUCKETS)
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'success': False, 'error': '沒有接收到資料'}), 400
+
+    route_name = data.get('route_name')
+    side = ROUTE_TYPES.get(data.get('route_type'))
+    base_version = data.get('base_version')
+
+    if side is None or not isinstance(base_version, int):
+        return jsonify({'success': False, 'error': '缺少必要參數'}), 400
+    if route_name not in route_catalog.snapshot()['route_set']:
+        return jsonify({'success': False, 'error': f'找不到路線: {route_name}'}), 404
+
+    try:
+        result = route_store.patch(route_name, side[-1], base_version, data)
+    except StalePatchError as e:
         return jsonify({
             'success': False,
             'error': str(e),
-            'routes': []
-        })
+            'current_version': e.current_version
+        }), 409
+    except PatchError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"套用修補時發生錯誤: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({
+        'success': True,
+        'version': result['state']['version'],
+        'total_points': len(result['state']['points']),
+        'txt_path': str(result['txt_path']),
+        'geojson_path': str(result['geojson_path'])
+    })
 
 @app.route('/api/save-edited-files', methods=['POST'])
 def save_edited_files():
-    """儲存編輯後的檔案到指定資料夾"""
+    """儲存編輯後的檔案到指定資料夾（整份上傳）"""
+    metrics.observe('api_save_request_bytes', (('kind', 'full'),), request.content_length or 0, SIZE_BUCKETS)
     try:
         data = request.get_json()
         
@@ -136,34 +360,17 @@ def save_edited_files():
         if not all([route_type, route_name, txt_content, geojson_content]):
             return jsonify({'success': False, 'error': '缺少必要參數'})
         
-        # 建立目標資料夾
-        base_dir = Path(WORK_DIR).parent
-        txt_dir = base_dir / "修改後的檔案" / "txt"
-        geojson_dir = base_dir / "修改後的檔案" / "geojson"
-        
-        print(f"目標資料夾：{txt_dir}")
-        print(f"目標資料夾：{geojson_dir}")
-        
-        txt_dir.mkdir(parents=True, exist_ok=True)
-        geojson_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 儲存 TXT 檔案
-        txt_filename = f"{route_name}_route_{route_type}_edited.txt"
-        txt_path = txt_dir / txt_filename
+        # 以原子方式寫入 TXT 與 GeoJSON，並遞增版本號
+        result = route_store.replace(route_name, route_type, txt_content, geojson_content)
+        txt_path = result['txt_path']
+        geojson_path = result['geojson_path']
         print(f"儲存 TXT 檔案：{txt_path}")
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(txt_content)
-        
-        # 儲存 GeoJSON 檔案
-        geojson_filename = f"{route_name}_route_{route_type}_edited.geojson"
-        geojson_path = geojson_dir / geojson_filename
         print(f"儲存 GeoJSON 檔案：{geojson_path}")
-        with open(geojson_path, 'w', encoding='utf-8') as f:
-            f.write(geojson_content)
         
         return jsonify({
             'success': True, 
-            'message': f'檔案已儲存：{txt_filename}, {geojson_filename}',
+            'message': f'檔案已儲存：{txt_path.name}, {geojson_path.name}',
+            'version': result['state']['version'],
             'txt_path': str(txt_path),
             'geojson_path': str(geojson_path)
         })
@@ -172,14 +379,71 @@ def save_edited_files():
         print(f"儲存編輯檔案時發生錯誤: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_pipeline_job():
+    """
+    排入單一路線的處理工作，立即回傳 202 與工作編號。
+    route_type 有提供時先把 修改後的檔案 中的編輯結果複製到 已改好的txt_geojson；
+    同一路線已有等待中的工作時會合併成同一個工作
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'success': False, 'error': '沒有接收到資料'}), 400
+
+    route_name = data.get('route_name')
+    route_type = data.get('route_type')
+    stages = data.get('stages')
+
+    if not route_name or Path(route_name).name != route_name:
+        return jsonify({'success': False, 'error': '缺少必要參數'}), 400
+    if route_type is not None and route_type not in ROUTE_TYPES:
+        return jsonify({'success': False, 'error': f'無效的路線類型: {route_type}'}), 400
+    if stages is not None and (not isinstance(stages, list) or not set(stages) <= set(STAGES)):
+        return jsonify({'success': False, 'error': f'階段必須是 {", ".join(STAGES)} 的清單'}), 400
+
+    route_type = ROUTE_TYPES[route_type][-1] if route_type else None
+    if route_type is None and not (BASE_DIR / "已改好的txt_geojson" / route_name).is_dir():
+        return jsonify({'success': False, 'error': f'找不到路線: {route_name}'}), 404
+
+    try:
+        job = pipeline_jobs.submit(route_name, stages, route_type)
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+
+    return jsonify({'success': True, 'job': job}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_pipeline_job(job_id):
+    """查詢處理工作的狀態與進度"""
+    job = pipeline_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'找不到工作: {job_id}'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs', methods=['GET'])
+def list_pipeline_jobs():
+    """列出最近的處理工作"""
+    return jsonify({'success': True, 'jobs': pipeline_jobs.list()})
+
 if __name__ == '__main__':
     print("啟動檔案儲存 API 服務器...")
     print(f"工作目錄: {WORK_DIR.absolute()}")
     print("API 端點:")
     print("  - GET  /api/routes           - 動態讀取可用路線 (data_work)")
     print("  - GET  /api/segment-routes   - 動態讀取切分路線 (路線切分)")
+    print("  - GET  /api/route-data/<路線>/<a|b> - 讀取路線 GeoJSON (gzip + ETag，Accept 可指定二進位編碼)")
+    print("  - GET  /api/route-bundle/<路線> - 一次讀取 A/B 路線、通訊點與切分段資訊")
+    print("  - GET  /api/route-lod/<路線>/<a|b>?zoom=12 - 讀取依縮放等級簡化的路線")
+    print("  - GET  /api/edited-route/<路線>/<a|b> - 讀取編輯中路線與版本號")
+    print("  - POST /api/save-edited-patch - 以差異修補儲存編輯結果")
     print("  - POST /api/save-edited-files - 儲存編輯後的檔案")
+    print("  - POST /api/jobs             - 排入路線處理工作（切分、特徵、POI、GPX）")
+    print("  - GET  /api/jobs/<工作編號>   - 查詢處理工作進度")
+    print("  - GET  /api/metrics          - 請求統計 (Prometheus 格式)")
     print("  - GET  /api/health           - 健康檢查")
     print("\n按 Ctrl+C 停止服務器")
     
+    route_catalog.start_watcher()
+    segment_catalog.start_watcher()
+
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路線檔案監看
+持續監看 修改後的檔案 與 已改好的txt_geojson，路線存檔後自動排入處理工作，
+只對該路線重新執行後續階段（見 pipeline_jobs）：
+
+  修改後的檔案/txt|geojson/<路線>_route_<a|b>_edited.*   promote → split → features → poi → gpx
+  已改好的txt_geojson/<路線>/route.geojson               split → features → poi → gpx
+  已改好的txt_geojson/<路線>/points.txt                  split → features → poi
+
+Linux 上使用 inotify，其他平台（或 inotify 無法使用時）改以 mtime 輪詢。
+同一路線短時間內的多次存檔會合併成一個工作。
+
+    python watch_routes.py --debounce 1.5 --workers 2
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+from geojson_layout import plain_path
+from pipeline_jobs import DEFAULT_STAGES, JobQueue
+
+EDITED_NAME = re.compile(r"^(?P<route>.+)_route_(?P<type>[ab])_edited\.(txt|geojson)$")
+
+# 已改好的txt_geojson 中各檔案影響的階段
+SOURCE_STAGES = {
+    "route.geojson": ("split", "features", "poi", "gpx"),
+    "points.txt": ("split", "features", "poi"),
+}
+
+
+def file_signature(path: Path):
+    """(mtime_ns, size)；檔案不存在時回傳 None"""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class PollBackend:
+    """以 mtime 與大小輪詢資料夾，回傳有變動（新增、修改、刪除）的檔案"""
+
+    name = "poll"
+
+    def __init__(self, roots, interval=1.0):
+        self.roots = [Path(root) for root in roots]
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict:
+        snapshot = {}
+        for root in self.roots:
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = Path(dirpath) / filename
+                    signature = file_signature(path)
+                    if signature is not None:
+                        snapshot[path] = signature
+        return snapshot
+
+    def read(self, timeout: float) -> list:
+        time.sleep(min(timeout, self.interval))
+        snapshot = self._scan()
+        changed = [path for path, signature in snapshot.items() if self._snapshot.get(path) != signature]
+        changed.extend(path for path in self._snapshot if path not in snapshot)
+        self._snapshot = snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyBackend:
+    """Linux inotify（透過 libc，不需額外套件）；會自動監看新建立的子資料夾"""
+
+    name = "inotify"
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+
+    # IN_MODIFY 在寫入過程中會觸發多次，只看寫入完成（close）與改名（原子取代）
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, roots):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify 只能在 Linux 上使用")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        self.roots = [Path(root) for root in roots]
+        self._folders = {}
+        for root in self.roots:
+            self._watch_tree(root)
+
+    def _watch(self, folder: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), self.WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"無法監看 {folder}")
+        self._folders[wd] = folder
+
+    def _watch_tree(self, folder: Path) -> list:
+        """監看資料夾及其子資料夾，回傳其中已存在的檔案（監看建立前寫入的檔案）"""
+        files = []
+        for dirpath, _, filenames in os.walk(folder):
+            self._watch(Path(dirpath))
+            files.extend(Path(dirpath) / filename for filename in filenames)
+        return files
+
+    def _all_files(self) -> list:
+        return [
+            Path(dirpath) / filename
+            for root in self.roots
+            for dirpath, _, filenames in os.walk(root)
+            for filename in filenames
+        ]
+
+    def read(self, timeout: float) -> list:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # 事件佇列溢位，無法得知哪些檔案變動，視為全部變動
+                print("inotify 事件溢位，重新檢查所有檔案")
+                changed.extend(self._all_files())
+                continue
+            if mask & self.IN_IGNORED:
+                self._folders.pop(wd, None)
+                continue
+            folder = self._folders.get(wd)
+            if folder is None or not name:
+                continue
+            path = folder / os.fsdecode(name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    changed.extend(self._watch_tree(path))
+                continue
+            changed.append(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def create_backend(roots, backend="auto", interval=1.0):
+    """建立監看後端；auto 時優先使用 inotify，無法使用時改為輪詢"""
+    if backend in ("auto", "inotify"):
+        try:
+            return InotifyBackend(roots)
+        except (OSError, AttributeError) as e:
+            if backend == "inotify":
+                raise
+            print(f"無法使用 inotify（{e}），改以輪詢監看")
+    return PollBackend(roots, interval)
+
+
+class RouteWatcher:
+    """
+    把檔案變動轉為路線處理工作。
+
+    base_dir: 專案資料根目錄
+    queue: pipeline_jobs.JobQueue
+    debounce: 路線最後一次變動後等待的秒數，期間的變動合併成一個工作
+    promote: 是否處理 修改後的檔案 中的編輯結果（先複製到 已改好的txt_geojson）
+    """
+
+    def __init__(self, base_dir, queue, debounce=1.5, promote=True):
+        self.base_dir = Path(base_dir)
+        self.queue = queue
+        self.debounce = debounce
+        self.promote = promote
+        self.edited_dir = self.base_dir / "修改後的檔案"
+        self.source_dir = self.base_dir / "已改好的txt_geojson"
+
+        self._pending = {}  # 路線 → 等待送出的變動
+        self._active = {}  # 路線 → 執行中的工作 id
+        # promote 寫入的檔案簽章；同樣內容的變動事件不再觸發新工作
+        self._written = {}
+
+    def roots(self) -> list:
+        roots = [self.source_dir]
+        if self.promote:
+            roots += [self.edited_dir / "txt", self.edited_dir / "geojson"]
+        return roots
+
+    def classify(self, path: Path):
+        """變動的檔案 → (路線名稱, 階段, route_type)；與路線無關時回傳 None"""
+        path = Path(path)
+        name = plain_path(path).name
+        if path.parent.parent == self.source_dir and name in SOURCE_STAGES:
+            return path.parent.name, SOURCE_STAGES[name], None
+        if self.promote and path.parent.parent == self.edited_dir:
+            match = EDITED_NAME.match(name)
+            if match:
+                return match.group("route"), DEFAULT_STAGES, match.group("type")
+        return None
+
+    def add_changes(self, paths) -> None:
+        now = time.monotonic()
+        for path in paths:
+            target = self.classify(path)
+            if target is None:
+                continue
+            route_name, stages, route_type = target
+            change = self._pending.setdefault(route_name, {"stages": set(), "route_type": None, "paths": set()})
+            change["stages"].update(stages)
+            change["route_type"] = route_type or change["route_type"]
+            change["paths"].add(Path(path))
+            change["last_event"] = now
+
+    def _finish_jobs(self) -> None:
+        for route_name, job_id in list(self._active.items()):
+            job = self.queue.get(job_id)
+            if job is None or job["status"] in ("pending", "running"):
+                continue
+            del self._active[route_name]
+            elapsed = (job["finished_at"] or time.time()) - job["created_at"]
+            if job["status"] == "done":
+                print(f"[{route_name}] 完成 {', '.join(job['stages'])}（{elapsed:.1f} 秒）")
+            else:
+                print(f"[{route_name}] 失敗: {job['error']}")
+            if job["route_type"]:
+                # 記錄 promote 寫入的檔案，避免它們再觸發一次相同的工作
+                for filename in SOURCE_STAGES:
+                    path = self.source_dir / route_name / filename
+                    self._written[path] = file_signature(path)
+
+    def _is_echo(self, path: Path) -> bool:
+        return path in self._written and self._written[path] == file_signature(path)
+
+    def flush(self) -> None:
+        """送出已超過 debounce 時間、且該路線沒有執行中工作的變動"""
+        self._finish_jobs()
+        now = time.monotonic()
+        for route_name, change in list(self._pending.items()):
+            if now - change["last_event"] < self.debounce or route_name in self._active:
+                continue
+            del self._pending[route_name]
+            paths = [path for path in change["paths"] if not self._is_echo(path)]
+            if not paths:
+                continue
+            if not (self.source_dir / route_name).is_dir() and not change["route_type"]:
+                print(f"[{route_name}] 找不到 {self.source_dir / route_name}，略過")
+                continue
+
+            job = self.queue.submit(route_name, change["stages"], change["route_type"])
+            self._active[route_name] = job["id"]
+            names = ", ".join(sorted(path.name for path in paths))
+            print(f"[{route_name}] {names} 已變動，排入 {', '.join(job['stages'])}")
+
+    def run(self, backend) -> None:
+        # 沒有事件時也要定期檢查 debounce 與工作狀態
+        tick = max(0.1, min(self.debounce / 2, 0.5))
+        while True:
+            self.add_changes(backend.read(tick))
+            self.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="監看路線檔案並自動重新處理")
+    parser.add_argument("--base-dir", default=os.environ.get("GPX_TOOL_BASE_DIR", "."),
+                        help="專案資料根目錄（預設為目前目錄）")
+    parser.add_argument("--backend", choices=["auto", "inotify", "poll"], default="auto",
+                        help="監看方式（auto：可用時使用 inotify）")
+    parser.add_argument("--interval", type=float, default=1.0, help="輪詢間隔秒數（poll）")
+    parser.add_argument("--debounce", type=float, default=1.5, help="最後一次存檔後等待的秒數")
+    parser.add_argument("--workers", type=int, default=2, help="同時處理的路線數")
+    parser.add_argument("--no-promote", action="store_true",
+                        help="不處理 修改後的檔案，只監看 已改好的txt_geojson")
+    args = parser.parse_args()
+
+    base_dir = Path(args.base_dir).resolve()
+    queue = JobQueue(base_dir, max_workers=args.workers)
+    watcher = RouteWatcher(base_dir, queue, debounce=args.debounce, promote=not args.no_promote)
+    for root in watcher.roots():
+        root.mkdir(parents=True, exist_ok=True)
+
+    backend = create_backend(watcher.roots(), args.backend, args.interval)
+    print(f"監看中（{backend.name}）: {', '.join(str(root) for root in watcher.roots())}")
+    try:
+        watcher.run(backend)
+    except KeyboardInterrupt:
+        print("\n停止監看，等待執行中的工作完成...")
+    finally:
+        backend.close()
+        queue.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,95 +3,109 @@
 
 import pandas as pd
 
-# 讀取資料
-print("讀取檔案...")
-poi_df = pd.read_csv("FINAL_POI.csv", encoding="utf-8-sig")
-feature_df = pd.read_csv("feature_report.csv", encoding="utf-8-sig")
-
-print(f"POI資料: {len(poi_df)} 筆")
-print(f"Feature資料: {len(feature_df)} 筆")
-
-# 建立路線POI映射
-route_poi_map = {}
-for _, row in poi_df.iterrows():
-    en_trail_name = row["en_trail_name"]
-    if pd.isna(en_trail_name):
-        continue
-
-    if en_trail_name not in route_poi_map:
-        route_poi_map[en_trail_name] = {"trail_id": row["trail_id"], "pois": []}
-
-    route_poi_map[en_trail_name]["pois"].append(
-        {"order": row["poi_order"], "poi_id": row["poi_id"]}
-    )
+LEADING_COLUMNS = [
+    "route_folder",
+    "part_number",
+    "filename",
+    "trail_id",
+    "poi_previous_id",
+    "poi_current_id",
+]
 
-# 排序POI
-for route_name in route_poi_map:
-    route_poi_map[route_name]["pois"].sort(key=lambda x: x["order"])
 
-print(f"建立了 {len(route_poi_map)} 個路線的映射")
+def build_poi_pairs(poi_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    建立每條路線 (en_trail_name, part_number) 對應的前後 POI 表。
+    part_number = n 對應排序後 POI 序列中第 n-1 與第 n 個 POI。
+    """
+    pois = poi_df[poi_df["en_trail_name"].notna()]
 
-# 添加新欄位
-feature_df["trail_id"] = None
-feature_df["poi_previous_id"] = None
-feature_df["poi_current_id"] = None
+    # trail_id 取該路線在 POI 檔中第一次出現的值
+    trail_ids = pois.groupby("en_trail_name", sort=False)["trail_id"].first()
 
-# 更新每筆記錄
-updated_count = 0
-for index, row in feature_df.iterrows():
-    route_folder = row["route_folder"]
-    part_number = int(row["part_number"])
+    # 依路線與 poi_order 穩定排序，再以 shift 取得前一個 POI
+    pois = pois.sort_values(["en_trail_name", "poi_order"], kind="mergesort")
+    grouped = pois.groupby("en_trail_name", sort=False)
 
-    if route_folder in route_poi_map:
-        route_info = route_poi_map[route_folder]
-        pois = route_info["pois"]
+    pairs = pd.DataFrame(
+        {
+            "en_trail_name": pois["en_trail_name"],
+            "part_number": grouped.cumcount(),
+            "poi_previous_id": grouped["poi_id"].shift(1),
+            "poi_current_id": pois["poi_id"],
+        }
+    )
+    pairs = pairs[pairs["part_number"] >= 1]
+    pairs.insert(1, "trail_id", pairs["en_trail_name"].map(trail_ids))
 
-        # 檢查part_number是否在有效範圍內
-        if 1 <= part_number <= len(pois) - 1:
-            # part_number對應POI序列中的索引
-            prev_poi = pois[part_number - 1]["poi_id"]
-            curr_poi = pois[part_number]["poi_id"]
+    id_columns = ["trail_id", "poi_previous_id", "poi_current_id"]
+    pairs[id_columns] = pairs[id_columns].convert_dtypes()
+    return pairs.reset_index(drop=True)
 
-            feature_df.loc[index, "trail_id"] = route_info["trail_id"]
-            feature_df.loc[index, "poi_previous_id"] = prev_poi
-            feature_df.loc[index, "poi_current_id"] = curr_poi
-            updated_count += 1
 
-print(f"更新了 {updated_count} 筆記錄")
+def attach_poi_ids(feature_df: pd.DataFrame, poi_df: pd.DataFrame):
+    """
+    以 (route_folder, part_number) 對 (en_trail_name, part_number) 合併，
+    為每個切分段加上 trail_id、poi_previous_id、poi_current_id。
 
-# 重新排列欄位
-cols = [
-    "route_folder",
-    "part_number",
-    "filename",
-    "trail_id",
-    "poi_previous_id",
-    "poi_current_id",
-] + [
-    col
-    for col in feature_df.columns
-    if col
-    not in [
-        "route_folder",
-        "part_number",
-        "filename",
-        "trail_id",
-        "poi_previous_id",
-        "poi_current_id",
+    回傳 (合併後的 DataFrame, 未對應到 POI 的列)。
+    """
+    pairs = build_poi_pairs(poi_df)
+
+    base = feature_df.drop(
+        columns=["trail_id", "poi_previous_id", "poi_current_id"], errors="ignore"
+    )
+    base = base.assign(part_number=base["part_number"].astype(int))
+
+    merged = base.merge(
+        pairs,
+        how="left",
+        left_on=["route_folder", "part_number"],
+        right_on=["en_trail_name", "part_number"],
+        indicator=True,
+    )
+    matched = merged["_merge"] == "both"
+    merged = merged.drop(columns=["en_trail_name", "_merge"])
+
+    # 重新排列欄位
+    cols = LEADING_COLUMNS + [
+        col for col in merged.columns if col not in LEADING_COLUMNS
     ]
-]
-feature_df = feature_df[cols]
-
-# 儲存
-output_file = "feature_report_final.csv"
-feature_df.to_csv(output_file, index=False, encoding="utf-8-sig")
-print(f"結果已儲存至 {output_file}")
-
-# 顯示每個路線的統計
-print("\n各路線更新統計:")
-updated_routes = feature_df[feature_df["trail_id"].notna()]
-for route in updated_routes["route_folder"].unique():
-    route_data = updated_routes[updated_routes["route_folder"] == route]
-    trail_id = int(route_data["trail_id"].iloc[0])
-    count = len(route_data)
-    print(f"{route}: {count} 筆 (trail_id={trail_id})")
+    merged = merged[cols]
+
+    unmatched = merged.loc[~matched, ["route_folder", "part_number", "filename"]]
+    return merged, unmatched
+
+
+def main():
+    # 讀取資料
+    print("讀取檔案...")
+    poi_df = pd.read_csv("FINAL_POI.csv", encoding="utf-8-sig")
+    feature_df = pd.read_csv("feature_report.csv", encoding="utf-8-sig")
+
+    print(f"POI資料: {len(poi_df)} 筆")
+    print(f"Feature資料: {len(feature_df)} 筆")
+
+    feature_df, unmatched = attach_poi_ids(feature_df, poi_df)
+
+    print(f"更新了 {len(feature_df) - len(unmatched)} 筆記錄")
+    if not unmatched.empty:
+        print(f"有 {len(unmatched)} 筆記錄找不到對應的 POI:")
+        for route, count in unmatched["route_folder"].value_counts().items():
+            print(f"  {route}: {count} 筆")
+
+    # 儲存
+    output_file = "feature_report_final.csv"
+    feature_df.to_csv(output_file, index=False, encoding="utf-8-sig")
+    print(f"結果已儲存至 {output_file}")
+
+    # 顯示每個路線的統計
+    print("\n各路線更新統計:")
+    updated_routes = feature_df[feature_df["trail_id"].notna()]
+    for route, route_data in updated_routes.groupby("route_folder", sort=False):
+        trail_id = int(route_data["trail_id"].iloc[0])
+        print(f"{route}: {len(route_data)} 筆 (trail_id={trail_id})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""map_match 的迴歸測試：沒有候選位置時應回傳 None 而不是丟出例外"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from map_match import SegmentIndex, match_ordered_points  # noqa: E402
+
+# 約 1 公里長、往北的直線路線
+ROUTE_LATS = np.linspace(23.47, 23.48, 11)
+ROUTE_LONS = np.full(11, 120.95)
+
+
+def test_empty_observations():
+    index = SegmentIndex(ROUTE_LATS, ROUTE_LONS)
+    assert index.candidates(np.empty(0), np.empty(0)) == []
+    assert match_ordered_points(ROUTE_LATS, ROUTE_LONS, np.empty(0), np.empty(0)) == []
+
+
+def test_observation_far_from_route():
+    # 離路線約 100 公里的通訊點
+    lats = np.array([24.37])
+    lons = np.array([120.95])
+    candidates = SegmentIndex(ROUTE_LATS, ROUTE_LONS).candidates(lats, lons)
+    assert len(candidates) == 1 and len(candidates[0]["segment"]) == 0
+    assert match_ordered_points(ROUTE_LATS, ROUTE_LONS, lats, lons) == [None]
+
+
+def test_far_observation_mixed_with_near_ones():
+    lats = np.array([23.471, 24.37, 23.479])
+    lons = np.array([120.95, 120.95, 120.95])
+    matches = match_ordered_points(ROUTE_LATS, ROUTE_LONS, lats, lons)
+    assert matches[1] is None
+    assert matches[0]["chainage"] < matches[2]["chainage"]
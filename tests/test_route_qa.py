@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""route_qa 的迴歸測試：單點時間超前時只標記該點"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from route_qa import repair_plan, scan_track  # noqa: E402
+
+
+def make_track(times):
+    n = len(times)
+    return {
+        "lat": 23.47 + np.arange(n) * 1e-4,
+        "lon": np.full(n, 120.95),
+        "elevation": np.full(n, 3000.0),
+        "time": np.asarray(times, dtype=float),
+    }
+
+
+def test_future_dated_point_is_the_only_reversal():
+    for shift in (3000.0, 25.0):
+        times = np.arange(40) * 10.0
+        times[5] += shift
+        track = make_track(times)
+        issues = scan_track(track)
+        assert issues["time_reversal"][0].tolist() == [5]
+        keep, _ = repair_plan(track, issues, 5)
+        assert np.flatnonzero(~keep).tolist() == [5]
+
+
+def test_real_reversal_still_reported():
+    issues = scan_track(make_track([0, 10, 20, 5, 30]))
+    assert issues["time_reversal"][0].tolist() == [3]